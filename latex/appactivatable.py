@@ -20,6 +20,7 @@ import platform
 
 from gi.repository import GLib, Gedit, GObject
 from resources import Resources
+from job import JobManager
 
 class LaTeXAppActivatable(GObject.Object, Gedit.AppActivatable):
     __gtype_name__ = "GeditLaTeXAppActivatable"
@@ -44,4 +45,11 @@ class LaTeXAppActivatable(GObject.Object, Gedit.AppActivatable):
 
         Resources().set_dirs(userdir, sysdir)
 
+        # fork the worker processes before other threads are started
+        JobManager().start()
+
+    def do_deactivate(self):
+        # stop the worker processes
+        JobManager().dispose()
+
 # ex:ts=4:et
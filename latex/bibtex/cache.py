@@ -22,10 +22,13 @@
 bibtex.cache
 """
 
+import os
 from logging import getLogger
 
 from parser import BibTeXParser
 from ..issues import MockIssueHandler
+from ..preferences import Preferences
+from ..lrucache import LRUCache
 
 
 class BibTeXDocumentCache(object):
@@ -50,9 +53,10 @@ class BibTeXDocumentCache(object):
 
         def __init__(self, file):
             self.__file = file
-            self.__parser = BibTeXParser(quiet=True)
+            self.__parser = BibTeXParser()
             self.__issue_handler = MockIssueHandler()
             self.__mtime = 0
+            self.__size = 0
             self.__document = None
 
             self.synchronize()
@@ -65,6 +69,13 @@ class BibTeXDocumentCache(object):
         def document(self):
             return self.__document
 
+        @property
+        def weight(self):
+            """
+            The size of the file, the model grows with it
+            """
+            return self.__size
+
         def synchronize(self):
             """
             Synchronize document model with file contents.
@@ -73,9 +84,14 @@ class BibTeXDocumentCache(object):
             """
             # update timestamp
             self.__mtime = self.__file.mtime
+            self.__size = os.path.getsize(self.__file.path)
 
-            # parse
-            self.__document = self.__parser.parse(open(self.__file.path, "r").read(), self.__file, self.__issue_handler)
+            # parse, the file is read in chunks
+            f = open(self.__file.path, "r")
+            try:
+                self.__document = self.__parser.parse(f, self.__file, self.__issue_handler)
+            finally:
+                f.close()
 
     def __new__(cls):
         if not '_instance' in cls.__dict__:
@@ -84,7 +100,10 @@ class BibTeXDocumentCache(object):
 
     def __init__(self):
         if not '_ready' in dir(self):
-            self._entries = {}
+            preferences = Preferences()
+            self._entries = LRUCache("BibTeXDocumentCache",
+                                     int(preferences.get("document-cache-entries")),
+                                     int(preferences.get("document-cache-size")) * 1024)
             self._ready = True
 
     def get_document(self, file):
@@ -93,20 +112,27 @@ class BibTeXDocumentCache(object):
 
         @param file: a File object
         """
-        try:
-            # update entry if necessary
-            entry = self._entries[file.uri]
-            if entry.modified:
-                self._log.debug("File '%s' modified, synchronizing..." % file)
-                entry.synchronize()
-        except KeyError:
+        entry = self._entries.get(file.uri)
+        if entry is None:
             self._log.debug("Cache fault for '%s'" % file)
             # create new entry
             entry = self.Entry(file)
-            self._entries[file.uri] = entry
+            self._entries.put(file.uri, entry, entry.weight)
+        elif entry.modified:
+            # update entry if necessary
+            self._log.debug("File '%s' modified, synchronizing..." % file)
+            entry.synchronize()
+            self._entries.put(file.uri, entry, entry.weight)
 
         return entry.document
 
+    @property
+    def statistics(self):
+        """
+        Return the hit, miss and eviction counters and the current size (see LRUCache.statistics)
+        """
+        return self._entries.statistics
+
 
 
 # ex:ts=4:et:
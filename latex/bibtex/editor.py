@@ -27,12 +27,14 @@ BENCHMARK = True
 import logging
 if BENCHMARK: import time
 
-from ..editor import Editor
+from gi.repository import GObject
+
+from ..editor import Editor, EditedRange
 from ..preferences import Preferences
-from ..issues import Issue, IIssueHandler, MockIssueHandler
+from ..issues import Issue, IIssueHandler, CollectingIssueHandler
 from ..util import verbose
 
-from ..job import Job, JobChangeListener
+from ..job import Job, JobChangeListener, JobManager
 
 from parser import BibTeXParser
 from completion import BibTeXCompletionHandler
@@ -41,25 +43,56 @@ from validator import BibTeXValidator
 LOG = logging.getLogger(__name__)
 
 class ParseJob(Job):
+    """
+    Parses and validates a BibTeX document in a worker process
+
+    The argument is a list [file, content], this returns a tuple of the
+    Document, the list of Issues found while parsing and a dict mapping
+    the entries to the Issues found while validating them.
+    """
     def _run(self, arguments):
         file = arguments[0]
         content = arguments[1]
-        self._parser = BibTeXParser()
-        return self._parser.parse(content, file, MockIssueHandler())
+        issue_handler = CollectingIssueHandler()
+
+        if BENCHMARK:
+            t = time.time()
+
+        document = BibTeXParser().parse(content, file, issue_handler)
+
+        if BENCHMARK:
+            LOG.info("BibTeXParser.parse: %f" % (time.time() - t))
+            t = time.time()
+
+        validator = BibTeXValidator()
+        validation_issues = {}
+        for entry in document.entries:
+            entry_issue_handler = CollectingIssueHandler()
+            validator.validate_entry(document, entry, file, entry_issue_handler)
+            if len(entry_issue_handler.issues):
+                validation_issues[entry] = entry_issue_handler.issues
+
+        if BENCHMARK:
+            LOG.info("BibTeXValidator.validate: %f" % (time.time() - t))
+
+        return (document, issue_handler.issues, validation_issues)
 
 
 class BibTeXEditor(Editor, IIssueHandler, JobChangeListener):
 
     extensions = [".bib"]
 
+    _REPARSE_DELAY = 500
+
     @property
     def completion_handlers(self):
         self.__bibtex_completion_handler = BibTeXCompletionHandler()
         return [self.__bibtex_completion_handler]
 
-    def __init__(self, tab_decorator, file):
-        Editor.__init__(self, tab_decorator, file)
-        self._parse_job = None
+    @property
+    def build_inputs(self):
+        # overrides Editor.build_inputs, a .bib file doesn't include others
+        return [self._file]
 
     def init(self, file, context):
         LOG.debug("init(%s)" % file)
@@ -73,9 +106,20 @@ class BibTeXEditor(Editor, IIssueHandler, JobChangeListener):
         self.register_marker_type("bibtex-warning", self._preferences.get("warning-background-color"))
 
         self._issue_view = context.find_view(self, "IssueView")
+        self._outline_view = context.find_view(self, "BibTeXOutlineView")
+
         self._parser = BibTeXParser()
         self._validator = BibTeXValidator()
-        self._outline_view = context.find_view(self, "BibTeXOutlineView")
+
+        # the model and the issues found while parsing and validating it,
+        # the validation issues are stored by Entry
+        self._document = None
+        self._parse_issues = []
+        self._validation_issues = {}
+
+        # the text range edited since the content has been parsed
+        self._edited_range = EditedRange()
+        self._reparse_source_id = None
 
         self._parse_job = ParseJob()
         self._parse_job.set_change_listener(self)
@@ -89,91 +133,134 @@ class BibTeXEditor(Editor, IIssueHandler, JobChangeListener):
 
         Update models
         """
-        self.__parse()
+        if self._reparse_source_id is not None:
+            GObject.source_remove(self._reparse_source_id)
+        self.__parse_incremental()
 
-#    def _on_state_changed(self, state):
-#        #
-#        # job.JobChangeListener._on_state_changed
-#        #
-#        if (state == JobManager.STATE_COMPLETED):
-#            self._log.debug("Parser finished")
-#
-#            self._document = self._parse_job.get_returned()
-#
-#            #self._log.debug(str(self._document))
-#
-#            for entry in self._document.entries:
-#                print entry.key
-#
-#            # FIXME: gedit crashes here with:
-#            # gedit: Fatal IO error 11 (Resource temporarily unavailable) on X server :0.0.
-#
-#            self._log.debug("Validating...")
-#            self._validator.validate(self._document, self._file, self)
-#            self._log.debug("Validating finished")
-#
-#            self._outline_view.set_outline(self._document)
-#
-#
-#    def __parse_async(self):
-#
-#        # reset highlight
-#        self.remove_markers("bibtex-error")
-#        self.remove_markers("bibtex-warning")
-#
-#        # reset issues
-#        self._issue_view.clear()
-#
-#        self._log.debug("Starting parser job")
-#
-#        self._parse_job.set_argument([self._file, self.content])
-#        self._parse_job.schedule()
+    def on_text_edited(self, start, old_end, new_end):
+        # see Editor.on_text_edited
+
+        self._edited_range.add(start, old_end, new_end)
+
+        # update the model when the user pauses typing
+        if self._reparse_source_id is not None:
+            GObject.source_remove(self._reparse_source_id)
+        self._reparse_source_id = GObject.timeout_add(self._REPARSE_DELAY, self.__parse_incremental)
+
+    def _on_state_changed(self, state):
+        #
+        # job.JobChangeListener._on_state_changed
+        #
+        if state != JobManager.STATE_COMPLETED:
+            return
+
+        if self._parse_job.get_exception() is not None:
+            # parse everything again on the next occasion
+            self._document = None
+            return
+
+        if BENCHMARK:
+            LOG.info("ParseJob: %f" % (time.time() - self._parse_start))
+
+        self._document, self._parse_issues, self._validation_issues = self._parse_job.get_returned()
+
+        self._outline_view.set_outline(self._document)
+
+        if self._edited_range.empty:
+            self.__show_issues()
+        else:
+            # apply the edits made during parsing
+            self.__parse_incremental()
 
     @verbose
     def __parse(self):
         """
+        Parse and validate the content in a worker process, a parse still
+        running is cancelled
         """
         LOG.debug("__parse")
 
         content = self.content
 
-        # reset highlight
-        self.remove_markers("bibtex-error")
-        self.remove_markers("bibtex-warning")
+        if BENCHMARK:
+            self._parse_start = time.time()
 
-        # reset issues
-        self._issue_view.clear()
+        # the result covers all edits made until now
+        self._edited_range.clear()
 
-#        self.parse(self._file)
+        self._parse_job.set_argument([self._file, content])
+        self._parse_job.schedule()
 
-        if BENCHMARK:
-            t = time.clock()
+    def __parse_incremental(self):
+        """
+        Update the document model from the entries around the edited range only
+        """
+        self._reparse_source_id = None
 
-        # parse document
-        self._document = self._parser.parse(content, self._file, self)
+        if self._parse_job.running:
+            # the edits are applied when the running parse has finished
+            return False
 
-        if BENCHMARK:
-            LOG.info("BibTeXParser.parse: %f" % (time.clock() - t))
+        if self._document is None:
+            self.__parse()
+            return False
 
-        LOG.debug("Parsed %s bytes of content" % len(content))
+        if self._edited_range.empty:
+            return False
 
-        # validate
-        if BENCHMARK:
-            t = time.clock()
+        edited = self._edited_range
 
-        self._validator.validate(self._document, self._file, self)
+        LOG.debug("Reparsing %s..." % edited)
 
-        # 0.11
         if BENCHMARK:
-            LOG.info("BibTeXValidator.validate: %f" % (time.clock() - t))
+            t = time.time()
+
+        first, removed, added = self._parser.reparse(self.content, self._document, self._file, self._parse_issues,
+                                                     edited.start, edited.old_end, edited.new_end)
+        edited.clear()
+
+        # validate the new entries and the ones sharing a key with the changed
+        # entries, as their duplicate key errors may have changed
+        for entry in removed:
+            self._validation_issues.pop(entry, None)
+
+        for key in set([entry.key for entry in removed + added]):
+            for entry in self._document.find_entries_by_key(key):
+                issue_handler = CollectingIssueHandler()
+                self._validator.validate_entry(self._document, entry, self._file, issue_handler)
+                if len(issue_handler.issues):
+                    self._validation_issues[entry] = issue_handler.issues
+                else:
+                    self._validation_issues.pop(entry, None)
 
-        self._outline_view.set_outline(self._document)
+        if BENCHMARK:
+            LOG.info("BibTeXParser.reparse: %f (%d entries replaced by %d)" % (time.time() - t, len(removed), len(added)))
+
+        self._outline_view.update_entries(first, removed, added)
+
+        self.__show_issues()
 
-#    def _on_parser_finished(self, model):
-#        """
-#        """
-#        self._document = model
-#        self._outline_view.set_outline(self._document)
+        return False
+
+    def __show_issues(self):
+        """
+        Pass all known issues to the issue view and the markers
+        """
+        # reset highlight
+        self.remove_markers("bibtex-error")
+        self.remove_markers("bibtex-warning")
+
+        # reset issues
+        self._issue_view.clear()
+
+        for issue in self._parse_issues:
+            self.issue(issue)
+
+        for entry in sorted(self._validation_issues.iterkeys(), key=lambda e: e.start):
+            for issue in self._validation_issues[entry]:
+                # a validation issue spans its entry, which may have moved
+                issue.start, issue.end = entry.start, entry.end
+                self.issue(issue)
 
     def issue(self, issue):
         # overriding IIssueHandler.issue
@@ -197,9 +284,14 @@ class BibTeXEditor(Editor, IIssueHandler, JobChangeListener):
         # unreference the window context
         del self._context
 
-        # remove parse listener
+        # stop parsing
+        if self._reparse_source_id is not None:
+            GObject.source_remove(self._reparse_source_id)
+            self._reparse_source_id = None
+
         if self._parse_job != None:
             self._parse_job.set_change_listener(None)
+            self._parse_job.abort()
 
         Editor.destroy(self)
 
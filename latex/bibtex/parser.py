@@ -56,9 +56,9 @@ BibTeX parser and object model
 #    #
 
 from xml.sax.saxutils import escape
+import re
 
-from ..issues import Issue
-from ..preferences import Preferences
+from ..issues import Issue, CollectingIssueHandler
 
 class Token(object):
     """
@@ -67,6 +67,8 @@ class Token(object):
 
     AT, TEXT, COMMA, EQUALS, QUOTE, HASH, CURLY_OPEN, CURLY_CLOSE, ROUND_OPEN, ROUND_CLOSE = range(10)
 
+    __slots__ = ("type", "offset", "value")
+
     def __init__(self, type, offset, value):
         self.type = type
         self.offset = offset
@@ -76,60 +78,84 @@ class Token(object):
         return "<Token type='%s' value='%s' @%s>" % (self.type, self.value, self.offset)
 
 
-from ..util import StringReader
-from ..util import open_info
-
-
 class BibTeXLexer(object):
     """
     BibTeX lexer. We only separate text from special tokens here and
     apply escaping.
+
+    The source is read in chunks, so a large file doesn't have to be read at
+    once. A text token reaching the end of a chunk is held back until the next
+    chunk has been read, as it may continue there.
     """
 
     _TERMINALS_TOKENS = {"@" : Token.AT, "," : Token.COMMA, "=" : Token.EQUALS,
                          "{" : Token.CURLY_OPEN, "}" : Token.CURLY_CLOSE, "\"" : Token.QUOTE,
                          "#" : Token.HASH, "(" : Token.ROUND_OPEN, ")" : Token.ROUND_CLOSE}
 
-    _TERMINALS = set(_TERMINALS_TOKENS.keys())
-
-    def __init__(self, string):
-        self._reader = StringReader(string)
+    # a terminal or a run of text, where a backslash escapes the following
+    # character (including another backslash, which escapes the next one)
+    #
+    # The tokens follow each other without gaps, so their offsets are summed
+    # up instead of asking the match objects.
+    _TOKEN_PATTERN = re.compile(r'[@,=#"{}()]|[^@,=#"{}()\\]+(?:\\+[\s\S]?[^@,=#"{}()\\]*)*|(?:\\+[\s\S]?[^@,=#"{}()\\]*)+')
 
-    def __iter__(self):
-        return self
+    CHUNK_SIZE = 65536
 
-    def next(self):
+    def __init__(self, source, offset=0):
         """
-        Return the next token
+        @param source: a string, an mmap or a file object
+        @param offset: the offset in the source to start at
         """
+        self._source = source
+        self._offset = offset
+
+    def _chunks(self):
+        if hasattr(self._source, "read"):
+            if self._offset:
+                self._source.seek(self._offset)
+            chunk = self._source.read(self.CHUNK_SIZE)
+            while len(chunk):
+                yield chunk
+                chunk = self._source.read(self.CHUNK_SIZE)
+        else:
+            for start in xrange(self._offset, len(self._source), self.CHUNK_SIZE):
+                yield self._source[start:start + self.CHUNK_SIZE]
 
-        escaping = False
-        textBuilder = None
-        textStart = None
-
-        while True:
-            c = self._reader.read()
-
-            if not escaping and c in self._TERMINALS:
-                if textBuilder is not None:
-                    self._reader.unread(c)
-                    text = "".join(textBuilder)
-                    textBuilder = None
-                    return Token(Token.TEXT, textStart, text)
-
-                return Token(self._TERMINALS_TOKENS[c], self._reader.offset - 1, c)
+    def __iter__(self):
+        """
+        Yield the tokens
+        """
+        terminals = self._TERMINALS_TOKENS
+        findall = self._TOKEN_PATTERN.findall
+        text = Token.TEXT
+
+        chunks = self._chunks()
+        buffer = ""
+        offset = self._offset        # the offset of the buffer in the source
+        final = False
+
+        while not final:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+            else:
+                buffer += chunk
 
+            values = findall(buffer)
+            if not final and len(values) and not values[-1] in terminals:
+                # the last text may continue in the next chunk
+                last = values.pop()
             else:
-                if textBuilder is None:
-                    textStart = self._reader.offset
-                    textBuilder = [c]
-                else:
-                    textBuilder.append(c)
+                last = ""
 
-                if c == "\\":
-                    escaping = True
+            for value in values:
+                if value in terminals:
+                    yield Token(terminals[value], offset, value)
                 else:
-                    escaping = False
+                    yield Token(text, offset, value)
+                offset += len(value)
+
+            buffer = last
 
 
 class BibTeXParser(object):
@@ -143,10 +169,7 @@ class BibTeXParser(object):
             _STRING_VALUE, _QUOTED_STRING_VALUE, _FIELD_NAME, _AFTER_FIELD_NAME, _FIELD_VALUE, _EMBRACED_FIELD_VALUE, \
             _QUOTED_FIELD_VALUE = range(15)
 
-    def __init__(self, quiet=False):
-        self._quiet = quiet
-        self._max_size_info_shown = False
-
+    def __init__(self):
         self._state = None
         self._type = None
         self._constant = None
@@ -172,13 +195,14 @@ class BibTeXParser(object):
 
             if self._type.lower() == "string" :
                 self._constant = Constant()
+                self._constant.start = token.offset - 1
                 self._state = self._AFTER_STRING_TYPE
             elif self._type.lower() in ["preamble", "comment"]:        # simply skip PREAMBLE and COMMENT entries
                 self._state = self._OUTSIDE
             else:
                 self._entry = Entry()
                 self._entry.type = self._type
-                self._entry.start = token.offset - 2
+                self._entry.start = token.offset - 1
                 self._state = self._AFTER_TYPE
         else:
             issue_handler.issue(Issue("Unexpected token <b>%s</b> in entry type" % escape(token.value),
@@ -237,7 +261,7 @@ class BibTeXParser(object):
             self._state = self._FIELD_NAME
         elif token.type == self._closingDelimiter:
             self._entry.end = token.offset + 1
-            self._document.entries.append(self._entry)
+            self._document.add_entry(self._entry)
             self._state = self._OUTSIDE
         else:
             issue_handler.issue(Issue("Unexpected token <b>%s</b> after entry key" % escape(token.value),
@@ -275,7 +299,7 @@ class BibTeXParser(object):
             self._state = self._AFTER_FIELD_NAME
         elif token.type == self._closingDelimiter:
             self._entry.end = token.offset + 1
-            self._document.entries.append(self._entry)
+            self._document.add_entry(self._entry)
             self._state = self._OUTSIDE
         else:
             issue_handler.issue(Issue("Unexpected token <b>%s</b> in field name" % escape(token.value),
@@ -313,12 +337,12 @@ class BibTeXParser(object):
             #stack = [Token.QUOTE]
             self._state = self._QUOTED_FIELD_VALUE
         elif token.type == Token.COMMA:
-            self._entry.fields.append(self._field)
+            self._entry.add_field(self._field)
             self._state = self._FIELD_NAME
         elif token.type == self._closingDelimiter:
-            self._entry.fields.append(self._field)
+            self._entry.add_field(self._field)
             self._entry.end = token.offset + 1
-            self._document.entries.append(self._entry)
+            self._document.add_entry(self._entry)
             self._state = self._OUTSIDE
         elif token.type == Token.HASH:
             pass
@@ -359,32 +383,152 @@ class BibTeXParser(object):
         else:
             self._value += token.value
 
-    def parse(self, string, file, issue_handler):
+    def parse(self, source, file, issue_handler):
         """
         Parse a BibTeX content
-        @param string: the content to be parsed
+        @param source: the content to be parsed, a string, an mmap or a file object
+        @param file: the File object containing the BibTeX
+        @param issue_handler: an object implementing IIssueHandler
+        @return: a Document
+        """
+        for entry in self.iter_entries(source, file, issue_handler):
+            pass
+        return self._document
+
+    def iter_entries(self, source, file, issue_handler):
+        """
+        Parse a BibTeX content and yield each Entry as soon as it is complete
+
+        The entries and constants are collected in the Document returned by
+        the document property, too.
+
+        @param source: the content to be parsed, a string, an mmap or a file object
         @param file: the File object containing the BibTeX
         @param issue_handler: an object implementing IIssueHandler
         """
         self._document = Document()
+        self._state = self._OUTSIDE
 
-        # respect maximum BibTeX file size
-        max_size_kb = int(Preferences().get("maximum-bibtex-size"))
-        length = len(string)
+        callables = self._callables()
 
-        if length > max_size_kb * 1024:
-            if not self._quiet and not self._max_size_info_shown:
-                open_info("BibTeX file will not be parsed", "The maximum size of BibTeX files to parse is set to %s KB." % max_size_kb)
-                self._max_size_info_shown = True
-            return self._document
+        entries = self._document.entries
+        count = 0
 
-        # parse
+        for token in BibTeXLexer(source):
+            callables[self._state](token, file, issue_handler)
+
+            # a token completes at most one entry
+            if len(entries) > count:
+                count += 1
+                yield entries[-1]
+
+    @property
+    def document(self):
+        """
+        The Document of the last parse
+        """
+        return self._document
+
+    def reparse(self, string, document, file, issues, start, old_end, new_end):
+        """
+        Update a Document after a range of its source has been edited
+
+        Parsing restarts at the end of the last entry before the edited range,
+        where the parser is outside of any entry, and stops as soon as the start
+        of an entry of the old Document is met again behind the range. Only the
+        entries in between are replaced, the following ones are shifted.
+
+        @param string: the edited BibTeX source
+        @param document: the Document parsed from the source before the edit
+        @param file: the File object of the source
+        @param issues: the list of Issues found while parsing the Document, this is
+                updated, too
+        @param start: the offset where the edited range starts
+        @param old_end: the end offset of the edited range before the edit
+        @param new_end: the end offset of the edited range after the edit
+
+        @return: a tuple (index of the first replaced entry, list of the replaced
+                entries, list of the new entries)
+        """
+        delta = new_end - old_end
+        entries = document.entries
+
+        # find the first entry not ending before the edited range
+        lo, hi = 0, len(entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if entries[mid].end <= start:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        first = lo
+        if first > 0:
+            restart = entries[first - 1].end
+        else:
+            restart = 0
+
+        self._document = Document()
         self._state = self._OUTSIDE
 
+        callables = self._callables()
+        issue_handler = CollectingIssueHandler()
+
+        # the entries behind the edited range are the points where the new
+        # token stream may meet the old model again
+        length = len(entries)
+        candidate = first
+        last = length
+        resync = None
+
+        for token in BibTeXLexer(string, restart):
+            if token.type == Token.AT and token.offset >= new_end and self._state == self._OUTSIDE:
+                while candidate < length and entries[candidate].start + delta < token.offset:
+                    candidate += 1
+
+                if candidate < length and entries[candidate].start + delta == token.offset:
+                    # we're back in sync with the old model
+                    last = candidate
+                    resync = entries[candidate].start
+                    break
+
+            callables[self._state](token, file, issue_handler)
+
+        removed = entries[first:last]
+        added = self._document.entries
+        document.replace_entries(first, last, added, delta)
+
+        # update the constants and issues in the same way
+        kept_constants = [c for c in document.constants if c.start < restart]
+        moved_constants = []
+        if resync is not None:
+            moved_constants = [c for c in document.constants if c.start >= resync]
+            for constant in moved_constants:
+                constant.start += delta
+        document.constants[:] = kept_constants + self._document.constants + moved_constants
+
+        kept_issues = [issue for issue in issues if issue.start < restart]
+        moved_issues = []
+        if resync is not None:
+            moved_issues = [issue for issue in issues if issue.start >= resync]
+            if delta:
+                for issue in moved_issues:
+                    issue.start += delta
+                    issue.end += delta
+        issues[:] = kept_issues + issue_handler.issues + moved_issues
+
+        self._document = document
+
+        return (first, removed, added)
+
+    def _callables(self):
+        """
+        Return the callables for each state of the parser
+        """
         #
         # use this hash table instead of endless if...elif statements
         #
-        callables = {
+        return {
                 self._OUTSIDE : self._on_outside,
                 self._TYPE : self._on_type,
                 self._AFTER_TYPE : self._on_after_type,
@@ -402,11 +546,6 @@ class BibTeXParser(object):
                 self._QUOTED_FIELD_VALUE : self._on_quoted_field_value
         }
 
-        for token in BibTeXLexer(string):
-            callables[self._state].__call__(token, file, issue_handler)
-
-        return self._document
-
 #
 # BibTeX object model
 #
@@ -488,12 +627,39 @@ class Entry(object):
         self.start = None
         self.end = None
         self.fields = []
+        self._field_index = {}     # { name -> first Field with that name }
+
+    def add_field(self, field):
+        self.fields.append(field)
+        self._field_index.setdefault(field.name, field)
 
     def findField(self, name):
-        for field in self.fields:
-            if field.name == name:
-                return field
-        raise KeyError
+        """
+        Return the first Field with a name
+
+        @raise KeyError: if there is none
+        """
+        return self._field_index[name]
+
+    @property
+    def authors(self):
+        """
+        Return the names listed in the author field or an empty list
+        """
+        try:
+            return [a.strip() for a in self._field_index["author"].valueString.split(" and ")]
+        except KeyError:
+            return []
+
+    @property
+    def year(self):
+        """
+        Return the value of the year field or None
+        """
+        try:
+            return self._field_index["year"].valueString
+        except KeyError:
+            return None
 
     def __str__(self):
         s = "<Entry type='%s' key='%s'>\n" % (self.type, self.key)
@@ -510,12 +676,153 @@ class Constant(object):
     def __init__(self):
         self.name = None
         self.value = None
+        self.start = None
 
 
 class Document(object):
+    """
+    The entries and constants of a BibTeX file
+
+    The entries are indexed by key, type, author and year as they are added,
+    so the query methods don't have to scan the list of entries. Each index
+    lists the entries in the order of the file.
+    """
     def __init__(self):
         self.entries = []
         self.constants = []
+        self._keys = {}         # { key -> list of Entries }
+        self._types = {}        # { lower case type -> list of Entries }
+        self._authors = {}      # { author or None -> list of Entries }
+        self._years = {}        # { year or None -> list of Entries }
+
+    def add_entry(self, entry):
+        """
+        Add a complete Entry, its fields must have been added before
+        """
+        self.entries.append(entry)
+        self._index(entry)
+
+    def replace_entries(self, first, last, entries, delta):
+        """
+        Replace a slice of the entries, e.g. after the source has been edited
+
+        @param first: the index of the first entry to replace
+        @param last: the index behind the last entry to replace
+        @param entries: the new entries
+        @param delta: the amount the offsets of the entries behind have moved
+        """
+        changed = []
+        for entry in self.entries[first:last]:
+            changed += self._unindex(entry)
+
+        self.entries[first:last] = entries
+
+        if delta:
+            for entry in self.entries[first + len(entries):]:
+                entry.start += delta
+                entry.end += delta
+
+        for entry in entries:
+            changed += self._index(entry)
+
+        # keep the touched lists in the order of the file
+        for index_list in dict([(id(l), l) for l in changed]).itervalues():
+            index_list.sort(key=lambda e: e.start)
+
+    def _index_lists(self, entry):
+        """
+        Return the indexes and their keys an Entry is listed under
+        """
+        yield self._keys, entry.key
+        yield self._types, entry.type.lower()
+        for author in entry.authors or [None]:
+            yield self._authors, author
+        yield self._years, entry.year
+
+    def _index(self, entry):
+        """
+        @return: the index lists the Entry has been added to
+        """
+        lists = []
+        for index, key in self._index_lists(entry):
+            l = index.setdefault(key, [])
+            l.append(entry)
+            lists.append(l)
+        return lists
+
+    def _unindex(self, entry):
+        """
+        @return: the index lists the Entry has been removed from
+        """
+        lists = []
+        for index, key in self._index_lists(entry):
+            l = index[key]
+            l.remove(entry)
+            if len(l):
+                lists.append(l)
+            else:
+                del index[key]
+        return lists
+
+    def find_entry(self, key):
+        """
+        Return the first Entry with a key or None
+        """
+        try:
+            return self._keys[key][0]
+        except KeyError:
+            return None
+
+    def find_entries_by_key(self, key):
+        """
+        Return all entries with a key, more than one is an error
+        """
+        return self._keys.get(key, [])
+
+    def find_entries_by_type(self, type):
+        """
+        @param type: an entry type like 'article', case is ignored
+        """
+        return self._types.get(type.lower(), [])
+
+    def find_entries_by_author(self, author):
+        """
+        @param author: an author as listed in the author fields or None for
+                the entries without an author field
+        """
+        return self._authors.get(author, [])
+
+    def find_entries_by_year(self, year):
+        """
+        @param year: the value of the year fields or None for the entries
+                without a year field
+        """
+        return self._years.get(year, [])
+
+    @property
+    def keys(self):
+        return self._keys.keys()
+
+    @property
+    def types(self):
+        """
+        The lower case names of the entry types occuring
+        """
+        return self._types.keys()
+
+    @property
+    def authors(self):
+        """
+        The authors occuring, None stands for a missing author field
+        """
+        return self._authors.keys()
+
+    @property
+    def years(self):
+        """
+        The years occuring, None stands for a missing year field
+        """
+        return self._years.keys()
 
     def __str__(self):
         s = "<Document>\n"
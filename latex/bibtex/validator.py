@@ -48,43 +48,50 @@ class BibTeXValidator:
         @param document: a bibtex.parser.Document object
         @param issue_handler: an object implementing IIssueHandler
         """
-        entry_keys = []
         for entry in document.entries:
-            # check for duplicate keys
-            if entry.key in entry_keys:
-                issue_handler.issue(Issue("Duplicate key <b>%s</b>" % entry.key,
-                                          entry.start, entry.end, file,
-                                          Issue.SEVERITY_ERROR))
+            self.validate_entry(document, entry, file, issue_handler)
+
+    def validate_entry(self, document, entry, file, issue_handler):
+        """
+        Validate a single Entry, e.g. after it has been reparsed
+
+        @param document: the bibtex.parser.Document object containing the Entry
+        @param entry: a bibtex.parser.Entry object
+        @param issue_handler: an object implementing IIssueHandler
+        """
+        # check for duplicate keys, the first entry with a key is fine
+        if document.find_entry(entry.key) is not entry:
+            issue_handler.issue(Issue("Duplicate key <b>%s</b>" % entry.key,
+                                      entry.start, entry.end, file,
+                                      Issue.SEVERITY_ERROR))
+
+        field_names = set()
+        for field in entry.fields:
+            # check for duplicate fields
+            if field.name in field_names:
+                issue_handler.issue(Issue("Duplicate field <b>%s</b>" % field.name,
+                                    entry.start, entry.end, file, Issue.SEVERITY_ERROR))
             else:
-                entry_keys.append(entry.key)
-
-            field_names = []
-            for field in entry.fields:
-                # check for duplicate fields
-                if field.name in field_names:
-                    issue_handler.issue(Issue("Duplicate field <b>%s</b>" % field.name,
-                                        entry.start, entry.end, file, Issue.SEVERITY_ERROR))
-                else:
-                    field_names.append(field.name)
-
-            try:
-                # check for missing required fields
-                required_field_names = set(map(lambda f: f.name, self._model.find_type(entry.type).required_fields))
-                missing_field_names = required_field_names.difference(set(field_names))
-
-                if len(missing_field_names) > 0:
-                    issue_handler.issue(Issue("Possibly missing field(s): <b>%s</b>" % ",".join(missing_field_names),
-                                              entry.start, entry.end, file, Issue.SEVERITY_WARNING))
-
-                # check for unused fields
-                optional_field_names = set(map(lambda f: f.name, self._model.find_type(entry.type).optional_fields))
-                unused_field_names = set(field_names).difference(optional_field_names.union(required_field_names))
-
-                if len(unused_field_names) > 0:
-                    issue_handler.issue(Issue("Possibly unused field(s): <b>%s</b>" % ",".join(unused_field_names),
-                                              entry.start, entry.end, file, Issue.SEVERITY_WARNING))
-            except KeyError:
-                #self._log.debug("Type not found: %s" % entry.type)
-                pass
+                field_names.add(field.name)
+
+        try:
+            # check for missing required fields
+            required_field_names = set(map(lambda f: f.name, self._model.find_type(entry.type).required_fields))
+            missing_field_names = required_field_names.difference(field_names)
+
+            if len(missing_field_names) > 0:
+                issue_handler.issue(Issue("Possibly missing field(s): <b>%s</b>" % ",".join(missing_field_names),
+                                          entry.start, entry.end, file, Issue.SEVERITY_WARNING))
+
+            # check for unused fields
+            optional_field_names = set(map(lambda f: f.name, self._model.find_type(entry.type).optional_fields))
+            unused_field_names = field_names.difference(optional_field_names.union(required_field_names))
+
+            if len(unused_field_names) > 0:
+                issue_handler.issue(Issue("Possibly unused field(s): <b>%s</b>" % ",".join(unused_field_names),
+                                          entry.start, entry.end, file, Issue.SEVERITY_WARNING))
+        except KeyError:
+            #self._log.debug("Type not found: %s" % entry.type)
+            pass
 
 # ex:ts=4:et:
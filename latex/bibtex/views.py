@@ -26,6 +26,7 @@ The BibTeX outline view
 
 from gi.repository import Gtk, GdkPixbuf
 from xml.sax.saxutils import escape
+from bisect import bisect
 from logging import getLogger
 
 from ..outline import OutlineOffsetMap, BaseOutlineView
@@ -50,6 +51,7 @@ class BibTeXOutlineView(BaseOutlineView):
         self._handlers = {}
 
         self._grouping = GROUP_NONE
+        self._groups = {}    # { group label -> Gtk.TreeIter of its row }
 
         # add grouping controls to toolbar
 
@@ -106,8 +108,9 @@ class BibTeXOutlineView(BaseOutlineView):
     def _update(self):
         #t = time.clock()
         self._offset_map = OutlineOffsetMap()
+        self._groups = {}
         OutlineConverter().convert(self._store, self._outline,
-                                   self._offset_map, self._grouping)
+                                   self._offset_map, self._grouping, self._groups)
         #dt = time.clock() - t
         #self._log.debug("OutlineConverter.convert: %fs" % dt)
 
@@ -121,6 +124,45 @@ class BibTeXOutlineView(BaseOutlineView):
         self._update()
         self._restore_state()
 
+    def update_entries(self, first, removed, added):
+        """
+        Display the changes of the model after some of its entries have been
+        replaced, e.g. by BibTeXParser.reparse
+
+        Only the rows of these entries and the labels of their groups are
+        changed.
+
+        @param first: the index of the first replaced entry
+        @param removed: the replaced entries
+        @param added: the new entries
+        """
+        converter = OutlineConverter()
+
+        if self._grouping == GROUP_NONE:
+            for i in range(len(removed)):
+                self._store.remove(self._store.iter_nth_child(None, first))
+
+            converter.insert_entries(self._store, first, added)
+
+            # the rows and the offsets of the following entries have moved
+            self._offset_map.truncate(first)
+            for i, entry in enumerate(self._outline.entries[first:], first):
+                self._offset_map.put(entry.start, Gtk.TreePath.new_from_indices([i]), entry.end)
+        else:
+            converter.update_groups(self._store, self._outline, self._groups,
+                                    removed, added, self._grouping)
+
+            # the offsets of all following entries have moved, whatever their group
+            self._offset_map.clear()
+            group = self._store.get_iter_first()
+            while group is not None:
+                child = self._store.iter_children(group)
+                while child is not None:
+                    entry = self._store.get_value(child, 2)
+                    self._offset_map.put(entry.start, self._store.get_path(child), entry.end)
+                    child = self._store.iter_next(child)
+                group = self._store.iter_next(group)
+
     def _on_node_selected(self, node):
         """
         An outline node has been selected
@@ -142,7 +184,10 @@ class OutlineConverter(object):
         self._ICON_YEAR = GdkPixbuf.Pixbuf.new_from_file(Resources().get_icon("calendar.png"))
         self._ICON_TYPE = GdkPixbuf.Pixbuf.new_from_file(Resources().get_icon("documents.png"))
 
-    def convert(self, tree_store, document, offset_map, grouping=GROUP_NONE):
+        self._NO_YEAR = _("<i>n/a</i>")
+        self._NO_AUTHOR = _("Unknown Author")
+
+    def convert(self, tree_store, document, offset_map, grouping=GROUP_NONE, groups=None):
         """
         Convert a BibTeX document model into a Gtk.TreeStore
 
@@ -150,151 +195,164 @@ class OutlineConverter(object):
         @param document: the BibTeX document model (bibtex.parser.Document object)
         @param offset_map: the OutlineOffsetMap object to be filled
         @param grouping: the grouping to use: GROUP_NONE|GROUP_TYPE|GROUP_AUTHOR|GROUP_YEAR
+        @param groups: a dict to be filled with { group label -> Gtk.TreeIter of its row }
         """
 
         color = Preferences().get("light-foreground-color")
 
         tree_store.clear()
 
-        if grouping == GROUP_TYPE:
-            # group by entry type
-
-            groups = {}        # maps lower case entry type names to lists of entries
+        if grouping == GROUP_NONE:
+            # no grouping, display entries and fields in a tree
 
-            # collect
             for entry in document.entries:
-                try:
-                    entryList = groups[entry.type]
-                    entryList.append(entry)
-                except KeyError:
-                    groups[entry.type] = [entry]
-
-            # sort by type
-            entryTypes = groups.keys()
-            entryTypes.sort()
-
-            # build tree
-            for entryType in entryTypes:
-                entries = groups[entryType]
-
-                parentType = tree_store.append(None, ["%s <span color='%s'>%s</span>" % (escape(entryType),
-                                                                                         color, len(entries)),
-                                                      self._ICON_TYPE, None])
+                parent = self._insert_entry(tree_store, None, -1, entry, color, True)
 
-                for entry in entries:
-                    parentEntry = tree_store.append(parentType, [escape(entry.key), self._ICON_ENTRY, entry])
+                offset_map.put(entry.start, tree_store.get_path(parent), entry.end)
+            return
 
-                    offset_map.put(entry.start, tree_store.get_path(parentEntry))
-
-                    for field in entry.fields:
-                        tree_store.append(parentEntry, ["<span color='%s'>%s</span> %s" % (color, escape(field.name),
-                                                                                           field.valueMarkup),
-                                                        self._ICON_FIELD, field])
+        if groups is None:
+            groups = {}
 
+        # the entries by group label, the entries without an author or year
+        # are listed under None, put them in an extra group
+        lists = {}
+        if grouping == GROUP_TYPE:
+            # the document maps lower case entry type names to lists of entries
+            for entryType in document.types:
+                lists[entryType] = document.find_entries_by_type(entryType)
         elif grouping == GROUP_YEAR:
-            # group by year
+            for year in document.years:
+                lists[self._NO_YEAR if year is None else year] = document.find_entries_by_year(year)
+        elif grouping == GROUP_AUTHOR:
+            for author in document.authors:
+                lists[self._NO_AUTHOR if author is None else author] = document.find_entries_by_author(author)
 
-            NO_YEAR_IDENT = _("<i>n/a</i>")
+        # build tree, sorted by label
+        labels = lists.keys()
+        labels.sort()
 
-            groups = {}
+        for label in labels:
+            entries = lists[label]
 
-            # collect
-            for entry in document.entries:
-                try:
-                    year = str(entry.findField("year").valueString)
-                except KeyError:
-                    # no year, so put this in an extra group
-                    year = NO_YEAR_IDENT
+            parent = tree_store.append(None, [self._group_markup(label, len(entries), grouping, color),
+                                              self._group_icon(grouping), None])
+            groups[label] = parent
 
-                try:
-                    entries = groups[year]
-                    entries.append(entry)
-                except KeyError:
-                    groups[year] = [entry]
+            for entry in entries:
+                parentEntry = self._insert_entry(tree_store, parent, -1, entry, color, grouping != GROUP_TYPE)
 
-            # sort by year
-            years = groups.keys()
-            years.sort()
+                offset_map.put(entry.start, tree_store.get_path(parentEntry), entry.end)
 
-            # build tree
-            for year in years:
-                entries = groups[year]
+    def update_groups(self, tree_store, document, groups, removed, added, grouping):
+        """
+        Update a tree converted with grouping after some entries of the
+        document have been replaced
+
+        @param tree_store: the Gtk.TreeStore filled by convert()
+        @param document: the BibTeX document model, the entries have been replaced in it
+        @param groups: the dict filled by convert(), it is updated
+        @param removed: the replaced entries
+        @param added: the new entries
+        @param grouping: the grouping passed to convert()
+        """
+        color = Preferences().get("light-foreground-color")
 
-                parentYear = tree_store.append(None, ["%s <span color='%s'>%s</span>" % (year, color, len(entries)),
-                                                      self._ICON_YEAR, None])
+        changed = set()
+
+        for entry in removed:
+            for label, entries in self._groups_of(document, entry, grouping):
+                child = tree_store.iter_children(groups[label])
+                while tree_store.get_value(child, 2) is not entry:
+                    child = tree_store.iter_next(child)
+                tree_store.remove(child)
+                changed.add(label)
+
+        # the entries are added in the order of the file, so the ones listed
+        # before an entry in its group are in the tree already
+        for entry in added:
+            for label, entries in self._groups_of(document, entry, grouping):
+                if not label in groups:
+                    labels = groups.keys()
+                    labels.sort()
+                    groups[label] = tree_store.insert(None, bisect(labels, label),
+                                                      [None, self._group_icon(grouping), None])
+
+                self._insert_entry(tree_store, groups[label], entries.index(entry), entry, color,
+                                   grouping != GROUP_TYPE)
+                changed.add(label)
+
+        for label in changed:
+            parent = groups[label]
+            count = tree_store.iter_n_children(parent)
+            if count:
+                tree_store.set_value(parent, 0, self._group_markup(label, count, grouping, color))
+            else:
+                tree_store.remove(parent)
+                del groups[label]
+
+    def _groups_of(self, document, entry, grouping):
+        """
+        Return the groups an Entry is listed in
 
-                for entry in entries:
-                    parentEntry = tree_store.append(parentYear, ["%s <span color='%s'>%s</span>" % (escape(entry.key),
-                                                                                                    color, escape(entry.type)),
-                                                                 self._ICON_ENTRY, entry])
+        @return: a list of tuples (group label, list of the entries of the group in the document)
+        """
+        if grouping == GROUP_TYPE:
+            return [(entry.type.lower(), document.find_entries_by_type(entry.type))]
+        elif grouping == GROUP_YEAR:
+            year = entry.year
+            return [(self._NO_YEAR if year is None else year, document.find_entries_by_year(year))]
+        else:
+            return [(self._NO_AUTHOR if author is None else author, document.find_entries_by_author(author))
+                    for author in entry.authors or [None]]
 
-                    offset_map.put(entry.start, tree_store.get_path(parentEntry))
+    def _group_markup(self, label, count, grouping, color):
+        # the label of a missing year is markup already
+        if grouping != GROUP_YEAR:
+            label = escape(label)
+        return "%s <span color='%s'>%s</span>" % (label, color, count)
 
-                    for field in entry.fields:
-                        tree_store.append(parentEntry, ["<span color='%s'>%s</span> %s" % (color, escape(field.name),
-                                                                                           field.valueMarkup),
-                                                        self._ICON_FIELD, field])
+    def _group_icon(self, grouping):
+        if grouping == GROUP_TYPE:
+            return self._ICON_TYPE
+        elif grouping == GROUP_YEAR:
+            return self._ICON_YEAR
+        else:
+            return self._ICON_AUTHOR
 
-        elif grouping == GROUP_AUTHOR:
+    def insert_entries(self, tree_store, position, entries):
+        """
+        Insert entries into a tree converted without grouping
 
-            NA_IDENT = _("Unknown Author")
+        @param tree_store: the Gtk.TreeStore filled by convert()
+        @param position: the index of the first new top-level row
+        @param entries: a list of bibtex.parser.Entry objects
+        """
+        color = Preferences().get("light-foreground-color")
 
-            groups = {}
+        for i, entry in enumerate(entries):
+            self._insert_entry(tree_store, None, position + i, entry, color, True)
 
-            # group
-            for entry in document.entries:
-                # split list of authors
-                try:
-                    authorValue = str(entry.findField("author").valueString)
-                    authors = [a.strip() for a in authorValue.split(" and ")]
-                except KeyError:
-                    # no year, so put this in an extra group
-                    authors = [NA_IDENT]
-
-                # add to group(s)
-                for author in authors:
-                    try:
-                        entries = groups[author]
-                        entries.append(entry)
-                    except KeyError:
-                        groups[author] = [entry]
-
-            # sort
-            authors = groups.keys()
-            authors.sort()
-
-            # build tree
-            for author in authors:
-                entries = groups[author]
-
-                parent = tree_store.append(None, ["%s <span color='%s'>%s</span>" % (escape(author), color, len(entries)),
-                                                  self._ICON_AUTHOR, None])
-
-                for entry in entries:
-                    parentEntry = tree_store.append(parent, ["%s <span color='%s'>%s</span>" % (escape(entry.key),
-                                                                                                color, escape(entry.type)),
-                                                             self._ICON_ENTRY, entry])
-
-                    offset_map.put(entry.start, tree_store.get_path(parentEntry))
-
-                    for field in entry.fields:
-                        tree_store.append(parentEntry, ["<span color='%s'>%s</span> %s" % (color, escape(field.name),
-                                                                                           field.valueMarkup),
-                                                        self._ICON_FIELD, field])
+    def _insert_entry(self, tree_store, group, position, entry, color, show_type):
+        """
+        Insert a row for an Entry and its fields
 
+        @param group: the Gtk.TreeIter of the group row or None for a top-level row
+        @param show_type: if True the type of the Entry is shown after its key
+        @return: the Gtk.TreeIter of the row
+        """
+        if show_type:
+            markup = "%s <span color='%s'>%s</span>" % (escape(entry.key), color, escape(entry.type))
         else:
-            # no grouping, display entries and fields in a tree
+            markup = escape(entry.key)
 
-            for entry in document.entries:
-                parent = tree_store.append(None, ["%s <span color='%s'>%s</span>" % (escape(entry.key),
-                                                                                     color, escape(entry.type)),
-                                                  self._ICON_ENTRY, entry])
+        parent = tree_store.insert(group, position, [markup, self._ICON_ENTRY, entry])
 
-                offset_map.put(entry.start, tree_store.get_path(parent))
+        for field in entry.fields:
+            tree_store.append(parent, ["<span color='%s'>%s</span> %s" % (color, escape(field.name),
+                                                                          field.valueMarkup),
+                                       self._ICON_FIELD, field])
 
-                for field in entry.fields:
-                    tree_store.append(parent, ["<span color='%s'>%s</span> %s" % (color, escape(field.name),
-                                                                                  field.valueMarkup),
-                                               self._ICON_FIELD, field])
+        return parent
 
 # ex:ts=4:et:
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+dircache
+
+Answers the existence checks for referenced files from directory listings
+"""
+
+import os
+import sys
+from logging import getLogger
+from threading import Lock
+
+from singleton import Singleton
+from lrucache import LRUCache
+
+
+class DirectoryListingCache(Singleton):
+    """
+    This keeps the names in recently checked directories. A listing is read
+    again when the modification time of its directory has changed.
+
+    Use an ExistenceCheck for a number of checks that may share the state of
+    the file system, e.g. one validation run.
+    """
+
+    _log = getLogger("DirectoryListingCache")
+
+    MAX_DIRECTORIES = 256
+
+    def __init_once__(self):
+        self._listings = LRUCache("DirectoryListingCache", self.MAX_DIRECTORIES)    # { dirname -> (mtime, frozenset of names) }
+        self._lock = Lock()
+
+    def check(self):
+        """
+        Return a new ExistenceCheck
+        """
+        return ExistenceCheck(self)
+
+    def listing(self, dirname):
+        """
+        Return the names in a directory
+
+        @param dirname: an absolute path as a byte string
+        @return: a tuple (frozenset of names, number of system calls made)
+        """
+        try:
+            mtime = os.stat(dirname).st_mtime
+        except OSError:
+            mtime = None
+        syscalls = 1
+
+        with self._lock:
+            entry = self._listings.get(dirname)
+        if entry is not None and entry[0] == mtime:
+            return entry[1], syscalls
+
+        names = frozenset()
+        if mtime is not None:
+            syscalls += 1
+            try:
+                names = frozenset(os.listdir(dirname))
+            except OSError:
+                pass
+
+        with self._lock:
+            self._listings.put(dirname, (mtime, names))
+
+        return names, syscalls
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+
+
+class ExistenceCheck(object):
+    """
+    A number of file existence checks. Each directory is checked for changes
+    at most once, so later changes to it are not seen.
+
+    The counters may be read at any time: queries is the number of checks, i.e.
+    the number of stat calls needed without the cache, syscalls the number of
+    system calls actually made.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._listings = {}    # { dirname -> frozenset of names }
+        self.queries = 0
+        self.syscalls = 0
+
+    def exists(self, path):
+        """
+        Return True if a file or directory exists
+
+        @param path: an absolute or relative path
+        """
+        return self.find(path, [""]) is not None
+
+    def find(self, path, extensions):
+        """
+        Find the first of a number of extensions a file exists with
+
+        @param path: an absolute or relative path
+        @param extensions: a list of extensions, "" for the path itself
+        @return: the first extension the file exists with or None
+        """
+        if isinstance(path, unicode):
+            path = path.encode(sys.getfilesystemencoding() or "utf-8")
+
+        dirname, name = os.path.split(os.path.abspath(path))
+
+        try:
+            names = self._listings[dirname]
+        except KeyError:
+            names, syscalls = self._cache.listing(dirname)
+            self.syscalls += syscalls
+            self._listings[dirname] = names
+
+        for ext in extensions:
+            self.queries += 1
+            if isinstance(ext, unicode):
+                ext = ext.encode(sys.getfilesystemencoding() or "utf-8")
+            if name + ext in names or not len(name + ext):    # empty for the root directory
+                return ext
+        return None
+
+    @property
+    def saved(self):
+        """
+        Return the number of system calls saved
+        """
+        return self.queries - self.syscalls
+
+# ex:ts=4:et:
@@ -31,6 +31,52 @@ from .file import File
 
 LOG = logging.getLogger(__name__)
 
+class EditedRange(object):
+    """
+    Accumulates the text edits that happened since the last parse into a single
+    range, so that only this range has to be parsed again.
+
+    The range spans [start, old_end) in the old text and [start, new_end) in the
+    current text.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.start = None
+        self.old_end = None
+        self.new_end = None
+
+    @property
+    def empty(self):
+        return self.start is None
+
+    def add(self, start, old_end, new_end):
+        """
+        Extend the range by another edit
+
+        @param start: the offset where the edit starts (in the current text)
+        @param old_end: the end offset of the replaced range (in the current text)
+        @param new_end: the end offset of the inserted text
+        """
+        if self.start is None:
+            self.start, self.old_end, self.new_end = start, old_end, new_end
+            return
+
+        delta = new_end - old_end
+
+        # text behind our range maps back to the old text by the accumulated delta
+        if old_end > self.new_end:
+            self.old_end += old_end - self.new_end
+            self.new_end = old_end
+
+        self.start = min(self.start, start)
+        self.new_end += delta
+
+    def __str__(self):
+        return "EditedRange(%s, %s, %s)" % (self.start, self.old_end, self.new_end)
+
+
 class Editor(object):
     """
     The base class for editors. This manages
@@ -114,7 +160,9 @@ class Editor(object):
 
         self.__buffer_change_timestamp = time.time()
         self.__buffer_signal_handlers = [
-                self._text_buffer.connect("changed", self.__on_buffer_changed)]
+                self._text_buffer.connect("changed", self.__on_buffer_changed),
+                self._text_buffer.connect("insert-text", self.__on_insert_text),
+                self._text_buffer.connect("delete-range", self.__on_delete_range)]
 
         # dnd support
         if len(self.dnd_extensions) > 0:
@@ -130,6 +178,20 @@ class Editor(object):
         """
         self.__buffer_change_timestamp = time.time()
 
+    def __on_insert_text(self, text_buffer, location, text, length):
+        """
+        Text is about to be inserted, pass the affected range to the subclass
+        """
+        offset = location.get_offset()
+        self.on_text_edited(offset, offset, offset + len(text.decode("utf-8")))
+
+    def __on_delete_range(self, text_buffer, start, end):
+        """
+        Text is about to be deleted, pass the affected range to the subclass
+        """
+        start_offset, end_offset = sorted((start.get_offset(), end.get_offset()))
+        self.on_text_edited(start_offset, end_offset, start_offset)
+
     def __on_drag_data_received(self, widget, context, x, y, data, info, timestamp):
         """
         The drag destination received the data from the drag operation
@@ -547,6 +609,16 @@ class Editor(object):
         """
         return []
 
+    @property
+    def build_inputs(self):
+        """
+        To be overridden
+
+        @return: a list of the File objects a Tool run on the file depends on,
+                or None if they are not known (then no Job is skipped)
+        """
+        return None
+
     def init(self, file, context):
         """
         @param file: File object
@@ -563,6 +635,17 @@ class Editor(object):
         The cursor has moved
         """
 
+    def on_text_edited(self, start, old_end, new_end):
+        """
+        A range of text has been replaced
+
+        To be overridden
+
+        @param start: the offset where the edited range starts
+        @param old_end: the end offset of the range before the edit
+        @param new_end: the end offset of the range after the edit
+        """
+
     def destroy(self):
         """
         The edited file has been closed or saved as another file
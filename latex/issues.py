@@ -56,6 +56,21 @@ class MockIssueHandler(IIssueHandler):
         self.__log.debug(str(issue))
 
 
+class CollectingIssueHandler(IIssueHandler):
+    """
+    This collects the issues in a list, e.g. to catch the issues occuring
+    while parsing a document and pass them on later
+    """
+    def __init__(self):
+        self.issues = []
+
+    def clear(self):
+        self.issues = []
+
+    def issue(self, issue):
+        self.issues.append(issue)
+
+
 class IStructuredIssueHandler(object):
     def clear(self):
         """
@@ -20,20 +20,30 @@
 
 """
 base.job
+
+Runs Jobs in a pool of worker processes
 """
 
-import dbus
-import dbus.service
-import dbus.glib
+import signal
+import threading
 import multiprocessing
 import logging
 
+from gi.repository import GLib
 
-BUS_NAME = 'org.gedit.LaTeXPlugin.JobManager'
-OBJECT_PATH = '/org/gedit/LaTeXPlugin/JobManager'
+from singleton import Singleton
 
 
 class Job(object):
+    """
+    A piece of work done in a worker process, e.g. parsing a large file
+
+    Subclasses implement _run(). It is called in the worker process on an
+    instance created with no arguments, so it may only use its argument. The
+    argument and the returned object are pickled.
+
+    The JobChangeListener is notified in the main loop.
+    """
 
     __log = logging.getLogger("Job")
 
@@ -42,49 +52,58 @@ class Job(object):
 
     def __init__(self, argument=None):
         """
-        @param arguments: a list of objects to be passed to the Job
+        @param argument: an object to be passed to _run
         """
         self.__argument = argument
         self.__returned = self.NoneReturned()
+        self.__exception = None
         self.__change_listener = None
+        self.__task_id = None
+        self.__progress_handler = None
 
     def set_argument(self, argument):
         self.__argument = argument
 
     def schedule(self):
         """
-        Run the Job as a subprocess
+        Run the Job in a worker process, a run scheduled before is cancelled
         """
-        # create queue for communication
-        self.__queue = multiprocessing.Queue()
+        if self.__task_id is not None:
+            JobManager().cancel(self.__task_id)
 
-        # run process
-        self.__process = multiprocessing.Process(target=self.__start, args=(self.__queue,))
-
-        # enqueue argument object
-        self.__queue.put(self.__argument)
-
-        # start process
-        self.__process.start()
+        self.__returned = self.NoneReturned()
+        self.__exception = None
+        self.__task_id = JobManager().submit(self, self.__argument)
 
     def abort(self):
         """
-        Abort the Job process
+        Abort the Job, its listener is not notified anymore
         """
-        self.__process.terminate()
+        if self.__task_id is not None:
+            JobManager().cancel(self.__task_id)
+            self.__task_id = None
 
-        # TODO: cleanup?
+    @property
+    def running(self):
+        """
+        Return True if the Job has been scheduled and has not completed yet
+        """
+        return self.__task_id is not None
 
     def get_returned(self):
         """
-        Get the objects returned by the Job
+        Get the object returned by the Job
+
+        @return: the returned object or None if the Job has not completed
         """
         if type(self.__returned) is self.NoneReturned:
-            # dequeue returned object
-            self.__returned = self.__queue.get()
+            return None
         return self.__returned
 
     def get_exception(self):
+        """
+        @return: the exception raised by _run or None
+        """
         return self.__exception
 
     @property
@@ -94,43 +113,45 @@ class Job(object):
     def set_change_listener(self, job_change_listener):
         self.__change_listener = job_change_listener
 
-    def __start(self, queue):
+    def _report_progress(self, progress):
         """
-        This is started as a subprocess in a separate address space
+        Called by _run in the worker process to notify the listener of its
+        progress
+
+        @param progress: any picklable object, e.g. a fraction
         """
-        # register state change listener
-        if not self.__change_listener is None:
-            job_manager.add_listener(self.id, self.__change_listener)
+        if self.__progress_handler is not None:
+            self.__progress_handler(progress)
 
-        # notify state change
-        job_manager.change_state(self.id, JobManager.STATE_STARTED)
+    def _run(self, argument):
+        """
+        @return: an object that should be made available after completion
+        """
+        pass
 
-        # dequeue argument object
-        argument = queue.get()
+    # called by the JobManager
 
-        # run the job
-        self.__exception = None
-        try:
-            returned = self._run(argument)
-        except Exception, e:
-            self.__log.error(e)
-            self.__exception = e
+    def _execute(self, argument, progress_handler):
+        # in the worker process
+        self.__progress_handler = progress_handler
+        return self._run(argument)
 
-        # enqueue returned object
-        queue.put(returned)
+    def _on_started(self):
+        if self.__change_listener is not None:
+            self.__change_listener._on_state_changed(JobManager.STATE_STARTED)
 
-        # notify state change
-        job_manager.change_state(self.id, JobManager.STATE_COMPLETED)
+    def _on_progress(self, progress):
+        if self.__change_listener is not None:
+            self.__change_listener._on_progress(progress)
 
-        # deregister state change listener
-        if not self.__change_listener is None:
-            job_manager.remove_listener(self.id)
-
-    def _run(self, arguments):
-        """
-        @return: a list of objects that should be made available after completion
-        """
-        pass
+    def _on_completed(self, returned, exception):
+        self.__task_id = None
+        self.__returned = returned
+        self.__exception = exception
+        if exception is not None:
+            self.__log.error("%s failed: %s" % (self.__class__.__name__, exception))
+        if self.__change_listener is not None:
+            self.__change_listener._on_state_changed(JobManager.STATE_COMPLETED)
 
 
 class JobChangeListener(object):
@@ -140,6 +161,9 @@ class JobChangeListener(object):
     def _on_state_changed(self, state):
         pass
 
+    def _on_progress(self, progress):
+        pass
+
 
 class GlobalJobChangeListener(object):
     """
@@ -149,48 +173,276 @@ class GlobalJobChangeListener(object):
         pass
 
 
-class JobManager(dbus.service.Object):
+# the messages sent by the workers
+_PROGRESS, _RESULT = 1, 2
+
+
+def _work(connection):
+    """
+    The main function of a worker process
+
+    It is forked from the editor, so the modules the Jobs need have already
+    been imported. It runs one task after another until the connection is
+    closed, so its messages always belong to the task it has been given last.
+    """
+    # Ctrl+C in the terminal of gedit is not meant for us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # a worker that replaces another one may have been forked while another
+    # thread held the locks of logging, they are never released here
+    logging._lock = threading.RLock()
+    for handler_ref in logging._handlerList:
+        handler = handler_ref()
+        if handler is not None:
+            handler.createLock()
+
+    while True:
+        try:
+            job_class, argument = connection.recv()
+        except (EOFError, IOError):
+            break
+        except Exception, e:
+            # e.g. the class of the Job could not be found
+            connection.send((_RESULT, None, e))
+            continue
+
+        def report_progress(progress):
+            connection.send((_PROGRESS, progress))
+
+        returned, exception = None, None
+        try:
+            returned = job_class()._execute(argument, report_progress)
+        except Exception, e:
+            exception = e
+
+        try:
+            connection.send((_RESULT, returned, exception))
+        except Exception, e:
+            # the result could not be pickled
+            connection.send((_RESULT, None, Exception(str(e))))
+
+
+class _Worker(object):
+    """
+    A worker process as seen from the main loop
+    """
+
+    def __init__(self, output_handler):
+        self.connection, child_connection = multiprocessing.Pipe()
+
+        self.process = multiprocessing.Process(target=_work, args=(child_connection,), name="LaTeXPluginWorker")
+        self.process.daemon = True
+        self.process.start()
+
+        child_connection.close()
+
+        self.task_id = None    # the task being run
+        self._timeout_id = None
+
+        condition = GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR
+        self._source_id = GLib.io_add_watch(self.connection.fileno(), GLib.PRIORITY_DEFAULT,
+                                            condition, output_handler, self)
+
+    def start_task(self, task_id, timeout, timeout_handler):
+        """
+        @param timeout: the seconds after which timeout_handler is called
+                with the worker and the task id if the task has not completed
+        """
+        self.task_id = task_id
+        self._timeout_id = GLib.timeout_add_seconds(timeout, self.__on_timeout, timeout_handler, task_id)
+
+    def __on_timeout(self, timeout_handler, task_id):
+        # the source is removed by returning False
+        self._timeout_id = None
+        timeout_handler(self, task_id)
+        return False
+
+    def end_task(self):
+        """
+        @return: the id of the task that has been run
+        """
+        task_id = self.task_id
+        self.task_id = None
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+        return task_id
+
+    def stop(self):
+        self.end_task()
+        GLib.source_remove(self._source_id)
+        self.connection.close()
+        self.process.terminate()
+        self.process.join()
+
+
+class JobManager(Singleton):
+    """
+    This runs the scheduled Jobs in a pool of long-lived worker processes
+    and passes their results to the main loop, where a watch on the pipe of
+    each worker receives them.
+
+    A cancelled task is removed from the queue or, if it is running, its
+    worker is replaced by a new one. So is the worker of a task that hasn't
+    completed after TIMEOUT seconds, its Job completes with an exception.
+
+    The workers are forked by start() when the plugin is activated, before
+    other threads exist that could hold a lock in the forked process.
+    """
 
     STATE_STARTED, STATE_COMPLETED = 1, 2
 
-    __log = logging.getLogger("JobManager")
+    SIZE = 2    # the maximum number of worker processes
+
+    TIMEOUT = 60
 
-    def __init__(self):
-        bus_name = dbus.service.BusName(BUS_NAME, bus=dbus.SessionBus())
-        dbus.service.Object.__init__(self, bus_name, OBJECT_PATH)
+    __log = logging.getLogger("JobManager")
 
+    def __init_once__(self):
         self.__global_listener = None
-        self.__listeners = {}
+        self.__workers = []
+        self.__queue = []        # [ (task_id, Job, argument) ] waiting for a worker
+        self.__jobs = {}         # { task_id -> Job } of the queued and running tasks
+        self.__next_task_id = 0
 
-        self.__log.debug("Created JobManager instance %s" % id(self))
+    def set_global_listener(self, global_job_change_listener):
+        self.__global_listener = global_job_change_listener
 
-    @dbus.service.method(dbus_interface="org.gedit.JobManagerInterface")
-    def change_state(self, job_id, state):
+    def start(self):
         """
-        The job with id <job_id> has changed its state to <state>
+        Fork the worker processes
         """
-        self.__log.debug("change_state(%s, %s)" % (job_id, state))
+        while len(self.__workers) < self.SIZE:
+            self.__start_worker()
 
-        # notify global listener
-        if self.__global_listener is None:
-            self.__log.warn("No global listener")
-        else:
-            self.__global_listener._on_state_changed(job_id, state)
+    def __start_worker(self):
+        worker = _Worker(self.__on_output)
+        self.__workers.append(worker)
+        self.__log.debug("Started worker %s" % worker.process.pid)
+        return worker
 
-        # notify listener if present
+    def submit(self, job, argument):
+        """
+        Queue a Job
+
+        @return: a task id
+        """
+        task_id = self.__next_task_id
+        self.__next_task_id += 1
+
+        self.__jobs[task_id] = job
+        self.__queue.append((task_id, job, argument))
+        self.__dispatch()
+        return task_id
+
+    def cancel(self, task_id):
+        """
+        Cancel a queued or running task, its Job is not notified anymore
+        """
         try:
-            self.__listeners[job_id]._on_state_changed(state)
+            del self.__jobs[task_id]
         except KeyError:
-            self.__log.warn("No listener for job %s" % job_id)
+            return
 
-    def set_global_listener(self, global_job_change_listener):
-        self.__global_listener = global_job_change_listener
+        for i, (queued_task_id, job, argument) in enumerate(self.__queue):
+            if queued_task_id == task_id:
+                del self.__queue[i]
+                return
+
+        for worker in self.__workers:
+            if worker.task_id == task_id:
+                self.__log.debug("Replacing worker %s" % worker.process.pid)
+                self.__workers.remove(worker)
+                worker.stop()
+                break
+
+        self.__dispatch()
 
-    def add_listener(self, job_id, job_change_listener):
-        self.__listeners[job_id] = job_change_listener
+    def __dispatch(self):
+        """
+        Pass the queued tasks to the idle workers
+        """
+        while len(self.__queue):
+            idle = [worker for worker in self.__workers if worker.task_id is None]
+            if len(idle):
+                worker = idle[0]
+            elif len(self.__workers) < self.SIZE:
+                worker = self.__start_worker()
+            else:
+                return
+
+            task_id, job, argument = self.__queue.pop(0)
+            try:
+                worker.connection.send((job.__class__, argument))
+            except Exception, e:
+                # e.g. the argument could not be pickled
+                del self.__jobs[task_id]
+                job._on_completed(None, e)
+                continue
+
+            worker.start_task(task_id, self.TIMEOUT, self.__on_timeout)
+            self.__notify(task_id, job, self.STATE_STARTED)
+            job._on_started()
+
+    def __on_output(self, fd, condition, worker):
+        """
+        A worker has sent a message or died
+        """
+        try:
+            while worker.connection.poll():
+                message = worker.connection.recv()
+                job = self.__jobs.get(worker.task_id)
+
+                if message[0] == _PROGRESS:
+                    if job is not None:
+                        job._on_progress(message[1])
+                else:
+                    returned, exception = message[1:]
+                    task_id = worker.end_task()
+                    if job is not None:
+                        del self.__jobs[task_id]
+                        self.__notify(task_id, job, self.STATE_COMPLETED)
+                        job._on_completed(returned, exception)
+        except (EOFError, IOError):
+            condition |= GLib.IOCondition.HUP
+
+        if condition & (GLib.IOCondition.HUP | GLib.IOCondition.ERR):
+            self.__log.error("Worker %s died" % worker.process.pid)
+            self.__workers.remove(worker)
+            task_id = worker.end_task()
+            worker.stop()
+
+            job = self.__jobs.pop(task_id, None)
+            if job is not None:
+                job._on_completed(None, Exception("The worker process died"))
+
+            self.__dispatch()
+            return False
+
+        self.__dispatch()
+        return True
+
+    def __on_timeout(self, worker, task_id):
+        """
+        A task has not completed in time, its worker may hang
+        """
+        if worker.task_id != task_id:
+            return
+
+        self.__log.error("Task %s has timed out, replacing worker %s" % (task_id, worker.process.pid))
+        self.__workers.remove(worker)
+        worker.stop()
+
+        job = self.__jobs.pop(task_id, None)
+        if job is not None:
+            self.__notify(task_id, job, self.STATE_COMPLETED)
+            job._on_completed(None, Exception("The Job has timed out"))
 
-    def remove_listener(self, job_id):
-        del self.__listeners[job_id]
+        self.__dispatch()
+
+    def __notify(self, task_id, job, state):
+        if self.__global_listener is not None:
+            self.__global_listener._on_state_changed(job.id, state)
 
     def dispose(self):
         """
@@ -198,8 +450,11 @@ class JobManager(dbus.service.Object):
         """
         self.__log.debug("dispose")
 
-
-job_manager = JobManager()
+        for worker in self.__workers:
+            worker.stop()
+        self.__workers = []
+        self.__queue = []
+        self.__jobs = {}
 
 
 # ex:ts=4:et:
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+latex.analyzer
+
+Runs the analysis of LaTeX documents (parsing, expanding, outline generation
+and validation) on a background thread
+"""
+
+from logging import getLogger
+from threading import Thread, Lock
+from Queue import Queue
+
+from gi.repository import GLib
+
+from ..issues import CollectingIssueHandler
+from ..preferences import DocumentPreferences
+
+from parser import LaTeXParser
+from cache import LaTeXDocumentCache
+from expander import LaTeXReferenceExpander
+from outline import LaTeXOutlineGenerator
+from validator import LaTeXValidator
+from walker import LaTeXWalker
+
+LOG = getLogger(__name__)
+
+
+class AnalysisCancelledException(Exception):
+    """
+    Raised inside of LaTeXAnalysis.run if the analysis has been cancelled
+    """
+
+
+class LaTeXAnalysis(object):
+    """
+    One run of the analysis of a LaTeX document
+
+    This works on a snapshot of the edited text. The models of other files
+    come from the LaTeXDocumentCache and are shared with the editors, the
+    LaTeXReferenceExpander copies the parts of them it has to change. The
+    caches used by the analysis are locked, so it may run on the LaTeXAnalyzer
+    thread and on the main loop (see LaTeXEditor.ensure_packages) at the same
+    time. The results are stored as attributes:
+
+     local_document: the model of the edited file
+     local_issues: the issues found while parsing the edited file
+     local_outline: the outline of the edited file
+     document: the expanded model of the master (local_document or a copy of it if the file is a master)
+     outline: the outline of the expanded master model
+     expand_issues: the issues found while expanding the child documents of a master
+     context_issues: the issues found in the master model if the file is a child
+     derived_issues: the issues found while generating the outline and validating
+     is_master: True if the edited file is a master
+    """
+
+    def __init__(self, content, file, charset, preferences, master_file, local_document=None, local_issues=None):
+        """
+        @param content: the content of the edited file
+        @param file: the File object of the edited file
+        @param charset: the character set used by Gedit
+        @param preferences: the DocumentPreferences of the edited file, already
+                updated with the content
+        @param master_file: the File object of the master if one has been chosen
+                for the edited file, None otherwise
+        @param local_document: the model of a master that is already up-to-date
+                with the content (e.g. after LaTeXParser.reparse), it is not
+                parsed again then. It is shared with the editor, so it is
+                expanded into a copy.
+        @param local_issues: the issues found while parsing local_document
+        """
+        self.content = content
+        self.file = file
+        self.charset = charset
+        self.preferences = preferences
+        self.master_file = master_file
+
+        self.cancelled = False
+        self.failed = False
+
+        self.local_document = local_document
+        self.local_issues = local_issues if local_issues is not None else []
+        self.local_outline = None
+        self.document = None
+        self.outline = None
+        self.expand_issues = []
+        self.context_issues = []
+        self.derived_issues = []
+        self.is_master = False
+
+    def cancel(self):
+        """
+        Stop the analysis as soon as possible, the results are not used anymore
+        """
+        self.cancelled = True
+
+    def _check_cancelled(self):
+        if self.cancelled:
+            raise AnalysisCancelledException()
+
+    def run(self, background=False):
+        """
+        Run the analysis
+
+        @param background: True if this runs on the LaTeXAnalyzer thread, the
+                child documents are then parsed in parallel while the main loop
+                goes on
+        @raise AnalysisCancelledException: if the analysis has been cancelled
+        """
+        # the model of the editor is not changed
+        shared = self.local_document is not None
+
+        if not shared:
+            # parse document
+            issue_handler = CollectingIssueHandler()
+            self.local_document = LaTeXParser().parse(self.content, self.file, issue_handler)
+            self.local_issues = issue_handler.issues
+
+        self.document = self.local_document
+        self.is_master = self.local_document.is_master
+
+        self._check_cancelled()
+
+        if self.is_master:
+            # expand child documents
+            issue_handler = CollectingIssueHandler()
+            expander = LaTeXReferenceExpander(parallel=background)
+            self.document = expander.expand(self.local_document, self.file, issue_handler, self.charset,
+                                            cached=shared)
+            self.expand_issues = issue_handler.issues
+
+            self._check_cancelled()
+
+            # generate outline from the expanded model and validate it
+            issue_handler = CollectingIssueHandler()
+            self.outline = generate_and_validate(self.document, issue_handler, self.preferences)
+            self.local_outline = self.outline
+            self.derived_issues = issue_handler.issues
+        else:
+            if self.master_file is None:
+                # the outline used by the outline view has to be created only from the child model
+                # otherwise we see the outline of the master and get wrong offsets
+                issue_handler = CollectingIssueHandler()
+                self.local_outline = LaTeXOutlineGenerator().generate(self.local_document, issue_handler)
+                self.outline = self.local_outline
+                self.derived_issues = issue_handler.issues
+                return
+
+            self._check_cancelled()
+
+            issue_handler = CollectingIssueHandler()
+
+            # the master model comes from the cache, so it is only read and
+            # parsed again if the master has changed
+            master_document = LaTeXDocumentCache().get_document(self.master_file, self.charset, issue_handler)
+            if master_document is None:
+                raise IOError("Master not found: %s" % self.master_file)
+
+            self._check_cancelled()
+
+            # expand its child documents into a copy of it, the edited one is
+            # taken from the snapshot instead of the disk
+            expander = LaTeXReferenceExpander(parallel=background)
+            self.document = expander.expand(master_document, self.master_file, issue_handler, self.charset,
+                                            overrides={ self.file.uri : self.local_document }, cached=True)
+
+            self._check_cancelled()
+
+            # one walk through the expanded master model creates the outline of
+            # the child model for the outline view, another outline to make
+            # elements from the master available (labels, colors, BibTeX files
+            # etc.) and validates the master
+            local_issue_handler = CollectingIssueHandler()
+            local_outline_generator = LaTeXOutlineGenerator()
+            outline_generator = LaTeXOutlineGenerator()
+            validator = LaTeXValidator()
+
+            walker = LaTeXWalker()
+            local_outline_generator.attach(walker, local_issue_handler, self.local_document)
+            outline_generator.attach(walker, issue_handler)
+            validator.attach(walker, issue_handler, LaTeXMasterPreferences().get(self.master_file))
+            walker.walk(self.document)
+
+            self.outline = outline_generator.finish()
+            validator.finish(self.outline)
+
+            self.local_outline = local_outline_generator.finish()
+            if self.local_outline is None:
+                # the master doesn't include the child
+                self.local_outline = LaTeXOutlineGenerator().generate(self.local_document, local_issue_handler)
+
+            self.derived_issues = local_issue_handler.issues
+            self.context_issues = issue_handler.issues
+
+
+def generate_and_validate(document, issue_handler, preferences):
+    """
+    Generate the outline of a document model and validate the model in one
+    walk through it
+
+    @param document: the root node of the document model
+    @param issue_handler: an object implementing IIssueHandler
+    @param preferences: the DocumentPreferences of the document
+    @return: the outline
+    """
+    outline_generator = LaTeXOutlineGenerator()
+    validator = LaTeXValidator()
+
+    walker = LaTeXWalker()
+    outline_generator.attach(walker, issue_handler)
+    validator.attach(walker, issue_handler, preferences)
+    walker.walk(document)
+
+    outline = outline_generator.finish()
+    validator.finish(outline)
+    return outline
+
+
+class LaTeXMasterPreferences(object):
+    """
+    This keeps the DocumentPreferences of the masters of the edited child
+    documents, so that the master is only read again for its modelines if it
+    has changed.
+    """
+
+    def __new__(cls):
+        if not '_instance' in cls.__dict__:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not '_ready' in dir(self):
+            self._entries = {}    # { uri -> (mtime, DocumentPreferences) }
+            self._lock = Lock()
+            self._ready = True
+
+    def get(self, master_file):
+        """
+        Return the DocumentPreferences of a master
+
+        @param master_file: the File object of the master
+        @raise IOError: if the master is not found
+        """
+        mtime = master_file.mtime
+
+        with self._lock:
+            try:
+                entry_mtime, prefs = self._entries[master_file.uri]
+            except KeyError:
+                entry_mtime, prefs = None, DocumentPreferences(master_file)
+
+            if entry_mtime != mtime:
+                f = open(master_file.path)
+                try:
+                    prefs.parse_content(f.read())
+                finally:
+                    f.close()
+                self._entries[master_file.uri] = (mtime, prefs)
+
+            return prefs
+
+
+class LaTeXAnalyzer(object):
+    """
+    This runs LaTeXAnalysis objects one after another on a background thread
+    and passes the finished ones back to the main loop.
+
+    All editors share the same thread, so the models in the LaTeXDocumentCache
+    are only built by one analysis at a time.
+    """
+
+    def __new__(cls):
+        if not '_instance' in cls.__dict__:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not '_ready' in dir(self):
+            self._queue = Queue()
+            self._thread = Thread(target=self._work, name="LaTeXAnalyzer")
+            self._thread.daemon = True
+            self._thread.start()
+            self._ready = True
+
+    def schedule(self, analysis, callback):
+        """
+        Run an analysis on the background thread
+
+        @param analysis: a LaTeXAnalysis object
+        @param callback: called from the main loop with the analysis when it is
+                done, unless it has been cancelled
+        """
+        self._queue.put((analysis, callback))
+
+    def _work(self):
+        while True:
+            analysis, callback = self._queue.get()
+
+            if analysis.cancelled:
+                continue
+
+            try:
+                analysis.run(background=True)
+            except AnalysisCancelledException:
+                LOG.debug("Analysis of %s cancelled" % analysis.file)
+                continue
+            except Exception:
+                if analysis.cancelled:
+                    # the editor may have destroyed the model of a cancelled
+                    # analysis while it was running
+                    LOG.debug("Analysis of %s cancelled" % analysis.file)
+                    continue
+                LOG.exception("Analysis of %s failed" % analysis.file)
+                analysis.failed = True
+
+            GLib.idle_add(self._deliver, analysis, callback)
+
+    def _deliver(self, analysis, callback):
+        if not analysis.cancelled:
+            callback(analysis)
+        return False
+
+# ex:ts=4:et:
@@ -24,25 +24,369 @@ latex.cache
 Cache for LaTeX document models for speeding up reference expanding
 """
 
+import os
+import errno
+import marshal
+import zlib
+from hashlib import sha1
 from logging import getLogger
+from thread import get_ident
+from threading import Lock, Event
 
-from parser import LaTeXParser
-from ..issues import IIssueHandler
+from gi.repository import GLib
 
+from parser import LaTeXParser, Document, LocalizedNode, PARSER_VERSION
+from ..issues import Issue, CollectingIssueHandler
+from ..resources import Resources
+from ..preferences import Preferences
+from ..lrucache import LRUCache
+from ..job import Job, JobChangeListener, JobManager
 
-class CacheIssueHandler(IIssueHandler):
+
+def encode_document(document, issues):
     """
-    This is used to catch the issues occuring while parsing a document
-    on cache fault.
+    Flatten a document model to a tuple of plain values, e.g. for storing it or
+    passing it to another process
+
+    Every node becomes the sequence type, value, start, end, number of children
+    in pre-order. The nodes all belong to the same file, so it is not stored.
     """
-    def __init__(self):
-        self.issues = []
+    nodes = []
+    append = nodes.extend
+
+    def encode_node(node):
+        append((node.type, node.value, node.start, node.end, len(node)))
+        for child in node:
+            encode_node(child)
+
+    for child in document:
+        encode_node(child)
+
+    return (len(document), tuple(nodes),
+            tuple([(i.message, i.start, i.end, i.severity, i.position_type) for i in issues]))
+
+
+def decode_document(data, file):
+    """
+    Build a document model from the result of encode_document
+
+    @param data: the result of encode_document
+    @param file: the File object the model belongs to
+    @return: a tuple (Document, list of Issues)
+    """
+    count, nodes, issue_data = data
+    position = [0]
+
+    def decode_node(parent):
+        i = position[0]
+        type, value, start, end, children = nodes[i:i + 5]
+        position[0] = i + 5
+        node = LocalizedNode(type, start, end, value, file)
+        parent.append(node)
+        for j in xrange(children):
+            decode_node(node)
+
+    document = Document(file)
+    for j in xrange(count):
+        decode_node(document)
+
+    issues = [Issue(message, start, end, file, severity, position_type)
+              for message, start, end, severity, position_type in issue_data]
+
+    return document, issues
+
+
+def _parse_encoded(args):
+    """
+    Parse a document and return it encoded, this runs in the worker processes
+    of the JobManager (see LaTeXDocumentCache.prefetch)
+
+    @param args: a tuple (content, charset)
+    """
+    content, charset = args
+    if charset is not None:
+        content = content.decode(charset)
+    issue_handler = CollectingIssueHandler()
+    document = LaTeXParser().parse(content, None, issue_handler)
+    return encode_document(document, issue_handler.issues)
+
+
+class _ParseJob(Job):
+    """
+    Parses a document in a worker process, the argument is a tuple
+    (content, charset) and the model is returned encoded
+    """
+    def _run(self, argument):
+        return _parse_encoded(argument)
+
+
+class _ParseJobs(JobChangeListener):
+    """
+    Runs a _ParseJob for each of some documents and waits for all of them
+
+    The Jobs are scheduled and complete in the main loop, so this may only be
+    used from another thread.
+    """
+
+    # the seconds to wait for the Jobs, the ones not completed by then are
+    # aborted and their documents are parsed by the caller
+    TIMEOUT = 30
+
+    _log = getLogger("LaTeXDocumentCache._ParseJobs")
+
+    def __init__(self, arguments):
+        """
+        @param arguments: a list of tuples (content, charset)
+        """
+        self._jobs = [_ParseJob(argument) for argument in arguments]
+        self._remaining = len(self._jobs)
+        self._completed = Event()
+
+    def run(self):
+        """
+        @return: a list of the encoded models, None for a Job that has failed
+                or timed out
+        """
+        GLib.idle_add(self._schedule)
+        if not self._completed.wait(self.TIMEOUT):
+            self._log.warning("Parsing in the worker processes timed out")
+            GLib.idle_add(self._abort)
+        return [job.get_returned() for job in self._jobs]
+
+    def _schedule(self):
+        for job in self._jobs:
+            job.set_change_listener(self)
+            job.schedule()
+        return False
+
+    def _abort(self):
+        for job in self._jobs:
+            job.abort()
+        return False
+
+    def _on_state_changed(self, state):
+        if state == JobManager.STATE_COMPLETED:
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._completed.set()
+
+
+class LaTeXDocumentStore(object):
+    """
+    This stores LaTeX document models on disk, so that they survive a restart
+    of Gedit.
+
+    Each file gets one record in the cache directory holding a header and the
+    model and issues flattened to tuples, compressed and serialized with marshal.
+    A record is valid for the path and charset it was created for and if either
+    size and mtime of the file or the SHA-1 of its content still match. Records
+    written by another format or parser version are dropped.
+
+    The directory is limited to MAX_SIZE bytes, the least recently used records
+    are removed first. The total size is counted in memory, the directory is
+    only scanned on startup and when records have to be removed.
+    """
+
+    # If you change the record layout, then INCREMENT THE VERSION
+    FORMAT_VERSION = 1
+
+    MAX_SIZE = 32 * 1024 * 1024
+
+    _log = getLogger("LaTeXDocumentStore")
+
+    def __init__(self, directory=None):
+        """
+        @param directory: the directory for the records, defaults to a
+                sub-directory of the user directory
+        """
+        if directory is None:
+            directory = os.path.join(Resources().get_user_dir(), "documents")
+        self._directory = directory
+
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # records are written by the main loop and the LaTeXAnalyzer thread
+        self._lock = Lock()
+        self._sizes = {}    # { record path -> size }
+        self._size = 0
+        self._scan(remove_temp=True)
+
+    def _record_path(self, path):
+        if type(path) is unicode:
+            path = path.encode("utf-8")
+        return os.path.join(self._directory, "%s.bin" % sha1(path).hexdigest())
+
+    def load(self, file, charset, size, mtime, content=None):
+        """
+        Return the stored model of a file
+
+        @param file: the File object
+        @param charset: the character set the content has been decoded with
+        @param size: the current size of the file
+        @param mtime: the current modification time of the file
+        @param content: the current content (a str) of the file if it has
+                already been read, it is used to recognize an unchanged file
+                with another mtime
+
+        @return: a tuple (Document, list of Issues) or None
+        """
+        record_path = self._record_path(file.path)
+        try:
+            f = open(record_path, "rb")
+            try:
+                header, payload = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+        format_version, parser_version, path, record_charset, record_size, record_mtime, digest = header
+
+        if format_version != self.FORMAT_VERSION or parser_version != PARSER_VERSION:
+            self._log.debug("Dropping obsolete record for %s" % file)
+            self._remove(record_path)
+            return None
+
+        if path != file.path or record_charset != charset:
+            return None
+
+        if size != record_size or mtime != record_mtime:
+            if content is None or sha1(content).hexdigest() != digest:
+                return None
+
+            # the content is the same, so just remember the new mtime
+            self._write(record_path, (format_version, parser_version, path, charset, size, mtime, digest), payload)
+        else:
+            # mark as recently used
+            try:
+                os.utime(record_path, None)
+            except OSError:
+                pass
+
+        try:
+            return decode_document(marshal.loads(zlib.decompress(payload)), file)
+        except (zlib.error, ValueError, EOFError, TypeError, IndexError):
+            self._log.warning("Invalid record for %s" % file, exc_info=True)
+            self._remove(record_path)
+            return None
+
+    def save(self, file, charset, size, mtime, content, document, issues):
+        """
+        Store the model of a file
+
+        @param file: the File object
+        @param charset: the character set the content has been decoded with
+        @param size: the size of the file
+        @param mtime: the modification time of the file
+        @param content: the content (a str) the model has been parsed from
+        @param document: the Document
+        @param issues: the list of Issues found while parsing
+        """
+        header = (self.FORMAT_VERSION, PARSER_VERSION, file.path, charset, size, mtime, sha1(content).hexdigest())
+        payload = zlib.compress(marshal.dumps(encode_document(document, issues)))
+
+        self._write(self._record_path(file.path), header, payload)
+        self._evict()
+
+    def _write(self, record_path, header, payload):
+        # write to a temporary file first, so that readers never see half a
+        # record, records are written by the main loop and the LaTeXAnalyzer
+        temp_path = "%s.%s.%s.tmp" % (record_path, os.getpid(), get_ident())
+        try:
+            f = open(temp_path, "wb")
+            try:
+                marshal.dump((header, payload), f)
+                size = f.tell()
+            finally:
+                f.close()
+            os.rename(temp_path, record_path)
+        except (IOError, OSError):
+            self._log.warning("Failed to write %s" % record_path, exc_info=True)
+            self._remove(temp_path)
+            return
+
+        with self._lock:
+            self._size += size - self._sizes.get(record_path, 0)
+            self._sizes[record_path] = size
+
+    def _remove(self, record_path):
+        try:
+            os.remove(record_path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self._size -= self._sizes.pop(record_path, 0)
+
+    def _scan(self, remove_temp=False):
+        """
+        Count the records in the directory
 
-    def clear(self):
-        self.issues = []
+        @param remove_temp: if True, remove the temporary files left by
+                processes that have crashed while writing
+        @return: a list of tuples (mtime, size, record path)
+        """
+        records = []
+        for name in os.listdir(self._directory):
+            record_path = os.path.join(self._directory, name)
+            if name.endswith(".tmp"):
+                if remove_temp and not self._is_alive(name):
+                    self._log.debug("Removing stale %s" % name)
+                    try:
+                        os.remove(record_path)
+                    except OSError:
+                        pass
+                continue
+            try:
+                stat = os.stat(record_path)
+            except OSError:
+                continue
+            records.append((stat.st_mtime, stat.st_size, record_path))
 
-    def issue(self, issue):
-        self.issues.append(issue)
+        with self._lock:
+            self._sizes = dict([(path, size) for mtime, size, path in records])
+            self._size = sum(self._sizes.itervalues())
+
+        return records
+
+    def _is_alive(self, temp_name):
+        """
+        @return: True if the process that writes a temporary file still runs
+        """
+        # <digest>.bin.<pid>.<thread>.tmp
+        try:
+            pid = int(temp_name.split(".")[2])
+        except (IndexError, ValueError):
+            return False
+        try:
+            os.kill(pid, 0)
+        except OSError, e:
+            return e.errno == errno.EPERM
+        return True
+
+    def _evict(self):
+        """
+        Remove the least recently used records until the directory fits into MAX_SIZE
+        """
+        if self._size <= self.MAX_SIZE:
+            return
+
+        # other instances of Gedit may have changed the directory, too
+        records = self._scan()
+        total = self._size
+        if total <= self.MAX_SIZE:
+            return
+
+        records.sort()
+        for mtime, size, record_path in records:
+            self._remove(record_path)
+            total -= size
+            if total <= self.MAX_SIZE:
+                break
 
 
 class LaTeXDocumentCache(object):
@@ -53,25 +397,42 @@ class LaTeXDocumentCache(object):
 
     # FIXME: we need a global character set
 
-    # TODO: serialize the cache on shutdown
+    # models are also kept in a LaTeXDocumentStore, so they survive a restart
 
     _log = getLogger("LaTeXDocumentCache")
 
+    # prefetch only uses the worker processes for at least this number of files
+    PARALLEL_THRESHOLD = 4
+
     class Entry(object):
         """
         An entry in the cache
         """
         _log = getLogger("LaTeXDocumentCache.Entry")
 
-        def __init__(self, file, charset):
+        def __init__(self, file, charset, store, synchronize=True):
+            """
+            @param file: the File object
+            @param charset: the character set of the file
+            @param store: a LaTeXDocumentStore or None
+            @param synchronize: if False, the model is not loaded yet (see load)
+            """
             self.__file = file
+            self.__store = store
             self.__parser = LaTeXParser()
-            self.__issue_handler = CacheIssueHandler()
+            self.__issue_handler = CollectingIssueHandler()
             self.__mtime = 0
+            self.__size = 0
+            self.__stat = None
             self.__document = None
             self.__charset = charset
 
-            self.synchronize()
+            if synchronize:
+                self.synchronize()
+
+        @property
+        def file(self):
+            return self.__file
 
         @property
         def modified(self):
@@ -85,36 +446,107 @@ class LaTeXDocumentCache(object):
         def issues(self):
             return self.__issue_handler.issues
 
+        @property
+        def weight(self):
+            """
+            The size of the file, the model grows with it
+            """
+            return self.__size
+
+        @property
+        def charset(self):
+            return self.__charset
+
         def synchronize(self):
             """
             Synchronize document model with file contents.
 
+            @raise OSError: if the file is not found
+            """
+            content = self.load()
+            if content is not None:
+                self.parse(content)
+
+        def load(self):
+            """
+            Prepare synchronizing the model, take it from the LaTeXDocumentStore
+            if possible
+
+            @return: the content of the file if it has to be parsed (see parse
+                    and install), None otherwise
             @raise OSError: if the file is not found
             """
             # update timestamp
             self.__mtime = self.__file.mtime
 
-            # clear previous data
+            # clear previous data, the model is not destroyed as it may still
+            # be part of an expanded model
             self.__issue_handler.clear()
-            if self.__document != None:
-                self.__document.destroy()
-                self.__document = None
+            self.__document = None
 
-            # read file
             try:
-                f = open(self.__file.path, "r")
-                try:
-                    content = f.read()
-                finally:
-                    f.close()
-            except IOError:
-                return
+                self.__stat = os.stat(self.__file.path)
+            except OSError:
+                return None
+
+            self.__size = self.__stat.st_size
 
+            # look for a stored model first
+            stored = None
+            if self.__store is not None:
+                stored = self.__store.load(self.__file, self.__charset, self.__stat.st_size, self.__stat.st_mtime)
+
+            content = None
+            if stored is None:
+                # read file
+                try:
+                    f = open(self.__file.path, "r")
+                    try:
+                        content = f.read()
+                    finally:
+                        f.close()
+                except IOError:
+                    return None
+
+                if self.__store is not None:
+                    # the file may have been touched only
+                    stored = self.__store.load(self.__file, self.__charset, self.__stat.st_size, self.__stat.st_mtime, content)
+
+            if stored is not None:
+                self._log.debug("Loaded '%s' from disk" % self.__file)
+                self.__document, self.__issue_handler.issues = stored
+                return None
+
+            return content
+
+        def parse(self, content):
+            """
+            Parse the content returned by load
+            """
             if self.__charset is not None:
-                content = content.decode(self.__charset)
+                decoded = content.decode(self.__charset)
+            else:
+                decoded = content
 
             # parse
-            self.__document = self.__parser.parse(content, self.__file, self.__issue_handler)
+            self.__document = self.__parser.parse(decoded, self.__file, self.__issue_handler)
+
+            self.__save(content)
+
+        def install(self, content, data):
+            """
+            Use a model parsed from the content returned by load somewhere else
+
+            @param data: the model as returned by encode_document
+            """
+            self.__document, self.__issue_handler.issues = decode_document(data, self.__file)
+
+            self.__save(content)
+
+        def __save(self, content):
+            if self.__store is not None:
+                self.__store.save(self.__file, self.__charset, self.__stat.st_size, self.__stat.st_mtime, content,
+                                  self.__document, self.__issue_handler.issues)
 
     def __new__(cls):
         if not '_instance' in cls.__dict__:
@@ -123,29 +555,48 @@ class LaTeXDocumentCache(object):
 
     def __init__(self):
         if not '_ready' in dir(self):
-            self._entries = {}
+            preferences = Preferences()
+            self._entries = LRUCache("LaTeXDocumentCache",
+                                     int(preferences.get("document-cache-entries")),
+                                     int(preferences.get("document-cache-size")) * 1024)
+            try:
+                self._store = LaTeXDocumentStore()
+            except (OSError, AttributeError):
+                # no user directory (e.g. outside of the plugin)
+                self._log.warning("Document models are not stored on disk", exc_info=True)
+                self._store = None
+            # the LaTeXAnalyzer thread and the main loop both expand documents
+            self._lock = Lock()
             self._ready = True
 
     def get_document(self, file, charset, issue_handler):
         """
         Return the (hopefully) cached document model for a given file
 
+        The file is read and parsed without holding the lock, so the main loop
+        does not wait for the documents the LaTeXAnalyzer thread is parsing.
+
         @param file: a File object
         @param charset: character set
         @param issue_handler: an IIssueHandler to use
         """
-        try:
-            # update entry if necessary
-            entry = self._entries[file.uri]
-            self._log.debug("Reading '%s' from cache" % file)
-            if entry.modified:
-                self._log.debug("File '%s' modified, synchronizing..." % file)
-                entry.synchronize()
-        except KeyError:
+        with self._lock:
+            entry = self._entries.get(file.uri)
+
+        if entry is None:
             self._log.debug("Cache fault for '%s'" % file)
-            # create new entry
-            entry = self.Entry(file, charset)
-            self._entries[file.uri] = entry
+        elif entry.modified:
+            self._log.debug("File '%s' modified, synchronizing..." % file)
+            entry = None
+        else:
+            self._log.debug("Reading '%s' from cache" % file)
+
+        if entry is None:
+            # entries are never changed once they are cached, so a new one
+            # replaces the outdated one
+            entry = self.Entry(file, charset, self._store)
+            with self._lock:
+                self._entries.put(file.uri, entry, entry.weight)
 
         # pass cached issues to the issue handler
         for issue in entry.issues:
@@ -153,6 +604,78 @@ class LaTeXDocumentCache(object):
 
         return entry.document
 
+    def peek_document(self, file):
+        """
+        Return the cached document model for a given file without updating it
+
+        @param file: a File object
+        @return: the Document or None if it is not cached
+        """
+        with self._lock:
+            entry = self._entries.peek(file.uri)
+            if entry is None:
+                return None
+            return entry.document
+
+    def prefetch(self, files, charset, parallel=False):
+        """
+        Make sure that the models of some files are cached
+
+        The files are read and parsed without holding the lock, it is only
+        taken to look up and insert the entries.
+
+        @param files: a list of File objects
+        @param charset: character set
+        @param parallel: if True, the files that have to be parsed are parsed
+                by the worker processes of the JobManager. The Jobs complete in
+                the main loop, so this must not be called from it then.
+        """
+        # new entries for the files that are not cached or have changed
+        entries = []
+        for file in files:
+            with self._lock:
+                entry = self._entries.peek(file.uri)
+            try:
+                if entry is None or entry.modified:
+                    entries.append(self.Entry(file, charset, self._store, synchronize=False))
+            except (IOError, OSError):
+                # reported when the document is expanded
+                continue
+
+        # the entries whose files have to be parsed and their content
+        pending = []
+        for entry in entries:
+            try:
+                content = entry.load()
+            except (IOError, OSError):
+                continue
+            if content is not None:
+                pending.append((entry, content))
+
+        results = None
+        if parallel and len(pending) >= self.PARALLEL_THRESHOLD:
+            self._log.debug("Parsing %s documents in the worker processes" % len(pending))
+            results = _ParseJobs([(text, entry.charset) for entry, text in pending]).run()
+
+        for i, (entry, content) in enumerate(pending):
+            if results is None or results[i] is None:
+                entry.parse(content)
+            else:
+                entry.install(content, results[i])
+
+        with self._lock:
+            for entry in entries:
+                if entry.document is not None:
+                    self._entries.put(entry.file.uri, entry, entry.weight)
+
+    @property
+    def statistics(self):
+        """
+        Return the hit, miss and eviction counters and the current size (see LRUCache.statistics)
+        """
+        with self._lock:
+            return self._entries.statistics
+
 
 
 # ex:ts=4:et:
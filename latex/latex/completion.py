@@ -116,6 +116,7 @@ class LaTeXCompletionHandler(ICompletionHandler):
         #get the language_model singleton
         self._language_model = LanguageModelFactory().get_language_model()
         self._bibtex_document_cache = BibTeXDocumentCache()
+        self._bibtex_choices = {}     # { uri -> (Document, list of Choices) }
 
     def set_outline(self, outline):
         """
@@ -148,26 +149,38 @@ class LaTeXCompletionHandler(ICompletionHandler):
         try:
 
             entry_choices = []
+            bibtex_choices = {}
 
             for bib_file in outline.bibliographies:
                 try:
                     bibtex_document = self._bibtex_document_cache.get_document(bib_file)
 
-                    # generate choices from entries
+                    # the choices are only generated again if the document has changed
+                    try:
+                        document, choices = self._bibtex_choices[bib_file.uri]
+                        if document is not bibtex_document:
+                            raise KeyError
+                    except KeyError:
+                        choices = []
+                        for entry in bibtex_document.entries:
 
-                    for entry in bibtex_document.entries:
+                            # build table data for DetailsPopup
+                            rows = []
+                            for field in entry.fields:
+                                rows.append([field.name, field.valueMarkup])
 
-                        # build table data for DetailsPopup
-                        rows = []
-                        for field in entry.fields:
-                            rows.append([field.name, field.valueMarkup])
+                            choices.append(Choice(None, entry.key, rows))
 
-                        entry_choices.append(Choice(None, entry.key, rows))
+                    bibtex_choices[bib_file.uri] = (bibtex_document, choices)
+                    entry_choices += choices
 
                 except OSError:
                     # BibTeX file not found
                     self._log.error("Not found: %s" % bib_file)
 
+            # forget the bibliographies not used anymore
+            self._bibtex_choices = bibtex_choices
+
             # attach to placeholders in CommandStore
             self._language_model.fill_placeholder("Bibitems", entry_choices)
 
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+latex.dependencies
+
+The graph of \input and \include references between LaTeX documents
+"""
+
+from logging import getLogger
+from threading import Lock
+
+from gi.repository import GObject
+
+from ..util import singleton
+
+
+@singleton
+class LaTeXDependencyGraph(GObject.GObject):
+    """
+    This holds which documents include which other documents, by URI. The
+    edges are recorded by the LaTeXReferenceExpander, so the graph spans all
+    masters that have been expanded and their transitive children.
+
+    When a document has been saved, invalidate() emits "document-invalidated"
+    for every document including it directly or indirectly, so that the
+    editors of these documents can update their models.
+    """
+
+    __gsignals__ = {
+        "document-invalidated": (
+            GObject.SignalFlags.RUN_LAST, None, [str]),
+    }
+
+    _log = getLogger("LaTeXDependencyGraph")
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self._children = {}    # { uri -> list of child uris }
+        self._parents = {}     # { uri -> set of parent uris }
+        # the LaTeXAnalyzer thread records edges while the main loop reads them
+        self._lock = Lock()
+
+    def set_children(self, uri, child_uris):
+        """
+        Replace the documents included by a document
+
+        @param uri: the URI of the including document
+        @param child_uris: a list of the URIs of the included documents
+        """
+        with self._lock:
+            for child_uri in self._children.get(uri, []):
+                parents = self._parents.get(child_uri)
+                if parents is not None:
+                    parents.discard(uri)
+
+            self._children[uri] = list(child_uris)
+
+            for child_uri in child_uris:
+                self._parents.setdefault(child_uri, set()).add(uri)
+
+    def children(self, uri):
+        """
+        @return: the list of URIs of the documents directly included by a document
+        """
+        with self._lock:
+            return list(self._children.get(uri, []))
+
+    def descendants(self, uri):
+        """
+        @return: the set of URIs of all documents included by a document
+        """
+        with self._lock:
+            return self._reach(uri, self._children)
+
+    def ancestors(self, uri):
+        """
+        @return: the set of URIs of all documents including a document
+        """
+        with self._lock:
+            return self._reach(uri, self._parents)
+
+    def _reach(self, uri, edges):
+        # iterative, so cycles only end the walk
+        reached = set()
+        pending = [uri]
+        while len(pending):
+            for next_uri in edges.get(pending.pop(), ()):
+                if not next_uri in reached:
+                    reached.add(next_uri)
+                    pending.append(next_uri)
+        reached.discard(uri)
+        return reached
+
+    def invalidate(self, uri):
+        """
+        A document has changed on disk, notify all documents including it
+
+        This must be called from the main loop.
+
+        @param uri: the URI of the changed document
+        """
+        for ancestor_uri in self.ancestors(uri):
+            self._log.debug("%s invalidated by %s" % (ancestor_uri, uri))
+            self.emit("document-invalidated", ancestor_uri)
+
+# ex:ts=4:et:
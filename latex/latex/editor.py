@@ -29,14 +29,14 @@ if BENCHMARK: import time
 
 from gi.repository import GObject
 
-from ..editor import Editor
+from ..editor import Editor, EditedRange
 from ..file import File
-from ..issues import Issue, IIssueHandler
+from ..issues import Issue, IIssueHandler, CollectingIssueHandler
 
 from parser import LaTeXParser
-from expander import LaTeXReferenceExpander
 from outline import LaTeXOutlineGenerator
-from validator import LaTeXValidator
+from analyzer import LaTeXAnalysis, LaTeXAnalyzer
+from dependencies import LaTeXDependencyGraph
 from completion import LaTeXCompletionHandler
 
 from dialogs import ChooseMasterDialog
@@ -52,6 +52,9 @@ class LaTeXEditor(Editor, IIssueHandler):
 
     dnd_extensions = [".png", ".pdf", ".bib", ".tex"]
 
+    # milliseconds to wait after the last edit before updating the model
+    _REPARSE_DELAY = 500
+
     @property
     def completion_handlers(self):
         self.__latex_completion_handler = LaTeXCompletionHandler()
@@ -78,8 +81,35 @@ class LaTeXEditor(Editor, IIssueHandler):
 
         self._parser = LaTeXParser()
         self._outline_generator = LaTeXOutlineGenerator()
-        self._validator = LaTeXValidator()
+
+        # _local_document is the model of the edited file, _document is the
+        # expanded model of the master (the same object if we edit the master)
         self._document = None
+        self._local_document = None
+
+        # the outline of the master
+        self._outline = None
+
+        # the issues are kept in lists so that they can be shown again after an
+        # incremental update:
+        #  _local_issues: found while parsing the edited file
+        #  _expand_issues: found while expanding the child documents of a master
+        #  _context_issues: found in the master model if we edit a child
+        #  _derived_issues: found while generating the outline and validating
+        self._local_issues = []
+        self._expand_issues = []
+        self._context_issues = []
+        self._derived_issues = []
+
+        # the text range edited since the last parse
+        self._edited_range = EditedRange()
+        self._reparse_source_id = None
+
+        # the running LaTeXAnalysis
+        self._analysis = None
+
+        # update when a document included by this one has been saved
+        self._dependency_handler = LaTeXDependencyGraph().connect("document-invalidated", self._on_document_invalidated)
 
         # if the document is no master we display an info message on the packages to
         # include - _ensured_packages holds the already mentioned packages to not
@@ -96,14 +126,18 @@ class LaTeXEditor(Editor, IIssueHandler):
 
     def _on_preferences_changed(self, prefs, key, new_value):
         if key in ["outline-show-labels", "outline-show-tables", "outline-show-graphics"]:
+            if self._local_document is None:
+                # not parsed yet
+                return
+
             # regenerate outline model
             if self._document_is_master:
                 self._outline = self._outline_generator.generate(self._document, self)
                 self._outline_view.set_outline(self._outline)
             else:
-                # FIXME: self._document contains the full model of child and master
-                # so we may not use it for regenerating the outline here
-                self.__parse()
+                # self._document contains the full model of child and master so
+                # we use the model of the child here
+                self.__update_child_outline()
 
     def drag_drop_received(self, files):
         # see base.Editor.drag_drop_received
@@ -159,7 +193,7 @@ class LaTeXEditor(Editor, IIssueHandler):
 
         @param packages: a list of package names
         """
-        self.__parse()    # ensure up-to-date document model
+        self.__parse(True)    # ensure up-to-date document model
 
         if not self._document_is_master:
             LOG.debug("ensure_packages: document is not a master")
@@ -201,8 +235,22 @@ class LaTeXEditor(Editor, IIssueHandler):
 #        p_parse = Process(target=self.__parse)
 #        p_parse.start()
 
+        # documents including this one have to be updated, this may already
+        # parse this one if it includes itself indirectly
+        LaTeXDependencyGraph().invalidate(self._file.uri)
+
         self.__parse()
 
+    def _on_document_invalidated(self, graph, uri):
+        """
+        A document included by the edited file or by its master has been saved
+        """
+        master_file = self.__chosen_master_file
+        if uri == self._file.uri or (master_file is not None and uri == master_file.uri):
+            LOG.debug("Included document changed, parsing again")
+            self._change_reference = self.initial_timestamp
+            self.__parse()
+
     def __update_neighbors(self):
         """
         Find all files in the working directory that are relevant for LaTeX, e.g.
@@ -225,98 +273,242 @@ class LaTeXEditor(Editor, IIssueHandler):
         self.__latex_completion_handler.set_neighbors(tex_files, bib_files, graphic_files)
 
     #@verbose
-    def __parse(self):
+    def __parse(self, wait=False):
         """
         Ensure that the document model is up-to-date
+
+        The analysis runs on a background thread and its results are installed
+        by __on_analysis_finished later.
+
+        @param wait: if True the analysis is run right away and the model is
+                up-to-date when this returns
         """
-        if self.content_changed(self._change_reference):
+        pending = self._analysis is not None
+
+        if self.content_changed(self._change_reference) or (wait and pending):
             # content has changed so document model may be dirty
             self._change_reference = self.current_timestamp
 
+            # the analysis covers all edits that have not been handled incrementally
+            self._edited_range.clear()
+
             LOG.debug("Parsing document...")
 
-            # reset highlight
-            self.remove_markers("latex-error")
-            self.remove_markers("latex-warning")
+            content = self.content
 
-            # reset issues
-            self._issue_view.clear()
+            # update document preferences
+            self._preferences.parse_content(content)
 
-            if BENCHMARK: t = time.clock()
+            # a newer snapshot makes a running analysis obsolete
+            if pending:
+                self._analysis.cancel()
 
-            # parse document
-            if self._document != None:
-                self._document.destroy()
-                del self._document
-            self._document = self._parser.parse(self.content, self._file, self)
+            self._analysis = LaTeXAnalysis(content, self._file, self.charset, self._preferences,
+                                           self.__chosen_master_file)
 
-            # update document preferences
-            self._preferences.parse_content(self.content)
+            if wait:
+                if BENCHMARK: t = time.clock()
 
-            if BENCHMARK: LOG.info("LaTeXParser.parse: %f" % (time.clock() - t))
+                try:
+                    self._analysis.run()
+                except:
+                    # like a failed analysis on the LaTeXAnalyzer thread
+                    self._analysis.failed = True
+                    self.__on_analysis_finished(self._analysis)
+                    raise
 
-            LOG.debug("Parsed %s bytes of content" % len(self.content))
+                if BENCHMARK: LOG.info("LaTeXAnalysis.run: %f" % (time.clock() - t))
 
-            # FIXME: the LaTeXChooseMasterAction enabled state has to be updated on tab change, too!
+                self.__on_analysis_finished(self._analysis)
+            else:
+                LaTeXAnalyzer().schedule(self._analysis, self.__on_analysis_finished)
 
-            if self._document.is_master:
+        # may be called by GObject.idle_add
+        return False
 
-                self._context.set_action_enabled("LaTeXChooseMasterAction", False)
-                self._document_is_master = True
+    def __on_analysis_finished(self, analysis):
+        """
+        Install the results of a finished analysis (called from the main loop)
+        """
+        if analysis is not self._analysis:
+            # a newer one is running
+            return
 
-                # expand child documents
-                expander = LaTeXReferenceExpander()
-                expander.expand(self._document, self._file, self, self.charset)
+        self._analysis = None
 
-                # generate outline from the expanded model
-                self._outline = self._outline_generator.generate(self._document, self)
+        if analysis.failed:
+            # the edits don't match the models anymore, so they can't be updated
+            # incrementally, the next parse (e.g. on save) starts over
+            self.__destroy_documents()
+            self._edited_range.clear()
+            self._change_reference = self.initial_timestamp
+            return
 
-                # pass to view
-                self._outline_view.set_outline(self._outline)
+        if analysis.local_document is not self._local_document:
+            # not an analysis of the reparsed model
+            self.__destroy_documents()
 
-                # validate
-                self._validator.validate(self._document, self._outline, self, self._preferences)
-            else:
-                LOG.debug("Document is not a master")
+        self._local_document = analysis.local_document
+        self._document = analysis.document
+        self._outline = analysis.outline
 
-                self._context.set_action_enabled("LaTeXChooseMasterAction", True)
-                self._document_is_master = False
+        self._local_issues = analysis.local_issues
+        self._expand_issues = analysis.expand_issues
+        self._context_issues = analysis.context_issues
+        self._derived_issues = analysis.derived_issues
 
-                # the outline used by the outline view has to be created only from the child model
-                # otherwise we see the outline of the master and get wrong offsets
-                self._outline = self._outline_generator.generate(self._document, self)
-                self._outline_view.set_outline(self._outline)
+        self._outline_view.set_outline(analysis.local_outline)
 
-                # find master
-                master_file = self.__master_file
+        # FIXME: the LaTeXChooseMasterAction enabled state has to be updated on tab change, too!
 
-                if master_file is None:
-                    return
+        self._document_is_master = analysis.is_master
+        self._context.set_action_enabled("LaTeXChooseMasterAction", not analysis.is_master)
 
-                # parse master
-                master_content = open(master_file.path).read()
-                self._document = self._parser.parse(master_content, master_file, self)
+        self.__show_issues()
 
-                # expand its child documents
-                expander = LaTeXReferenceExpander()
-                expander.expand(self._document, master_file, self, self.charset)
+        if not analysis.is_master and analysis.master_file is None:
+            LOG.debug("Document is not a master")
 
-                # create another outline of the expanded master model to make elements
-                # from the master available (labels, colors, BibTeX files etc.)
-                self._outline = self._outline_generator.generate(self._document, self)
+            # no master has been chosen yet, ask the user and start over
+            if self.__master_file is not None:
+                self._change_reference = self.initial_timestamp
+                self.__parse()
+            return
+
+        # pass outline to completion
+        self.__latex_completion_handler.set_outline(self._outline)
+
+        # pass neighbor files to completion
+        self.__update_neighbors()
+
+        LOG.debug("Parsing finished")
+
+        # apply the edits made during the analysis
+        if not self._edited_range.empty and self._reparse_source_id is None:
+            self._reparse_source_id = GObject.idle_add(self.__parse_incremental)
+
+    def on_text_edited(self, start, old_end, new_end):
+        # see Editor.on_text_edited
+
+        self._edited_range.add(start, old_end, new_end)
+
+        # update the model when the user pauses typing
+        if self._reparse_source_id is not None:
+            GObject.source_remove(self._reparse_source_id)
+        self._reparse_source_id = GObject.timeout_add(self._REPARSE_DELAY, self.__parse_incremental)
+
+    def __parse_incremental(self):
+        """
+        Update the document model from the edited range only
+        """
+        self._reparse_source_id = None
+
+        if self._local_document is None or self._edited_range.empty:
+            return False
+
+        if self._analysis is not None:
+            # the edits are applied when the running analysis has finished
+            return False
 
-                # validate
-                prefs = DocumentPreferences(master_file)
-                prefs.parse_content(master_content)
-                self._validator.validate(self._document, self._outline, self, prefs)
+        edited = self._edited_range
 
-            # pass outline to completion
-            self.__latex_completion_handler.set_outline(self._outline)
+        LOG.debug("Reparsing %s..." % edited)
 
-            # pass neighbor files to completion
-            self.__update_neighbors()
+        if BENCHMARK: t = time.clock()
 
-            LOG.debug("Parsing finished")
+        content = self.content
+        self._parser.reparse(content, self._local_document, self._file, self._local_issues,
+                             edited.start, edited.old_end, edited.new_end)
+
+        if BENCHMARK: LOG.info("LaTeXParser.reparse: %f" % (time.clock() - t))
+
+        self._preferences.parse_content(content)
+
+        if self._local_document.is_master != self._document_is_master:
+            # the document has become a master or a child, start over
+            self._change_reference = self.initial_timestamp
+            self.__parse()
+            return False
+
+        if self._document_is_master:
+            # the edit may have added or removed references and moved the
+            # issues found at them, so the child documents are expanded again
+            # and the outline is generated on the LaTeXAnalyzer thread. The
+            # edits made meanwhile are applied when it has finished.
+            edited.clear()
+            self._change_reference = self.current_timestamp
+            self._analysis = LaTeXAnalysis(content, self._file, self.charset, self._preferences, None,
+                                           self._local_document, self._local_issues)
+            LaTeXAnalyzer().schedule(self._analysis, self.__on_analysis_finished)
+            return False
+        else:
+            self.__update_child_outline()
+
+            # move the issues the master model has found in this file, the master
+            # model itself is updated on the next full parse (e.g. on save)
+            self._context_issues = self.__move_issues(self._context_issues, edited)
+
+        edited.clear()
+
+        self.__show_issues()
+
+        self.__latex_completion_handler.set_outline(self._outline)
+
+        return False
+
+    def __update_child_outline(self):
+        """
+        Generate the outline of the child model and pass it to the view
+
+        @return: the outline
+        """
+        issue_handler = CollectingIssueHandler()
+        outline = self._outline_generator.generate(self._local_document, issue_handler)
+        self._outline_view.set_outline(outline)
+        self._derived_issues = issue_handler.issues
+        return outline
+
+    def __move_issues(self, issues, edited):
+        """
+        Adapt the issues of the edited file to an edit
+
+        @param issues: a list of Issues
+        @param edited: the EditedRange
+        @return: a new list of Issues
+        """
+        delta = edited.new_end - edited.old_end
+        moved = []
+        for issue in issues:
+            if issue.file != self._file or issue.end <= edited.start:
+                moved.append(issue)
+            elif issue.start >= edited.old_end:
+                # the Issue objects may be shared with the document cache
+                moved.append(Issue(issue.message, issue.start + delta, issue.end + delta,
+                                   issue.file, issue.severity, issue.position_type))
+        return moved
+
+    def __show_issues(self):
+        """
+        Pass all known issues to the issue view and the markers
+        """
+        # reset highlight
+        self.remove_markers("latex-error")
+        self.remove_markers("latex-warning")
+
+        # reset issues
+        self._issue_view.clear()
+
+        for issues in (self._local_issues, self._expand_issues, self._context_issues, self._derived_issues):
+            for issue in issues:
+                self.issue(issue)
+
+    def __destroy_documents(self):
+        # the master model of a child belongs to the LaTeXDocumentCache, so
+        # only the local model is destroyed
+        if self._local_document is not None:
+            self._local_document.destroy()
+        self._document = None
+        self._local_document = None
 
     def choose_master_file(self):
         master_filename = ChooseMasterDialog().run(self._file.dirname)
@@ -327,11 +519,11 @@ class LaTeXEditor(Editor, IIssueHandler):
         return master_filename
 
     @property
-    def __master_file(self):
+    def __chosen_master_file(self):
         """
-        Find the LaTeX master of this child
+        Return the LaTeX master of this child if one has been chosen
 
-        @return: base.File
+        @return: base.File or None
         """
         path = self._preferences.get("master-filename")
         if path != None:
@@ -341,13 +533,22 @@ class LaTeXEditor(Editor, IIssueHandler):
             else:
                 LOG.debug("master path is relative")
                 return File.create_from_relative_path(path, self._file.dirname)
-        else:
+        return None
+
+    @property
+    def __master_file(self):
+        """
+        Find the LaTeX master of this child
+
+        @return: base.File
+        """
+        master_file = self.__chosen_master_file
+        if master_file is None:
             # master filename not found, ask user
             master_filename = self.choose_master_file()
             if master_filename:
-                return File.create_from_relative_path(master_filename, self._file.dirname)
-            else:
-                return None
+                master_file = File.create_from_relative_path(master_filename, self._file.dirname)
+        return master_file
 
     def issue(self, issue):
         # see IIssueHandler.issue
@@ -380,6 +581,24 @@ class LaTeXEditor(Editor, IIssueHandler):
         else:
             return self.__master_file
 
+    @property
+    def build_inputs(self):
+        # overrides Editor.build_inputs
+
+        if self._outline is None:
+            # not analyzed yet
+            return None
+
+        master_file = self.file
+        if master_file is None:
+            return None
+
+        inputs = [master_file]
+        inputs += [File(uri) for uri in LaTeXDependencyGraph().descendants(master_file.uri)]
+        inputs += self._outline.bibliographies
+        inputs += [File(path) for path in self._outline.graphics]
+        return inputs
+
     @property
     def edited_file(self):
         """
@@ -393,9 +612,18 @@ class LaTeXEditor(Editor, IIssueHandler):
         # unreference the window context
         del self._context
 
-        # destroy the cached document
-        self._document.destroy()
-        del self._document
+        if self._reparse_source_id is not None:
+            GObject.source_remove(self._reparse_source_id)
+            self._reparse_source_id = None
+
+        if self._analysis is not None:
+            self._analysis.cancel()
+            self._analysis = None
+
+        LaTeXDependencyGraph().disconnect(self._dependency_handler)
+
+        # destroy the cached documents
+        self.__destroy_documents()
 
         Editor.destroy(self)
 
@@ -180,6 +180,8 @@ class TeXResource(object):
 from os.path import expanduser
 
 from ..file import File
+from ..resources import Resources
+from texindex import TeXFileIndex
 
 
 class Environment(object):
@@ -236,6 +238,9 @@ class Environment(object):
                 self._log.error("%s not found, using default search paths %s" % (self._CONFIG_FILENAME, default_search_paths))
                 self._search_paths = default_search_paths
 
+            self._index = TeXFileIndex(self._search_paths, Resources().get_user_file("texmf.index"),
+                                       self._CONFIG_FILENAME)
+
             self._ready = True
 
     @property
@@ -250,9 +255,13 @@ class Environment(object):
 
     def file_exists(self, filename):
         """
-        Uses kpsewhich to check if a TeX related file (.bst, .sty etc.) exists. The result
-        is cached to minimize 'kpsewhich' calls.
+        Check if a TeX related file (.bst, .sty etc.) exists. This looks it up in
+        the TeXFileIndex, or uses kpsewhich if no TEXMF tree has been found. The
+        result is cached to minimize 'kpsewhich' calls.
         """
+        if self._index.available:
+            return self._index.exists(filename)
+
         if not self.kpsewhich_installed:
             return True
 
@@ -308,8 +317,11 @@ class Environment(object):
         resources = []
         files = []
 
-        for search_path in self._search_paths:
-            files += [File(f) for f in popen("find %s%s -name '*%s'" % (search_path, relative, extension)).readlines()]
+        if self._index.available:
+            files = [File(f) for f in self._index.find(relative, extension)]
+        else:
+            for search_path in self._search_paths:
+                files += [File(f) for f in popen("find %s%s -name '*%s'" % (search_path, relative, extension)).readlines()]
 
         if len(files) > 0:
             for file in files:
@@ -321,7 +333,7 @@ class Environment(object):
                 resources.append(TeXResource(file, name, label))
         else:
             # no files found
-            self._log.error("No %s-files found in %s%s" % (extension, search_path, relative))
+            self._log.error("No %s-files found in %s%s" % (extension, self._search_paths, relative))
 
         for name, label in labels.iteritems():
             found = False
@@ -25,76 +25,236 @@ latex.expander
 from logging import getLogger
 
 from ..file import File
+from ..issues import Issue
+from ..util import escape
 from cache import LaTeXDocumentCache
 from parser import Node
+from dependencies import LaTeXDependencyGraph
 
 
 class LaTeXReferenceExpander(object):
     """
     This expands '\include' and '\input' commands by parsing the referenced child
     documents. The resulting trees may be attached to the parent tree.
+
+    The models from the LaTeXDocumentCache are shared by all editors and the
+    LaTeXAnalyzer thread, so they are never changed. Where an \input or
+    \include has to be expanded below a cached node, the nodes on the way to
+    it are copied and the copies carry the expanded documents. All other nodes
+    are shared with the cache.
     """
 
     # TODO: embed this into parser so that we don't need to walk the document again
 
     _log = getLogger("ReferenceExpander")
 
-    def __init__(self):
+    def __init__(self, parallel=False):
+        """
+        @param parallel: if True, all referenced documents are collected first
+                and the ones that are not cached are parsed in parallel by the
+                worker processes of the JobManager. This waits for the main
+                loop, so it must not be used on it.
+        """
         self._document_cache = LaTeXDocumentCache()
+        self._parallel = parallel
 
-    def expand(self, documentNode, master_file, issue_handler, charset):
+    def expand(self, documentNode, master_file, issue_handler, charset, overrides=None, cached=False):
         """
         @param documentNode: the master model
         @param master_file: the File object of the master
         @param issue_handler: an IIssueHandler object
         @param charset: a string naming the character set used by Gedit
+        @param overrides: a map { uri -> Document } of models to use instead of
+                the cached ones, e.g. the model of a child being edited, or None
+        @param cached: True if the master model is shared, e.g. it comes from
+                the LaTeXDocumentCache, it is not changed then
+        @return: the expanded master model, this is documentNode itself unless
+                it is cached
         """
+        if overrides is None:
+            overrides = {}
+
         self._master_file = master_file
         self._issue_handler = issue_handler
         self._charset = charset
-        self._expand(documentNode)
+        self._overrides = overrides
+
+        # the URIs of the documents being expanded, from the master down to the
+        # current one, for detecting cycles
+        self._stack = [master_file.uri]
+
+        # the references found, { uri -> list of child uris }
+        self._references = {master_file.uri : []}
+
+        if self._parallel:
+            self._prefetch(documentNode)
+
+        expanded = self._expand(documentNode, cached)
+
+        # record the references in the dependency graph
+        graph = LaTeXDependencyGraph()
+        for uri, child_uris in self._references.iteritems():
+            graph.set_children(uri, child_uris)
+
+        return expanded
+
+    def _resolve(self, node):
+        """
+        Build the filename of the child document referenced by an \input or
+        \include command (absolute/relative, with .tex/without .tex)
+
+        @return: a File object
+        @raise IndexError: if the command is malformed
+        """
+        target = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
+
+        file = None
+        if File.is_absolute(target):
+            # absolute path
+            # look for 'x' and then for 'x.tex'
+            file = File("%s.tex" % target)
+            if not file.exists:
+                file = File(target)
+        else:
+            # path relative to the master file's directory
+            # TODO: include TeX search path!
+            # look for 'x' and then for 'x.tex'
+            file = File.create_from_relative_path("%s.tex" % target, self._master_file.dirname)
+            if not file.exists:
+                file = File.create_from_relative_path(target, self._master_file.dirname)
 
-    def _expand(self, parentNode):
+        return file
+
+    def _collect(self, parentNode, files):
+        """
+        Collect the files referenced by \input and \include commands below
+        some nodes
+        """
+        for node in parentNode:
+            if node.type == Node.COMMAND and (node.value == "input" or node.value == "include"):
+                try:
+                    files.append(self._resolve(node))
+                except IndexError:
+                    pass
+            elif node.type == Node.DOCUMENT:
+                # don't follow documents expanded before
+                continue
+
+            self._collect(node, files)
+
+    def _prefetch(self, parentNode):
+        """
+        Let the cache parse all documents referenced below some nodes, level
+        by level, so that the expansion only takes them from the cache
+        """
+        seen = set()
+
+        files = []
+        self._collect(parentNode, files)
+
+        while len(files):
+            files = [file for file in files if not file.uri in seen and file.exists]
+            seen.update([file.uri for file in files])
+
+            self._document_cache.prefetch([file for file in files if not file.uri in self._overrides],
+                                          self._charset, parallel=True)
+
+            # the next level
+            next_files = []
+            for file in files:
+                fragment = self._overrides.get(file.uri)
+                if fragment is None:
+                    fragment = self._document_cache.peek_document(file)
+                if fragment is not None:
+                    self._collect(fragment, next_files)
+            files = next_files
+
+    def _expand(self, parentNode, cached):
         """
         Recursively walk all nodes in the document model and check for \input or \include
         commands. Extract the filename from the command and parse the referenced file.
         Attach its model as a DOCUMENT node to the master model and hold its filename as
         the value of that DOCUMENT node, so that the Validator may differ between issue
         sources.
+
+        @param cached: True if parentNode belongs to a model from the cache
+        @return: parentNode or, if it is cached and something below it has been
+                expanded, a copy of it
         """
-        for node in parentNode:
+        copy = None
+
+        for i, node in enumerate(parentNode):
             if node.type == Node.COMMAND and (node.value == "input" or node.value == "include"):
-                try:
-                    # build child filename (absolute/relative, with .tex/without .tex)
-                    target = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-
-                    file = None
-                    if File.is_absolute(target):
-                        # absolute path
-                        # look for 'x' and then for 'x.tex'
-                        file = File("%s.tex" % target)
-                        if not file.exists:
-                            file = File(target)
-                    else:
-                        # path relative to the master file's directory
-                        # TODO: include TeX search path!
-                        # look for 'x' and then for 'x.tex'
-                        file = File.create_from_relative_path("%s.tex" % target, self._master_file.dirname)
-                        if not file.exists:
-                            file = File.create_from_relative_path(target, self._master_file.dirname)
-
-                    self._log.debug("Expanding %s" % file)
-
-                    # lookup/parse child document model
-                    try:
-                        fragment = self._document_cache.get_document(file, self._charset, self._issue_handler)
-
-                        node.append(fragment)
-                    except IOError:
-                        self._log.error("Referenced file not found: %s" % file.uri)
-                except IndexError:
-                    self._log.error("Malformed reference command at %s" % node.start)
+                expanded = self._expand_reference(node, cached)
+            else:
+                expanded = self._expand(node, cached)
+
+            if expanded is not node:
+                # only happens below a cached node
+                if copy is None:
+                    copy = parentNode.copy()
+                copy[i] = expanded
+                expanded.parent = copy
+
+        if copy is None:
+            return parentNode
+        return copy
+
+    def _expand_reference(self, node, cached):
+        """
+        Expand an \input or \include command
+
+        @param cached: True if the node belongs to a model from the cache
+        @return: the node or, if it is cached, an expanded copy of it
+        """
+        try:
+            # build child filename
+            file = self._resolve(node)
+        except IndexError:
+            self._log.error("Malformed reference command at %s" % node.start)
+            return self._expand(node, cached)
+
+        self._log.debug("Expanding %s" % file)
+
+        if cached:
+            node = node.copy()
+
+        # the node may have been expanded before, drop the models appended then
+        node[:] = [child for child in node if child.type != Node.DOCUMENT]
+
+        references = self._references[self._stack[-1]]
+        if not file.uri in references:
+            references.append(file.uri)
+
+        if file.uri in self._stack:
+            self._issue_handler.issue(Issue("Cyclic reference: <b>%s</b> includes itself" % escape(file.basename),
+                                            node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
+            return node
+
+        self._stack.append(file.uri)
+        self._references.setdefault(file.uri, [])
+
+        # lookup/parse child document model
+        try:
+            fragment = self._overrides.get(file.uri)
+            if fragment is None:
+                cached_fragment = self._document_cache.get_document(file, self._charset, self._issue_handler)
+                fragment = self._expand(cached_fragment, True)
+            else:
+                cached_fragment = None
+                fragment = self._expand(fragment, False)
+
+            if fragment is cached_fragment:
+                # don't touch the parent of a cached model, it may be attached
+                # to other models, too
+                list.append(node, fragment)
+            else:
+                node.append(fragment)
+        except IOError:
+            self._log.error("Referenced file not found: %s" % file.uri)
+
+        self._stack.pop()
 
-            self._expand(node)
+        return node
 
 # ex:ts=4:et:
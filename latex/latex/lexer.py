@@ -22,45 +22,7 @@
 latex.lexer
 """
 
-class StringListener(object):
-    """
-    Recognizes a string in a stream of characters
-    """
-    def __init__(self, string, any_position=True):
-        """
-        @param string: the character sequence to be recognized
-        @param any_position: if True the sequence may occur at any position in
-                the stream, if False it must occur at the start
-        """
-        self._string = string
-        self._last = len(string)
-        self._pos = 0
-        self._any_position = any_position
-
-        self._active = True
-
-    def put(self, char):
-        """
-        Returns True if the string is recognized
-        """
-        if not self._active:
-            return False
-
-        if char == self._string[self._pos]:
-            self._pos += 1
-
-            if self._pos == self._last:
-                return True
-        else:
-            if self._any_position:
-                self._pos = 0
-            else:
-                self._active = False
-
-        return False
-
-
-from ..util import StringReader
+import re
 
 
 class Token(object):
@@ -92,12 +54,12 @@ class Token(object):
 class Lexer(object):
     """
     LaTeX lexer
-    """
-
-    # TODO: redesign and optimize this from a DFA
 
-    # states of the lexer
-    _DEFAULT, _BACKSLASH, _COMMAND, _TEXT, _COMMENT, _PRE_VERB, _VERB, _VERBATIM = range(8)
+    Instead of pulling the source through a per-character state machine, the
+    lexer jumps over runs of plain text, command names, comments and verbatim
+    bodies using compiled patterns and str.find(). The emitted tokens and
+    their offsets are the same as with the former state machine.
+    """
 
     _SPECIAL = set(["&", "$", "{", "}", "[", "]", "%", "#", "_", "\\"])
 
@@ -107,216 +69,171 @@ class Lexer(object):
 
     _VERBATIM_ENVIRONS = set(["verbatim", "verbatim*", "lstlisting", "lstlisting*"])
 
+    # a run of characters that don't end a TEXT token
+    _TEXT_RUN = r"[^&${}\[\]%#_\\]*"
 
-    # additional states for recognizing "\begin{verbatim}"
-    _VERBATIM_DEFAULT, _VERBATIM_BEGIN, _VERBATIM_BEGIN_CURLY, _VERBATIM_BEGIN_CURLY_ENVIRON = range(4)
-
+    # a run of characters that may appear in a command name
+    _NAME_RUN = r"[^&${}\[\]%#_\\\s]*"
 
-    def __init__(self, string, skipWs=True, skipComment=False):
-        self._reader = StringReader(string)
+    # whitespace is classified like str.isspace() and unicode.isspace() do,
+    # so we need separate patterns for both string types
+    _PATTERNS = { str : (re.compile(_TEXT_RUN), re.compile(_NAME_RUN)),
+                  unicode : (re.compile(_TEXT_RUN, re.UNICODE), re.compile(_NAME_RUN, re.UNICODE)) }
 
-        self._skipWs = skipWs
-        self._skipComment = skipComment
-
-        self._state = self._DEFAULT
-        self._verbatimState = self._VERBATIM_DEFAULT
+    # states for recognizing "\begin{verbatim}"
+    _VERBATIM_DEFAULT, _VERBATIM_BEGIN, _VERBATIM_BEGIN_CURLY, _VERBATIM_BEGIN_CURLY_ENVIRON = range(4)
 
-        self._eof = False
-        self._tokenStack = []    # used to return a sequence of tokens after a verbatim ended
+    def __init__(self, string, skipWs=True, skipComment=False, offset=0):
+        """
+        @param string: the LaTeX source
+        @param skipWs: if True TEXT tokens containing only whitespace are skipped
+        @param skipComment: if True no COMMENT tokens are returned
+        @param offset: the offset to start lexing at, this must be the offset of a
+                command token (used by incremental parsing)
+        """
+        self._tokens = self._scan(string, skipWs, skipComment, offset)
 
     def __iter__(self):
         return self
 
     def next(self):
-        if self._eof:
-            raise StopIteration
-
-        # first empty the token stack
-        if len(self._tokenStack):
-            return self._tokenStack.pop()
-
-        while True:
-            try:
-                char = self._reader.read()
-
-                if self._state == self._DEFAULT:
-                    if char == "\\":
-                        self._state = self._BACKSLASH
-                        self._verbatimState = self._VERBATIM_DEFAULT
-                        self._startOffset = self._reader.offset - 1
-
-                    elif char == "%":
-                        self._state = self._COMMENT
-                        self._verbatimState = self._VERBATIM_DEFAULT
-                        self._startOffset = self._reader.offset - 1
-                        if not self._skipComment:
-                            self._text = []
-
-                    elif char in self._TERMINALS:
-                        if self._verbatimState == self._VERBATIM_BEGIN and char == "{":
-                            self._verbatimState = self._VERBATIM_BEGIN_CURLY
-
-                        elif self._verbatimState == self._VERBATIM_BEGIN_CURLY_ENVIRON and char == "}":
-                            # we have "\begin{verbatim}"
-                            self._verbatimState = self._VERBATIM_DEFAULT
-                            self._state = self._VERBATIM
-                            self._text = []
-                            self._startOffset = self._reader.offset
-                            self._verbatimSequenceListener = StringListener("\\end{%s}" % self._verbatimEnviron)
-
-                        else:
-                            self._verbatimState = self._VERBATIM_DEFAULT
-
-                        return Token(self._TERMINALS_MAP[char], self._reader.offset - 1)
-
-                    else:
-                        self._state = self._TEXT
-                        self._startOffset = self._reader.offset - 1
-                        self._text = [char]
-
-                elif self._state == self._BACKSLASH:
-                    if char in self._SPECIAL or char.isspace():
-                        # this is a one-character-command, also whitespace is allowed
-                        self._state = self._DEFAULT
-                        return Token(Token.COMMAND, self._startOffset, char)
-
-                    else:
-                        self._state = self._COMMAND
-
-                        self._verbListener = StringListener("verb", any_position=False)
-                        self._verbListener.put(char)
-
-                        self._text = [char]
-
-                elif self._state == self._COMMENT:
-                    if char == "\n":
-                        self._state = self._DEFAULT
-                        if not self._skipComment:
-                            return Token(Token.COMMENT, self._startOffset, "".join(self._text))
-
-                    else:
-                        if not self._skipComment:
-                            self._text.append(char)
+        return self._tokens.next()
 
-                elif self._state == self._COMMAND:
-                    if char in self._SPECIAL or char.isspace():
-
-                        name = "".join(self._text)
-
-                        # this is mostly false because \verb is mostly followed by something like |
-                        if name == "verb":
-                            self._state = self._VERB
-                            self._verbDelimiter = char
-                            self._startOffset = self._reader.offset - 1
-                            self._text = [char]
-
-                        elif name == "url":     # we handle "\url" just like "\verb"
-                            self._state = self._VERB
-                            self._verbDelimiter = "}"
-                            self._startOffset = self._reader.offset - 1
-                            self._text = []
-
-                        else:
-                            self._state = self._DEFAULT
-                            self._reader.unread(char)
-
-                            if name == "begin":
-                                self._verbatimState = self._VERBATIM_BEGIN
-
-                            return Token(Token.COMMAND, self._startOffset, name)
-
-                    else:
-                        if self._verbListener.put(char):
-                            # we have "\verb"
-                            self._state = self._PRE_VERB
-                        else:
-                            self._text.append(char)
-
-                elif self._state == self._PRE_VERB:
-                    self._state = self._VERB
-                    self._verbDelimiter = char
-                    self._startOffset = self._reader.offset - 1
-                    self._text = []
-
-                elif self._state == self._TEXT:
-                    if char in self._SPECIAL:
-                        self._state = self._DEFAULT
-                        self._reader.unread(char)
-
-                        text = "".join(self._text)
-
-                        if self._skipWs and text.isspace():
-                            continue
-                        else:
-
-                            if self._verbatimState == self._VERBATIM_BEGIN_CURLY:
-                                # we have "\begin{" until now, handle verbatim environment
-
-                                if text in self._VERBATIM_ENVIRONS:
-                                    self._verbatimEnviron = text
-                                    self._verbatimState = self._VERBATIM_BEGIN_CURLY_ENVIRON
-
-                                else:
-                                    self._verbatimState = self._VERBATIM_DEFAULT
-
-                            return Token(Token.TEXT, self._startOffset, text)
-
-                    else:
-                        self._text.append(char)
-
-                elif self._state == self._VERB:
-                    if char == self._verbDelimiter:        # FIXME: \overbrace
-                        self._state = self._DEFAULT
-
-                        return Token(Token.VERBATIM, self._startOffset, "".join(self._text) + char)
-
-                    else:
-                        self._text.append(char)
-
-                elif self._state == self._VERBATIM:
-                    if self._verbatimSequenceListener.put(char):
-                        self._state = self._DEFAULT
-
-                        # TODO: calculate offsets
-                        self._tokenStack = [ Token(Token.END_CURLY, 0),
-                                             Token(Token.TEXT, 0, self._verbatimEnviron),
-                                             Token(Token.BEGIN_CURLY, 0),
-                                             Token(Token.COMMAND, 0, "end") ]
+    def _scan(self, string, skipWs, skipComment, offset):
+        """
+        Generate the tokens of a string
+        """
+        try:
+            text_run, name_run = self._PATTERNS[type(string)]
+        except KeyError:
+            text_run, name_run = self._PATTERNS[unicode]
+
+        match_text = text_run.match
+        match_name = name_run.match
+        find = string.find
+        special = self._SPECIAL
+        terminals = self._TERMINALS_MAP
+
+        length = len(string)
+        verbatim_state = self._VERBATIM_DEFAULT
+        verbatim_environ = None
+        i = offset
+
+        while i < length:
+            char = string[i]
+
+            if char == "\\":
+                verbatim_state = self._VERBATIM_DEFAULT
+
+                if i + 1 == length:
+                    yield Token(Token.COMMAND, i, "")
+                    return
+
+                char = string[i + 1]
+                if char in special or char.isspace():
+                    # this is a one-character-command, also whitespace is allowed
+                    yield Token(Token.COMMAND, i, char)
+                    i += 2
+                    continue
+
+                if string.startswith("verb", i + 1):
+                    # we have "\verb", the next character is the delimiter
+                    start = i + 5
+                    if start == length:
+                        return
+                    end = find(string[start], start + 1)
+                    if end == -1:
+                        # TODO: the document is malformed in this case, so the lexer should be
+                        # able to produce issues, too
+                        yield Token(Token.TEXT, start, string[start + 1:])
+                        return
+                    yield Token(Token.VERBATIM, start, string[start + 1:end + 1])
+                    i = end + 1
+                    continue
+
+                end = match_name(string, i + 1).end()
+                name = string[i + 1:end]
+
+                if end == length:
+                    yield Token(Token.COMMAND, i, name)
+                    return
+
+                if name == "url":
+                    # we handle "\url" just like "\verb" with "}" as delimiter
+                    start = end
+                    end = find("}", start + 1)
+                    if end == -1:
+                        yield Token(Token.TEXT, start, string[start + 1:])
+                        return
+                    yield Token(Token.VERBATIM, start, string[start + 1:end + 1])
+                    i = end + 1
+                    continue
+
+                if name == "begin":
+                    verbatim_state = self._VERBATIM_BEGIN
+
+                yield Token(Token.COMMAND, i, name)
+                i = end
+
+            elif char == "%":
+                verbatim_state = self._VERBATIM_DEFAULT
+
+                end = find("\n", i + 1)
+                if end == -1:
+                    # an unterminated comment at the end is dropped
+                    return
+                if not skipComment:
+                    yield Token(Token.COMMENT, i, string[i + 1:end])
+                i = end + 1
+
+            elif char in terminals:
+                if verbatim_state == self._VERBATIM_BEGIN and char == "{":
+                    verbatim_state = self._VERBATIM_BEGIN_CURLY
+
+                elif verbatim_state == self._VERBATIM_BEGIN_CURLY_ENVIRON and char == "}":
+                    # we have "\begin{verbatim}", so jump to "\end{verbatim}"
+                    verbatim_state = self._VERBATIM_DEFAULT
+
+                    yield Token(Token.END_CURLY, i)
+
+                    start = i + 1
+                    end = find("\\end{%s}" % verbatim_environ, start)
+                    if end == -1:
+                        return
+
+                    yield Token(Token.VERBATIM, start, string[start:end])
+                    yield Token(Token.COMMAND, end, "end")
+                    yield Token(Token.BEGIN_CURLY, end + 4)
+                    yield Token(Token.TEXT, end + 5, verbatim_environ)
+                    i = end + 5 + len(verbatim_environ)
+                    yield Token(Token.END_CURLY, i)
+                    i += 1
+                    continue
+
+                else:
+                    verbatim_state = self._VERBATIM_DEFAULT
+
+                yield Token(terminals[char], i)
+                i += 1
 
-                        text = "".join(self._text)
-                        text = text[5:]        # cut off "\end{"
-                        return Token(Token.VERBATIM, self._startOffset, text)
+            else:
+                end = match_text(string, i + 1).end()
+                text = string[i:end]
+                start = i
+                i = end
+
+                if skipWs and text.isspace():
+                    continue
+
+                if verbatim_state == self._VERBATIM_BEGIN_CURLY:
+                    # we have "\begin{" until now, handle verbatim environment
+                    if text in self._VERBATIM_ENVIRONS:
+                        verbatim_environ = text
+                        verbatim_state = self._VERBATIM_BEGIN_CURLY_ENVIRON
                     else:
-                        self._text.append(char)
-
-                elif self._state == self._VERB:
-                    # this char is the verb delimiter
-                    # TODO: implement verbatim detection
-                    pass
-
-            except StopIteration:
-                self._eof = True
-
-                # evaluate final state
-                if self._state == self._BACKSLASH:
-                    return Token(Token.COMMAND, self._startOffset, "")
-
-                elif self._state == self._COMMAND:
-                    return Token(Token.COMMAND, self._startOffset, "".join(self._text))
-
-                elif self._state == self._TEXT:
-                    text = "".join(self._text)
-                    if not (self._skipWs and text.isspace()):
-                        return Token(Token.TEXT, self._startOffset, text)
-
-                elif self._state == self._VERB:
+                        verbatim_state = self._VERBATIM_DEFAULT
 
-                    # TODO: the document is malformed in this case, so the lexer should be
-                    # able to produce issues, too
-                    #
-                    # TODO: return a VERBATIM token
+                yield Token(Token.TEXT, start, text)
 
-                    return Token(Token.TEXT, self._startOffset, "".join(self._text))
 
-                raise StopIteration
 # ex:ts=4:et:
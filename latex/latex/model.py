@@ -130,7 +130,7 @@ class Placeholder(Element):
 #LanguageModel is pickled to save startup time...
 #using pickle is dangerous. If you add or change the instance members of this class
 #that need to persis through pickle, then INCREMENT THE VERSION
-LANGUAGE_MODEL_VERSION = 1
+LANGUAGE_MODEL_VERSION = 2
 
 class LanguageModel(object):
     """
@@ -147,6 +147,7 @@ class LanguageModel(object):
 
         #some latex specific helpers.
         self.__new_ref_commands = {}
+        self.__command_aliases = {}    # maps redefined command names to the original ones
 
     def find_command(self, prefix):
         """
@@ -178,11 +179,31 @@ class LanguageModel(object):
     def is_ref_command(self, cmd_name):
         return (cmd_name in self.REF_CMDS) or (cmd_name in self.__new_ref_commands) 
 
+    @property
+    def ref_commands(self):
+        """
+        Return the names of all commands referencing a label
+        """
+        return self.REF_CMDS | set(self.__new_ref_commands)
+
+    @property
+    def command_aliases(self):
+        """
+        Return a dict mapping the names of commands defined by \\newcommand as a
+        wrapper of another command to the name of that command
+        """
+        return dict(self.__command_aliases)
+
     def set_newcommands(self, outlinenodes):
         LOG.debug("set newcommands")
 
+        # ref_commands and command_aliases are read by the LaTeXAnalyzer
+        # thread, so their dicts are replaced when they are complete instead
+        # of being changed
+        new_ref_commands = {}
+        command_aliases = {}
+
         #remove old state
-        self.__new_ref_commands = {}
         for name in self.__newcommands:
             del(self.commands[name])
         self.__newcommands = []
@@ -199,9 +220,10 @@ class LanguageModel(object):
 
                 self.commands[o.value] = old
                 self.__newcommands.append(o.value)
+                command_aliases[o.value] = o.oldcmd
 
                 if o.oldcmd in self.REF_CMDS:
-                    self.__new_ref_commands[o.value] = 1
+                    new_ref_commands[o.value] = 1
 
             else:
                 #add a generic completer
@@ -212,6 +234,9 @@ class LanguageModel(object):
                 self.commands[command.name] = command
                 self.__newcommands.append(command.name)
 
+        self.__new_ref_commands = new_ref_commands
+        self.__command_aliases = command_aliases
+
 from xml import sax
 
 class LanguageModelParser(sax.ContentHandler):
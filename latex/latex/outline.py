@@ -25,6 +25,7 @@ latex.outline
 from logging import getLogger
 
 from parser import Node
+from walker import LaTeXWalker
 from ..issues import Issue
 
 
@@ -62,6 +63,7 @@ class Outline(object):
         self.rootNode = OutlineNode(OutlineNode.ROOT, level=0)
         self.labels = []            # OutlineNode objects
         self.bibliographies = []    # File objects
+        self.graphics = []          # the paths of the included images, set by the LaTeXValidator
         self.colors = []
         self.packages = []           # OutlineNode objects
         self.newcommands = []        # OutlineNode objects
@@ -102,6 +104,21 @@ class LaTeXOutlineGenerator(object):
         Generates an outline model from a document model and returns a list
         of list of issues if some occured.
         """
+        walker = LaTeXWalker()
+        self.attach(walker, issue_handler)
+        walker.walk(documentNode)
+        return self.finish()
+
+    def attach(self, walker, issue_handler, root=None):
+        """
+        Register with a LaTeXWalker, to generate the outline while the walker
+        runs other analyses, too. Call finish() after the walk.
+
+        @param walker: a LaTeXWalker
+        @param issue_handler: an object implementing IIssueHandler
+        @param root: generate the outline only of this DOCUMENT node, e.g. an
+                expanded child document, None for the whole model
+        """
 
         # setup
         self.cfgLabelsInTree = Preferences().get("outline-show-labels")
@@ -113,165 +130,160 @@ class LaTeXOutlineGenerator(object):
 
         self._labelCache = {}
 
-#        self._file = documentNode.value        # this is updated when a DOCUMENT occurs
+        self._issue_handler = issue_handler
 
-        self._walk(documentNode, issue_handler)
+        handlers = { "label" : self._on_label,
+                     "usepackage" : self._on_usepackage,
+                     "bibliography" : self._on_bibliography,
+                     "definecolor" : self._on_definecolor,
+                     "xdefinecolor" : self._on_definecolor,
+                     "newcommand" : self._on_newcommand,
+                     "newenvironment" : self._on_newenvironment,
+                     "newtheorem" : self._on_newenvironment }
 
-        return self._outline
+        for name in self._STRUCTURE_LEVELS.keys():
+            handlers[name] = self._on_structure
+        if self.cfgTablesInTree:
+            handlers["begin"] = self._on_begin
+        if self.cfgGraphicsInTree:
+            handlers["includegraphics"] = self._on_includegraphics
 
-    def _walk(self, parentNode, issue_handler, foreign=False):
-        """
-        Recursively walk a node in the document model
+        self._scope = walker.add(handlers, root)
 
-        foreign        if True this node is a child of a reference node, so it's coming
-                    from an expanded reference
+    def finish(self):
+        """
+        @return: the outline model or None if the walker has not met the root
         """
+        self._issue_handler = None
+
+        if not self._scope.entered:
+            return None
+        return self._outline
 
-        childForeign = foreign
-
-        for node in parentNode:
-#            if node.type == Node.DOCUMENT:
-#                self._file = node.value
-            if node.type == Node.COMMAND:
-                if node.value in self._STRUCTURE_LEVELS.keys():
-                    try:
-                        headline = node.firstOfType(Node.MANDATORY_ARGUMENT).innerMarkup
-                        level = self._STRUCTURE_LEVELS[node.value]
-                        outlineNode = OutlineNode(OutlineNode.STRUCTURE, node.start, node.lastEnd, headline, level, foreign, file=node.file)
-
-                        while self._stack[-1].level >= level:
-                            self._stack.pop()
-
-                        self._stack[-1].append(outlineNode)
-                        self._stack.append(outlineNode)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed structure command", node.start, node.end, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "label":
-                    try:
-                        value = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-
-                        if value in self._labelCache.keys():
-                            start, end = self._labelCache[value]
-                            issue_handler.issue(Issue("Label <b>%s</b> has already been defined" % value, start, end, node.file, Issue.SEVERITY_ERROR))
-                        else:
-                            self._labelCache[value] = (node.start, node.lastEnd)
-
-                            labelNode = OutlineNode(OutlineNode.LABEL, node.start, node.lastEnd, value, foreign=foreign, file=node.file)
-
-                            self._outline.labels.append(labelNode)
-                            if self.cfgLabelsInTree:
-                                self._stack[-1].append(labelNode)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-#                elif node.value == "begin":
-#                    environment = str(node.filter(Node.MANDATORY_ARGUMENT)[0][0])
-#                    if environment == "lstlisting":
-#                        # look for label in listing environment
-#                        try:
-#                            # TODO: Node should have a method like toDict() or something
-#                            optionNode = node.filter(Node.OPTIONAL_ARGUMENT)[0]
-#                            option = "".join([str(child) for child in optionNode])
-#                            for pair in option.split(","):
-#                                key, value = pair.split("=")
-#                                if key.strip() == "label":
-#                                    labelNode = OutlineNode(OutlineNode.LABEL, node.start, node.end, value.strip())
-#                                    outline.labels.append(labelNode)
-#                                    if self.cfgLabelsInTree:
-#                                        stack[-1].append(labelNode)
-#                        except IndexError:
-#                            pass
-
-                elif node.value == "usepackage":
-                    try:
-                        package = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        packageNode = OutlineNode(OutlineNode.PACKAGE, node.start, node.lastEnd, package, file=node.file)
-                        self._outline.packages.append(packageNode)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.end, node.file, Issue.SEVERITY_ERROR))
-
-                elif self.cfgTablesInTree and node.value == "begin":
-                    try:
-                        environ = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        if environ == "tabular":
-                            tableNode = OutlineNode(OutlineNode.TABLE, node.start, node.lastEnd, "", foreign=foreign, file=node.file)
-                            self._stack[-1].append(tableNode)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif self.cfgGraphicsInTree and node.value == "includegraphics":
-                    try:
-                        target = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        graphicsNode = OutlineNode(OutlineNode.GRAPHICS, node.start, node.lastEnd, target, foreign=foreign, file=node.file)
-                        self._stack[-1].append(graphicsNode)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "bibliography":
-                    try:
-                        value = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        for bib in value.split(","):
-                            self._outline.bibliographies.append(File("%s/%s.bib" % (node.file.dirname, bib)))
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "definecolor" or node.value == "xdefinecolor":
-                    try:
-                        name = str(node.firstOfType(Node.MANDATORY_ARGUMENT)[0])
-                        self._outline.colors.append(name)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "newcommand":
-                    try:
-                        name = str(node.firstOfType(Node.MANDATORY_ARGUMENT)[0])[1:]    # remove "\"
-                        try:
-                            nArgs = int(node.filter(Node.OPTIONAL_ARGUMENT)[0].innerText)
-                        except IndexError:
-                            nArgs = 0
-                        except Exception:
-                            issue_handler.issue(Issue("Malformed newcommand", node.start, node.end, node.file, Issue.SEVERITY_ERROR))
-                            nArgs = 0
-
-                        #if the command has only one argument, be smart and see if it is a redefinition of an
-                        #existing latex command
-                        oldcmd = None
-                        if nArgs == 1:
-                            oldcommandnode = None
-                            newcommandsnode = node.filter(Node.MANDATORY_ARGUMENT)[1]
-                            #find the command that takes the '#1' argument
-                            for i in newcommandsnode.filter(Node.COMMAND):
-                                for j in i.filter(Node.MANDATORY_ARGUMENT):
-                                    if j.innerText == "#1":
-                                        oldcommandnode = i
-                            if oldcommandnode:
-                                oldcmd = i.value
-
-                        ncNode = OutlineNode(OutlineNode.NEWCOMMAND, node.start, node.lastEnd, name, numOfArgs=nArgs, file=node.file, oldcmd=oldcmd)
-                        self._outline.newcommands.append(ncNode)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                    # don't walk through \newcommand
-                    continue
-
-                elif node.value in ["newenvironment", "newtheorem"]:
-                    try:
-                        name = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        #try:
-                        #    n_args = int(node.firstOfType(Node.OPTIONAL_ARGUMENT).innerText)
-                        #except IndexError:
-                        #    n_args = 0
-                        ne_node = OutlineNode(OutlineNode.NEWENVIRONMENT, node.start, node.lastEnd, name, numOfArgs=0, file=node.file)
-                        self._outline.newenvironments.append(ne_node)
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "include" or node.value == "input":
-                    childForeign = True
-
-            self._walk(node, issue_handler, childForeign)
+    def _malformed(self, node, end=None):
+        if end is None:
+            end = node.lastEnd
+        self._issue_handler.issue(Issue("Malformed command", node.start, end, node.file, Issue.SEVERITY_ERROR))
+
+    def _on_structure(self, command):
+        node = command.node
+        try:
+            headline = command.markup
+            level = self._STRUCTURE_LEVELS[node.value]
+            outlineNode = OutlineNode(OutlineNode.STRUCTURE, node.start, node.lastEnd, headline, level, command.foreign, file=node.file)
+
+            while self._stack[-1].level >= level:
+                self._stack.pop()
+
+            self._stack[-1].append(outlineNode)
+            self._stack.append(outlineNode)
+        except IndexError:
+            self._issue_handler.issue(Issue("Malformed structure command", node.start, node.end, node.file, Issue.SEVERITY_ERROR))
+
+    def _on_label(self, command):
+        node = command.node
+        try:
+            value = command.text
+
+            if value in self._labelCache:
+                start, end = self._labelCache[value]
+                self._issue_handler.issue(Issue("Label <b>%s</b> has already been defined" % value, start, end, node.file, Issue.SEVERITY_ERROR))
+            else:
+                self._labelCache[value] = (node.start, node.lastEnd)
+
+                labelNode = OutlineNode(OutlineNode.LABEL, node.start, node.lastEnd, value, foreign=command.foreign, file=node.file)
+
+                self._outline.labels.append(labelNode)
+                if self.cfgLabelsInTree:
+                    self._stack[-1].append(labelNode)
+        except IndexError:
+            self._malformed(node)
+
+    def _on_usepackage(self, command):
+        node = command.node
+        try:
+            packageNode = OutlineNode(OutlineNode.PACKAGE, node.start, node.lastEnd, command.text, file=node.file)
+            self._outline.packages.append(packageNode)
+        except IndexError:
+            self._malformed(node, node.end)
+
+    def _on_begin(self, command):
+        node = command.node
+        try:
+            if command.text == "tabular":
+                tableNode = OutlineNode(OutlineNode.TABLE, node.start, node.lastEnd, "", foreign=command.foreign, file=node.file)
+                self._stack[-1].append(tableNode)
+        except IndexError:
+            self._malformed(node)
+
+    def _on_includegraphics(self, command):
+        node = command.node
+        try:
+            graphicsNode = OutlineNode(OutlineNode.GRAPHICS, node.start, node.lastEnd, command.text, foreign=command.foreign, file=node.file)
+            self._stack[-1].append(graphicsNode)
+        except IndexError:
+            self._malformed(node)
+
+    def _on_bibliography(self, command):
+        node = command.node
+        try:
+            for bib in command.text.split(","):
+                self._outline.bibliographies.append(File("%s/%s.bib" % (node.file.dirname, bib)))
+        except IndexError:
+            self._malformed(node)
+
+    def _on_definecolor(self, command):
+        try:
+            name = str(command.argument[0])
+            self._outline.colors.append(name)
+        except IndexError:
+            self._malformed(command.node)
+
+    def _on_newcommand(self, command):
+        node = command.node
+        try:
+            name = str(command.argument[0])[1:]    # remove "\"
+            try:
+                nArgs = int(node.filter(Node.OPTIONAL_ARGUMENT)[0].innerText)
+            except IndexError:
+                nArgs = 0
+            except Exception:
+                self._issue_handler.issue(Issue("Malformed newcommand", node.start, node.end, node.file, Issue.SEVERITY_ERROR))
+                nArgs = 0
+
+            #if the command has only one argument, be smart and see if it is a redefinition of an
+            #existing latex command
+            oldcmd = None
+            if nArgs == 1:
+                oldcommandnode = None
+                newcommandsnode = node.filter(Node.MANDATORY_ARGUMENT)[1]
+                #find the command that takes the '#1' argument
+                for i in newcommandsnode.filter(Node.COMMAND):
+                    for j in i.filter(Node.MANDATORY_ARGUMENT):
+                        if j.innerText == "#1":
+                            oldcommandnode = i
+                if oldcommandnode:
+                    oldcmd = i.value
+
+            ncNode = OutlineNode(OutlineNode.NEWCOMMAND, node.start, node.lastEnd, name, numOfArgs=nArgs, file=node.file, oldcmd=oldcmd)
+            self._outline.newcommands.append(ncNode)
+        except IndexError:
+            self._malformed(node)
+
+        # don't walk through \newcommand
+        return True
+
+    def _on_newenvironment(self, command):
+        node = command.node
+        try:
+            #try:
+            #    n_args = int(node.firstOfType(Node.OPTIONAL_ARGUMENT).innerText)
+            #except IndexError:
+            #    n_args = 0
+            ne_node = OutlineNode(OutlineNode.NEWENVIRONMENT, node.start, node.lastEnd, command.text, numOfArgs=0, file=node.file)
+            self._outline.newenvironments.append(ne_node)
+        except IndexError:
+            self._malformed(node)
 
 
 # ex:ts=4:et:
@@ -25,27 +25,53 @@ LaTeX parser and object model
 """
 
 from re import compile
+from weakref import ref
 
 from ..util import verbose, escape
-from ..issues import Issue
+from ..issues import Issue, CollectingIssueHandler
+
+
+# Document models are stored on disk by the LaTeXDocumentCache. If you change
+# the lexer or parser in a way that changes the resulting model, then
+# INCREMENT THE VERSION
+PARSER_VERSION = 1
 
 
 class Node(list):
     """
     This is the base class of the LaTeX object model
+
+    A large document consists of hundreds of thousands of nodes, so the nodes
+    use __slots__ instead of a __dict__ and refer to their parent weakly. The
+    tree has no reference cycles and is freed as soon as the root is dropped.
     """
 
+    __slots__ = ("type", "value", "_parent", "closed", "__weakref__")
+
     DOCUMENT, COMMAND, MANDATORY_ARGUMENT, OPTIONAL_ARGUMENT, TEXT, EMBRACED = range(6)
 
     def __init__(self, type, value=None):
         self.type = type
         self.value = value
-        self.parent = None
+        self._parent = None
 
         # this indicates if an argument is closed or not
         # (only used by the PrefixParser)
         self.closed = False
 
+    def _get_parent(self):
+        if self._parent is None:
+            return None
+        return self._parent()
+
+    def _set_parent(self, node):
+        if node is None:
+            self._parent = None
+        else:
+            self._parent = ref(node)
+
+    parent = property(_get_parent, _set_parent)
+
     def firstOfType(self, type):
         """
         Return the first child node of a given type
@@ -159,6 +185,17 @@ class Node(list):
         node.parent = self
         list.append(self, node)
 
+    def copy(self):
+        """
+        Return a shallow copy of this node
+
+        The children are shared with this node, they keep it as their parent.
+        """
+        node = Node(self.type, self.value)
+        node.closed = self.closed
+        list.extend(node, self)
+        return node
+
     def find(self, value):
         """
         Find child node with given value (recursive, so grand-children are found, too)
@@ -166,11 +203,14 @@ class Node(list):
         # TODO
 
     def destroy(self):
-        # This is important, python cannot automatically free this
-        # object because of cyclic references (it is doubly linked)
-        self.parent = None
-        for child in self:
-            child.destroy()
+        """
+        Detach the children of this node
+
+        The parent links are weak, so this is not necessary for freeing the
+        tree. It must not recurse into the DOCUMENT nodes the LaTeXReferenceExpander
+        appended to \\input commands, these are owned by the LaTeXDocumentCache.
+        """
+        self._parent = None
         del self[:]
 
     #~ def __del__(self):
@@ -188,6 +228,8 @@ class Document(Node):
 
     # TODO: implement a generic interface for searching the document model
 
+    __slots__ = ("_is_master_called", "_is_master", "_end_of_document", "_end_of_packages")
+
     def __init__(self, file):
         Node.__init__(self, Node.DOCUMENT, file)
 
@@ -197,6 +239,12 @@ class Document(Node):
         self._end_of_document = None
         self._end_of_packages = None
 
+    def copy(self):
+        # see Node.copy
+        document = Document(self.value)
+        list.extend(document, self)
+        return document
+
     def _do_is_master(self):
         # TODO: this should be recursive
 
@@ -277,18 +325,36 @@ class Document(Node):
 
         return self._end_of_packages
 
+    def invalidate(self):
+        """
+        Forget the properties determined from the model, this is necessary
+        after the model has been changed by LaTeXParser.reparse
+        """
+        self._is_master_called = False
+        self._end_of_document = None
+        self._end_of_packages = None
+
 
 class LocalizedNode(Node):
     """
     This Node type holds the start and end offsets of the substring it belongs to
     in the source
     """
+    __slots__ = ("start", "end", "file")
+
     def __init__(self, type, start, end, value=None, file=None):
         Node.__init__(self, type, value)
         self.start = start
         self.end = end
         self.file = file
 
+    def copy(self):
+        # see Node.copy
+        node = LocalizedNode(self.type, self.start, self.end, self.value, self.file)
+        node.closed = self.closed
+        list.extend(node, self)
+        return node
+
     @property
     def lastEnd(self):
         """
@@ -304,6 +370,19 @@ class LocalizedNode(Node):
             # FIXME: why can this happen?
             return self.end
 
+    def shift(self, delta):
+        """
+        Move this node and its children by a number of characters
+
+        Expanded child documents (DOCUMENT nodes) come from other files and
+        are not moved.
+        """
+        self.start += delta
+        self.end += delta
+        for node in self:
+            if node.type != Node.DOCUMENT:
+                node.shift(delta)
+
 
 class FatalParseException(Exception):
     """
@@ -365,6 +444,148 @@ class LaTeXParser(object):
 
         return document_node
 
+    def reparse(self, string, document_node, file, issues, start, old_end, new_end):
+        """
+        Update a document model after a range of its source has been edited
+
+        Lexing and parsing restart at the last top-level command before the edited
+        range and stop as soon as a top-level command of the old model is met again
+        behind it. Only the top-level nodes in between are replaced, the following
+        ones are shifted.
+
+        @param string: the edited LaTeX source
+        @param document_node: the Document parsed from the source before the edit
+        @param file: the File object of the source
+        @param issues: the list of Issues found while parsing document_node, this is
+                updated, too
+        @param start: the offset where the edited range starts
+        @param old_end: the end offset of the edited range before the edit
+        @param new_end: the end offset of the edited range after the edit
+
+        @return: the list of new top-level nodes
+        """
+        delta = new_end - old_end
+
+        # find the last top-level command starting before the edited range,
+        # the lexer is in its initial state there
+        lo, hi = 0, len(document_node)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if document_node[mid].start < start:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        first = lo - 1
+        while first >= 0 and not self._is_restart_point(document_node[first]):
+            first -= 1
+
+        if first < 0:
+            first = 0
+            restart = 0
+        else:
+            restart = document_node[first].start
+
+        holder = Node(Node.DOCUMENT, file)
+        self._stack = [holder]
+
+        issue_handler = CollectingIssueHandler()
+
+        callables = {
+                Token.COMMAND : self.command,
+                Token.TEXT : self.text,
+                Token.BEGIN_CURLY : self.beginCurly,
+                Token.END_CURLY : self.endCurly,
+                Token.BEGIN_SQUARE : self.beginSquare,
+                Token.END_SQUARE : self.endSquare,
+                Token.COMMENT : self.comment,
+                Token.VERBATIM : self.verbatim }
+
+        # the top-level commands behind the edited range are the points where
+        # the new token stream may meet the old model again
+        length = len(document_node)
+        candidate = lo
+        last = length
+        resync = None
+        fatal = False
+
+        try:
+            for token in Lexer(string, offset=restart):
+                if token.type == Token.COMMAND and token.offset >= new_end and self._at_top_level:
+                    while candidate < length and document_node[candidate].start + delta < token.offset:
+                        candidate += 1
+
+                    if candidate < length and document_node[candidate].start + delta == token.offset \
+                            and document_node[candidate].type == Node.COMMAND:
+                        # we're back in sync with the old model
+                        last = candidate
+                        resync = document_node[candidate].start
+                        break
+
+                callables[token.type].__call__(token.value, token.offset, file, issue_handler)
+        except FatalParseException:
+            # the old model ended at the same point, so there is nothing to reuse
+            fatal = True
+
+        if resync is None and not fatal:
+            # check stack remainder
+            for node in self._stack:
+                if node.type == Node.MANDATORY_ARGUMENT or node.type == Node.EMBRACED:
+                    issue_handler.issue(Issue("Unclosed {", node.start, node.start + 1, file, Issue.SEVERITY_ERROR))
+                elif node.type == Node.OPTIONAL_ARGUMENT:
+                    issue_handler.issue(Issue("Unclosed [", node.start, node.start + 1, file, Issue.SEVERITY_ERROR))
+
+        # replace the reparsed nodes
+        for node in document_node[first:last]:
+            node.destroy()
+
+        nodes = list(holder)
+        for node in nodes:
+            node.parent = document_node
+        document_node[first:last] = nodes
+        del holder[:]
+
+        # move the nodes behind
+        if delta:
+            for node in document_node[first + len(nodes):]:
+                node.shift(delta)
+
+        # update the issues in the same way
+        kept_issues = [issue for issue in issues if issue.start < restart]
+        moved_issues = []
+        if resync is not None:
+            moved_issues = [issue for issue in issues if issue.start >= resync]
+            if delta:
+                for issue in moved_issues:
+                    issue.start += delta
+                    issue.end += delta
+        issues[:] = kept_issues + issue_handler.issues + moved_issues
+
+        document_node.invalidate()
+
+        return nodes
+
+    def _is_restart_point(self, node):
+        """
+        Return True if lexing may start again at the given top-level node
+
+        This is any command except the "\\end{verbatim}" that closes a verbatim
+        environment, the lexer only finds it while skipping the environment.
+        """
+        if node.type != Node.COMMAND:
+            return False
+        if node.value == "end" and len(node) and len(node[0]) \
+                and node[0][0].value in Lexer._VERBATIM_ENVIRONS:
+            return False
+        return True
+
+    @property
+    def _at_top_level(self):
+        """
+        Return True if the next command would become a top-level node
+        """
+        return len(self._stack) == 1 or (len(self._stack) == 2 and self._stack[1].type != Node.EMBRACED)
+
     # TODO: rename methods from "command()" to "_on_command()"
 
     def command(self, value, offset, file, issue_handler):
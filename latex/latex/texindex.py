@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+latex.texindex
+
+An index of the files of the TeX distribution
+"""
+
+import os
+import time
+import marshal
+import zlib
+from os import popen
+from logging import getLogger
+from threading import Lock
+
+
+class TeXFileIndex(object):
+    """
+    This lists the files in the TEXMF trees of the TeX distribution, so that
+    lookups don't have to run kpsewhich or find.
+
+    The trees having an ls-R database (see mktexlsr) are read from it, the
+    result is stored in a file and only read again if one of the databases
+    has changed. Other trees (like ~/texmf) are small and are scanned.
+
+    The databases are checked for changes at most every CHECK_INTERVAL
+    seconds. A database still lists the files removed after it has been
+    written, so a file that is found is looked up on the disk, too.
+    """
+
+    # If you change the layout of the stored index, then INCREMENT THE VERSION
+    FORMAT_VERSION = 1
+
+    _DATABASE_NAME = "ls-R"
+
+    CHECK_INTERVAL = 10
+
+    _log = getLogger("TeXFileIndex")
+
+    def __init__(self, search_paths, filename, config_filename=None):
+        """
+        @param search_paths: the TEXMF root directories known from the configuration
+        @param filename: the file to store the index in
+        @param config_filename: the TeX configuration file, the stored index is
+                dropped if it has changed
+        """
+        self._search_paths = search_paths
+        self._filename = filename
+        self._config_filename = config_filename
+
+        self._loaded = False
+        self._checked = 0          # the time the databases have been checked last
+        self._key_loaded = None    # the result of _key for the loaded databases
+        self._databases = []
+        self._roots = []           # the TEXMF root directories
+        self._directories = {}     # { absolute directory -> list of file names }
+        self._names = {}           # { file name -> list of absolute directories }
+        self._lock = Lock()
+
+    @property
+    def available(self):
+        """
+        Return True if at least one TEXMF tree has been found
+        """
+        with self._lock:
+            self._update()
+            return len(self._roots) > 0
+
+    def exists(self, name):
+        """
+        Return True if a file with a given name exists in one of the trees
+
+        @param name: a file name like 'plain.bst'
+        """
+        name = os.path.basename(name)
+        with self._lock:
+            self._update()
+            directories = self._names.get(name, [])
+
+        # the file may have been removed after the database has been written
+        for directory in directories:
+            if os.path.exists(os.path.join(directory, name)):
+                return True
+        return False
+
+    def find(self, relative, extension):
+        """
+        Return the paths of all files with an extension below a directory of
+        the trees
+
+        @param relative: a path relative to the TEXMF roots, e.g. '/tex/latex/base/'
+        @param extension: the file extension, e.g. '.cls'
+        """
+        paths = []
+        with self._lock:
+            self._update()
+
+            prefixes = [root.rstrip("/") + relative for root in self._roots]
+
+            for directory, names in self._directories.iteritems():
+                directory_slash = directory + "/"
+                for prefix in prefixes:
+                    if directory_slash.startswith(prefix):
+                        paths += [os.path.join(directory, name) for name in names if name.endswith(extension)]
+                        break
+
+        # the files may have been removed after the database has been written
+        return [path for path in paths if os.path.exists(path)]
+
+    def _update(self):
+        """
+        Load the index or load it again if a database has changed, called
+        with the lock held
+        """
+        if self._loaded:
+            now = time.time()
+            if now - self._checked < self.CHECK_INTERVAL:
+                return
+            self._checked = now
+            if self._key(self._databases) == self._key_loaded:
+                return
+            self._log.debug("A database has changed, loading the index again")
+            self._directories = {}
+
+        self._loaded = True
+        self._checked = time.time()
+
+        databases = self._load_stored()
+        if databases is None:
+            databases = self._find_databases()
+            for database in databases:
+                self._read_database(database)
+            self._store(databases)
+
+        self._databases = databases
+        self._key_loaded = self._key(databases)
+        self._roots = [os.path.dirname(database) for database in databases]
+
+        # scan the other trees
+        for search_path in self._search_paths:
+            if not os.path.isdir(search_path) or search_path in self._roots:
+                continue
+            self._roots.append(search_path)
+            for directory, dirnames, filenames in os.walk(search_path):
+                self._directories[directory] = filenames
+
+        self._names = {}
+        for directory, names in self._directories.iteritems():
+            for name in names:
+                self._names.setdefault(name, []).append(directory)
+
+        self._log.debug("Indexed %d files in %s" % (len(self._names), self._roots))
+
+    def _find_databases(self):
+        """
+        Return the paths of the ls-R databases of the distribution
+        """
+        databases = []
+        try:
+            # one call for all trees kpathsea knows
+            databases = [line.strip() for line in popen("kpsewhich -all %s 2>/dev/null" % self._DATABASE_NAME).readlines()]
+        except OSError:
+            pass
+
+        for search_path in self._search_paths:
+            databases.append(os.path.join(search_path, self._DATABASE_NAME))
+
+        found = []
+        for database in databases:
+            database = os.path.abspath(database)
+            if os.path.isfile(database) and not database in found:
+                found.append(database)
+        return found
+
+    def _read_database(self, database):
+        """
+        Parse an ls-R database
+
+        It lists the files of its directory and then starts a section like
+        './tex/latex/base:' for each sub-directory.
+        """
+        root = os.path.dirname(database)
+        names = self._directories.setdefault(root, [])
+
+        try:
+            f = open(database)
+        except IOError:
+            self._log.warning("Failed to read %s" % database, exc_info=True)
+            return
+
+        try:
+            for line in f:
+                line = line.rstrip("\n")
+                if not len(line) or line.startswith("%"):
+                    continue
+                if line.endswith(":"):
+                    directory = line[:-1]
+                    if not os.path.isabs(directory):
+                        directory = os.path.normpath(os.path.join(root, directory))
+                    names = self._directories.setdefault(directory, [])
+                else:
+                    names.append(line)
+        finally:
+            f.close()
+
+    def _key(self, databases):
+        """
+        Return the modification times the stored index depends on
+        """
+        paths = list(databases)
+        if self._config_filename is not None:
+            paths.append(self._config_filename)
+
+        key = []
+        for path in paths:
+            try:
+                key.append((path, os.stat(path).st_mtime))
+            except OSError:
+                key.append((path, None))
+        return key
+
+    def _load_stored(self):
+        """
+        Read the stored index
+
+        @return: the list of the databases it has been read from or None if
+                it is missing or outdated
+        """
+        try:
+            f = open(self._filename, "rb")
+            try:
+                version, key, payload = marshal.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+        if version != self.FORMAT_VERSION:
+            return None
+
+        databases = [path for path, mtime in key if path != self._config_filename]
+        if self._key(databases) != key:
+            self._log.debug("Stored index is outdated")
+            return None
+
+        try:
+            self._directories = marshal.loads(zlib.decompress(payload))
+        except (zlib.error, ValueError, EOFError, TypeError):
+            self._directories = {}
+            return None
+
+        return databases
+
+    def _store(self, databases):
+        if not len(databases):
+            return
+
+        payload = zlib.compress(marshal.dumps(self._directories))
+
+        # write to a temporary file first, so that readers never see half an index
+        temp_filename = "%s.%s.tmp" % (self._filename, os.getpid())
+        try:
+            f = open(temp_filename, "wb")
+            try:
+                marshal.dump((self.FORMAT_VERSION, self._key(databases), payload), f)
+            finally:
+                f.close()
+            os.rename(temp_filename, self._filename)
+        except (IOError, OSError):
+            self._log.warning("Failed to write %s" % self._filename, exc_info=True)
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
+
+# ex:ts=4:et:
@@ -24,13 +24,14 @@ latex.validator
 import os.path
 
 from logging import getLogger
-from os.path import exists
+from threading import Lock
 
 from ..file import File
+from ..dircache import DirectoryListingCache
 from ..issues import Issue
 from ..util import escape
 
-from parser import Node
+from walker import LaTeXWalker
 from environment import Environment
 from model import LanguageModelFactory
 
@@ -43,8 +44,43 @@ class LaTeXValidator(object):
 
      * unused labels
      * unclosed environments, also "\[" and "\]"
+
+    The checks are handlers for command names. Other commands may be checked
+    by registering a handler with register_command(). A command defined by
+    \\newcommand as a wrapper of a checked command is checked like the
+    wrapped one.
     """
 
+    # handlers registered by register_command(), the dict is read by the
+    # LaTeXAnalyzer thread, so it is replaced instead of being changed
+    _registered_handlers = {}    # { command name -> handler }
+    _registered_lock = Lock()
+
+    @staticmethod
+    def register_command(name, handler):
+        """
+        Register a check for a command, replacing a previously registered one.
+        The built-in checks take precedence.
+
+        @param name: the name of the command without the backslash
+        @param handler: a callable taking a walker.VisitedCommand and an object
+                implementing IIssueHandler
+        """
+        with LaTeXValidator._registered_lock:
+            handlers = dict(LaTeXValidator._registered_handlers)
+            handlers[name] = handler
+            LaTeXValidator._registered_handlers = handlers
+
+    @staticmethod
+    def unregister_command(name):
+        """
+        Remove a check registered by register_command()
+        """
+        with LaTeXValidator._registered_lock:
+            handlers = dict(LaTeXValidator._registered_handlers)
+            handlers.pop(name, None)
+            LaTeXValidator._registered_handlers = handlers
+
     def __init__(self):
         self._environment = Environment()
         #the the language_model singleton
@@ -60,197 +96,251 @@ class LaTeXValidator(object):
         @param document_preferences: a DocumentPreferences object, so we can query the
                graphics file extensions, etc
         """
+        walker = LaTeXWalker()
+        self.attach(walker, issue_handler, document_preferences)
+        walker.walk(document_node)
+        self.finish(outline)
 
-        LOG.debug("Validating")
+    def attach(self, walker, issue_handler, document_preferences):
+        """
+        Register with a LaTeXWalker, to validate while the walker runs other
+        analyses, too. Call finish() after the walk.
 
-        #~ # TODO: this is dangerous, the outline object could be outdated
-        #~ self._outline = outline
+        @param walker: a LaTeXWalker
+        @param issue_handler: an object implementing IIssueHandler
+        @param document_preferences: a DocumentPreferences object, so we can query the
+               graphics file extensions, etc
+        """
+
+        LOG.debug("Validating")
 
         # cache some settings now to save time
         self._potential_graphics_extensions = [""] + document_preferences.get("graphics-extensions").split(",")
         self._potential_graphics_paths = document_preferences.get("graphics-paths").split(",")
-        self._extra_issue_commands = set([c for c in document_preferences.get("extra-issue-commands").split(",") if len(c)])
+        extra_issue_commands = [c for c in document_preferences.get("extra-issue-commands").split(",") if len(c)]
 
-        # prepare a map for checking labels
-        self._labels = {}
-        for label in outline.labels:
-            self._labels[label.value] = [label, False]
+        # the references are checked in finish(), as the labels are only
+        # known when the outline is complete
+        self._refs = []    # [ (label, node) ]
 
         self._environStack = []
 
         self._checkRefs = True
 
-        self._run(document_node, issue_handler)
+        # the referenced files are looked up in cached directory listings
+        self._files = DirectoryListingCache().check()
+        self._graphics = []    # the paths of the images found
+
+        self._issue_handler = issue_handler
+
+        # the handlers updated later take precedence
+        handlers = {}
+
+        for name, handler in self._registered_handlers.iteritems():
+            handlers[name] = self._wrap_registered(handler)
+
+        for name in extra_issue_commands:
+            handlers[name] = self._on_extra_issue_command
+
+        handlers["newcommand"] = self._on_newcommand
+        handlers["bibliographystyle"] = self._on_bibliographystyle
+
+        if self._checkRefs:
+            handlers["includegraphics"] = self._on_includegraphics
+            handlers["include"] = self._on_include
+            handlers["input"] = self._on_include
+            handlers["bibliography"] = self._on_bibliography
+
+        for name in self._language_model.ref_commands:
+            handlers[name] = self._on_ref
+
+        handlers["begin"] = self._on_begin
+        handlers["end"] = self._on_end
+        handlers["["] = self._on_begin_math
+        handlers["]"] = self._on_end_math
+
+        # check the wrappers of commands like the commands themselves
+        for name, original in self._language_model.command_aliases.iteritems():
+            if not name in handlers and original in handlers:
+                handlers[name] = handlers[original]
+
+        walker.add(handlers)
+
+    def finish(self, outline):
+        """
+        Check the references and the labels of a complete outline
+
+        @param outline: the LaTeX outline object of the walked document
+        """
+        issue_handler = self._issue_handler
+        self._issue_handler = None
+
+        LOG.debug("Checked %d files with %d system calls, %d saved" % (self._files.queries,
+                  self._files.syscalls, self._files.saved))
+        self._files = None
+
+        outline.graphics = self._graphics
+        self._graphics = []
+
+        # prepare a map for checking labels
+        labels = {}
+        for label in outline.labels:
+            labels[label.value] = [label, False]
+
+        # mark labels as used
+        for label, node in self._refs:
+            try:
+                labels[label][1] = True
+            except KeyError:
+                issue_handler.issue(Issue("Label <b>%s</b> has not been defined" % escape(label), node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
+
+        self._refs = []
 
         # evaluate label map
-        for label, used in self._labels.values():
+        for label, used in labels.values():
             if not used:
                 # FIXME: we need to know in which File the label was defined!
                 issue_handler.issue(Issue("Label <b>%s</b> is never used" % escape(label.value), label.start, label.end, label.file, Issue.SEVERITY_WARNING))
 
-    def _run(self, parentNode, issue_handler):
-        """
-        Recursive method validation
-        """
-        for node in parentNode:
-            recurse = True
-#            if node.type == Node.DOCUMENT:
-#
-#                self._log.debug("DOCUMENT: %s" % node.value)
-#
-#                # the document node contains the File object as value
-#                self._file = node.value
-
-            if node.type == Node.COMMAND:
-                if node.value == "begin":
-                    try:
-                        # push environment on stack
-                        environ = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        self._environStack.append((environ, node.start, node.lastEnd))
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "end":
-                    try:
-                        # check environment
-                        environ = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        try:
-                            tEnviron, tStart, tEnd = self._environStack.pop()
-                            if tEnviron != environ:
-                                issue_handler.issue(Issue("Environment <b>%s</b> has to be ended before <b>%s</b>" % (escape(tEnviron), escape(environ)), node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-                        except IndexError:
-                            issue_handler.issue(Issue("Environment <b>%s</b> has no beginning" % escape(environ), node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "[":
-                    # push eqn env on stack
-                    self._environStack.append(("[", node.start, node.end))
-
-                elif node.value == "]":
-                    try:
-                        tEnviron, tStart, tEnd = self._environStack.pop()
-                        if tEnviron != "[":
-                            issue_handler.issue(Issue("Environment <b>%s</b> has to be ended before <b>]</b>" % escape(tEnviron), node.start, node.end, node.file, Issue.SEVERITY_ERROR))
-                    except IndexError:
-                        issue_handler.issue(Issue("Environment <b>%s</b> has no beginning" % escape(environ), node.start, node.end, node.file, Issue.SEVERITY_ERROR))
-
-                elif self._language_model.is_ref_command(node.value):
-                    # mark label as used
-                    try:
-                        label = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        try:
-                            self._labels[label][1] = True
-                        except KeyError:
-                            issue_handler.issue(Issue("Label <b>%s</b> has not been defined" % escape(label), node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif self._checkRefs and (node.value == "includegraphics"):
-                    try:
-                        # check referenced image file
-                        target = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        if len(target) > 0:
-                            found = False
-
-                            if File.is_absolute(target):
-                                for ext in self._potential_graphics_extensions:
-                                    if exists(target + ext):
-                                        found = True
-                                        break
-                            else:
-                                for p in self._potential_graphics_paths:
-                                    if found: break
-                                    for ext in self._potential_graphics_extensions:
-                                        if found: break
-                                        filename = os.path.abspath(os.path.join(node.file.dirname, p, target) + ext)
-                                        if os.path.exists(filename):
-                                            found = True
-
-                            if not found:
-                                issue_handler.issue(Issue("Image <b>%s</b> could not be found" % escape(target), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
-                        else:
-                            issue_handler.issue(Issue("No image file specified", node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif self._checkRefs and (node.value == "include" or node.value == "input"):
-                    # check referenced tex file
-                    try:
-                        target = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        if len(target) > 0:
-                            if File.is_absolute(target):
-                                filename = target
-                            else:
-                                file = File.create_from_relative_path(target, node.file.dirname)
-                                filename = file.path
-
-                            # an input may be specified without the extension
-                            potential_extensions = ["", ".tex"]
-
-                            found = False
-                            for ext in potential_extensions:
-                                if exists(filename + ext):
-                                    found = True
-                                    break
-
-                            if not found:
-                                issue_handler.issue(Issue("Document <b>%s</b> could not be found" % escape(filename), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
-                    except IndexError:        # firstOfType failed
-                        # this happens on old-style syntax like "\input myfile"
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif self._checkRefs and node.value == "bibliography":
-                    try:
-                        # check referenced BibTeX file(s)
-                        value = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                        for target in value.split(","):
-                            if File.is_absolute(target):
-                                filename = target
-                            else:
-                                file = File.create_from_relative_path(target, node.file.dirname)
-                                filename = file.path
-
-                            # a bib file may be specified without the extension
-                            potential_extensions = ["", ".bib"]
-
-                            found = False
-                            for ext in potential_extensions:
-                                if exists(filename + ext):
-                                    found = True
-                                    break
-
-                            if not found:
-                                issue_handler.issue(Issue("Bibliography <b>%s</b> could not be found" % escape(filename), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
-                    except IndexError:        # firstOfType failed
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value == "newcommand":
-                    # don't validate in newcommand definitions
-                    recurse = False
-
-                elif node.value == "bibliographystyle":
-                    try:
-                        # check if style exists
-                        value = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-
-                        # search the TeX environment
-                        if not self._environment.file_exists("%s.bst" % value):
-                            # search the working directory
-                            bst_file = File.create_from_relative_path("%s.bst" % value, node.file.dirname)
-                            if not bst_file.exists:
-                                issue_handler.issue(Issue("Bibliography style <b>%s</b> could not be found" % escape(value), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
-                    except IndexError:
-                        issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
-
-                elif node.value in self._extra_issue_commands:
-                    try:
-                        text = node.firstOfType(Node.MANDATORY_ARGUMENT).innerText
-                    except IndexError:
-                        text = node.value
-                    issue_handler.issue(Issue(text, node.start, node.lastEnd, node.file, Issue.SEVERITY_TASK))
-
-            if recurse:
-                self._run(node, issue_handler)
+    def _wrap_registered(self, handler):
+        def on_command(command):
+            handler(command, self._issue_handler)
+        return on_command
+
+    def _malformed(self, node):
+        self._issue_handler.issue(Issue("Malformed command", node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
+
+    def _on_begin(self, command):
+        node = command.node
+        try:
+            # push environment on stack
+            self._environStack.append((command.text, node.start, node.lastEnd))
+        except IndexError:
+            self._malformed(node)
+
+    def _on_end(self, command):
+        node = command.node
+        try:
+            # check environment
+            environ = command.text
+            try:
+                tEnviron, tStart, tEnd = self._environStack.pop()
+                if tEnviron != environ:
+                    self._issue_handler.issue(Issue("Environment <b>%s</b> has to be ended before <b>%s</b>" % (escape(tEnviron), escape(environ)), node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
+            except IndexError:
+                self._issue_handler.issue(Issue("Environment <b>%s</b> has no beginning" % escape(environ), node.start, node.lastEnd, node.file, Issue.SEVERITY_ERROR))
+        except IndexError:
+            self._malformed(node)
+
+    def _on_begin_math(self, command):
+        node = command.node
+        # push eqn env on stack
+        self._environStack.append(("[", node.start, node.end))
+
+    def _on_end_math(self, command):
+        node = command.node
+        try:
+            tEnviron, tStart, tEnd = self._environStack.pop()
+            if tEnviron != "[":
+                self._issue_handler.issue(Issue("Environment <b>%s</b> has to be ended before <b>]</b>" % escape(tEnviron), node.start, node.end, node.file, Issue.SEVERITY_ERROR))
+        except IndexError:
+            self._issue_handler.issue(Issue("Environment <b>[</b> has no beginning", node.start, node.end, node.file, Issue.SEVERITY_ERROR))
+
+    def _on_ref(self, command):
+        try:
+            self._refs.append((command.text, command.node))
+        except IndexError:
+            self._malformed(command.node)
+
+    def _on_includegraphics(self, command):
+        node = command.node
+        try:
+            # check referenced image file
+            target = command.text
+            if len(target) > 0:
+                found = False
+
+                if File.is_absolute(target):
+                    candidates = [target]
+                else:
+                    dirname = node.file.dirname
+                    candidates = [os.path.join(dirname, p, target) for p in self._potential_graphics_paths]
+
+                for path in candidates:
+                    extension = self._files.find(path, self._potential_graphics_extensions)
+                    if extension is not None:
+                        self._graphics.append(os.path.abspath(path + extension))
+                        found = True
+                        break
+
+                if not found:
+                    self._issue_handler.issue(Issue("Image <b>%s</b> could not be found" % escape(target), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
+            else:
+                self._issue_handler.issue(Issue("No image file specified", node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
+        except IndexError:
+            self._malformed(node)
+
+    def _on_include(self, command):
+        node = command.node
+        # check referenced tex file
+        try:
+            target = command.text
+            if len(target) > 0:
+                if File.is_absolute(target):
+                    filename = target
+                else:
+                    file = File.create_from_relative_path(target, node.file.dirname)
+                    filename = file.path
+
+                # an input may be specified without the extension
+                if self._files.find(filename, ["", ".tex"]) is None:
+                    self._issue_handler.issue(Issue("Document <b>%s</b> could not be found" % escape(filename), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
+        except IndexError:        # firstOfType failed
+            # this happens on old-style syntax like "\input myfile"
+            self._malformed(node)
+
+    def _on_bibliography(self, command):
+        node = command.node
+        try:
+            # check referenced BibTeX file(s)
+            for target in command.text.split(","):
+                if File.is_absolute(target):
+                    filename = target
+                else:
+                    file = File.create_from_relative_path(target, node.file.dirname)
+                    filename = file.path
+
+                # a bib file may be specified without the extension
+                if self._files.find(filename, ["", ".bib"]) is None:
+                    self._issue_handler.issue(Issue("Bibliography <b>%s</b> could not be found" % escape(filename), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
+        except IndexError:        # firstOfType failed
+            self._malformed(node)
+
+    def _on_newcommand(self, command):
+        # don't validate in newcommand definitions
+        return True
+
+    def _on_bibliographystyle(self, command):
+        node = command.node
+        try:
+            # check if style exists
+            value = command.text
+
+            # search the TeX environment
+            if not self._environment.file_exists("%s.bst" % value):
+                # search the working directory
+                bst_file = File.create_from_relative_path("%s.bst" % value, node.file.dirname)
+                if not self._files.exists(bst_file.path):
+                    self._issue_handler.issue(Issue("Bibliography style <b>%s</b> could not be found" % escape(value), node.start, node.lastEnd, node.file, Issue.SEVERITY_WARNING))
+        except IndexError:
+            self._malformed(node)
+
+    def _on_extra_issue_command(self, command):
+        node = command.node
+        try:
+            text = command.text
+        except IndexError:
+            text = node.value
+        self._issue_handler.issue(Issue(text, node.start, node.lastEnd, node.file, Issue.SEVERITY_TASK))
 
 # ex:ts=4:et:
@@ -194,6 +194,7 @@ class LaTeXOutlineView(BaseOutlineView):
         self._handlers = {}
 
         self._offset_map = OutlineOffsetMap()
+        self._converter = OutlineConverter()
 
         # additional toolbar buttons
         btn_graphics = Gtk.ToggleToolButton()
@@ -220,12 +221,10 @@ class LaTeXOutlineView(BaseOutlineView):
         """
         LOG.debug("LatexOutline: set outline")
 
-        self._save_state()
-
+        # the rows are updated in place, so the expanded rows and the
+        # selection don't have to be saved and restored
         self._offset_map = OutlineOffsetMap()
-        OutlineConverter().convert(self._store, outline, self._offset_map, self._editor.edited_file)
-
-        self._restore_state()
+        self._converter.convert(self._store, outline, self._offset_map, self._editor.edited_file)
 
     def _on_node_selected(self, node):
         """
@@ -291,7 +290,7 @@ class LaTeXOutlineView(BaseOutlineView):
 
 class OutlineConverter(object):
     """
-    This creates a Gtk.TreeStore object from a LaTeX outline model
+    This creates and updates a Gtk.TreeStore object from a LaTeX outline model
     """
 
     def __init__(self):
@@ -310,56 +309,114 @@ class OutlineConverter(object):
 
     def convert(self, tree_store, outline, offset_map, file):
         """
-        Convert an Outline object to a Gtk.TreeStore and update an OutlineOffsetMap
+        Update a Gtk.TreeStore from an Outline object and fill an OutlineOffsetMap
+
+        The rows are matched with the new outline nodes by a key (see _keys), so
+        only the rows of added, removed or changed nodes are touched.
 
-        @param tree_store: Gtk.TreeStore
+        @param tree_store: Gtk.TreeStore, empty or filled by a previous call
         @param outline: latex.outline.Outline
         @param offset_map: outline.OutlineOffsetMap
         @param file: the edited File (to identify foreign outline nodes)
         """
         self._offsetMap = offset_map
         self._treeStore = tree_store
-        self._treeStore.clear()
         self._file = file
+        self._color = self._preferences.get("light-foreground-color")
 
-        self._append(None, outline.rootNode)
+        self._update(None, outline.rootNode)
+
+    def _keys(self, nodes):
+        """
+        Return a key for each of a list of sibling nodes: the type, value and file
+        and the number of preceding siblings with the same ones
+        """
+        keys = []
+        counts = {}
+        for node in nodes:
+            if node.file:
+                base = (node.type, node.value, node.file.uri)
+            else:
+                base = (node.type, node.value, None)
+            ordinal = counts.get(base, 0)
+            counts[base] = ordinal + 1
+            keys.append(base + (ordinal,))
+        return keys
 
-    def _append(self, parent, node):
+    def _update(self, parent, node):
         """
-        Recursively append an outline node to the TreeStore
+        Recursively update the children of a row from the children of an outline node
 
         @param parent: a Gtk.TreeIter or None
         @param node: an OutlineNode
         """
+        children = list(node)
+        keys = self._keys(children)
+        positions = dict((key, i) for i, key in enumerate(keys))
+
+        # TreeStore iters persist, so they stay valid while rows are added and removed
+        rows = []
+        it = self._treeStore.iter_children(parent)
+        while it is not None:
+            rows.append(it)
+            it = self._treeStore.iter_next(it)
+        row_keys = self._keys([self._treeStore.get_value(row, 2) for row in rows])
+
+        j = 0
+        for i, child in enumerate(children):
+            # remove the rows of nodes that are gone or have been moved in front
+            while j < len(rows) and positions.get(row_keys[j], -1) < i:
+                self._treeStore.remove(rows[j])
+                j += 1
+
+            label, icon = self._row(child)
+
+            if j < len(rows) and positions[row_keys[j]] == i:
+                it = rows[j]
+                j += 1
+                if self._treeStore.get(it, 0, 1) != (label, icon):
+                    self._treeStore.set(it, [0, 1, 2], [label, icon, child])
+                else:
+                    self._treeStore.set_value(it, 2, child)
+            else:
+                sibling = rows[j] if j < len(rows) else None
+                it = self._treeStore.insert_before(parent, sibling, [label, icon, child])
+
+            # store path in offset map for all non-foreign nodes
+            if not child.foreign:
+                path = self._treeStore.get_path(it)
+                if child.type == OutlineNode.STRUCTURE:
+                    # a section reaches up to the next one
+                    self._offsetMap.put(child.start, path)
+                else:
+                    self._offsetMap.put(child.start, path, child.end)
+
+            self._update(it, child)
+
+        for it in rows[j:]:
+            self._treeStore.remove(it)
+
+    def _row(self, node):
+        """
+        Return the label and the icon of the row of an outline node
+        """
         value = node.value
 
-        color = self._preferences.get("light-foreground-color")
+        if node.type == OutlineNode.GRAPHICS:
+            value = basename(value)
 
         if node.file and node.file != self._file:
-            value = "%s <span color='%s'>%s</span>" % (value, color, node.file.shortbasename)
+            value = "%s <span color='%s'>%s</span>" % (value, self._color, node.file.shortbasename)
 
         if node.type == OutlineNode.STRUCTURE:
             icon = self._LEVEL_ICONS[node.level]
-            parent = self._treeStore.append(parent, [value, icon, node])
         elif node.type == OutlineNode.LABEL:
-            parent = self._treeStore.append(parent, [value, self._ICON_LABEL, node])
+            icon = self._ICON_LABEL
         elif node.type == OutlineNode.TABLE:
-            parent = self._treeStore.append(parent, [value, self._ICON_TABLE, node])
-        elif node.type == OutlineNode.GRAPHICS:
-            label = basename(node.value)
-
-            if node.file and node.file != self._file:
-                label = "%s <span color='%s'>%s</span>" % (label, color, node.file.shortbasename)
-
-            parent = self._treeStore.append(parent, [label, self._ICON_GRAPHICS, node])
-
-        # store path in offset map for all non-foreign nodes
-        # check for parent to ignore root node
-        if parent and not node.foreign:
-            path = self._treeStore.get_path(parent)
-            self._offsetMap.put(node.start, path)
+            icon = self._ICON_TABLE
+        else:
+            icon = self._ICON_GRAPHICS
 
-        for child in node:
-            self._append(parent, child)
+        return value, icon
 
 # ex:ts=4:et:
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+latex.walker
+
+Runs a number of analyses of a document model (outline generation,
+validation etc.) in one traversal
+"""
+
+from parser import Node
+
+
+class VisitedCommand(object):
+    """
+    A command node passed to the handlers by the LaTeXWalker
+
+    The arguments are extracted at most once, no matter how many handlers
+    use them.
+    """
+
+    __slots__ = ("node", "foreign", "_argument", "_text", "_markup")
+
+    def __init__(self, node):
+        self.node = node
+        self.foreign = False    # set by the LaTeXWalker for each handler
+        self._argument = None
+        self._text = None
+        self._markup = None
+
+    @property
+    def argument(self):
+        """
+        Return the first mandatory argument
+
+        @raise IndexError: if the command has none
+        """
+        if self._argument is None:
+            self._argument = self.node.firstOfType(Node.MANDATORY_ARGUMENT)
+        return self._argument
+
+    @property
+    def text(self):
+        """
+        Return the text of the first mandatory argument
+
+        @raise IndexError: if the command has none
+        """
+        if self._text is None:
+            self._text = self.argument.innerText
+        return self._text
+
+    @property
+    def markup(self):
+        """
+        Return the markup of the first mandatory argument
+
+        @raise IndexError: if the command has none
+        """
+        if self._markup is None:
+            self._markup = self.argument.innerMarkup
+        return self._markup
+
+
+class WalkerScope(object):
+    """
+    The part of the document model the handlers of one analysis are called for
+    """
+
+    def __init__(self, root):
+        """
+        @param root: a DOCUMENT node or None for the whole model
+        """
+        self.root = root
+        self.entered = False
+        self._level = None    # the nesting level of the children of the root while it is walked
+
+
+class LaTeXWalker(object):
+    """
+    This walks a document model once and calls the handlers the analyses have
+    registered for the names of the commands it meets.
+
+    A handler is called with a VisitedCommand. Its 'foreign' flag tells if the
+    command comes from a document expanded below an \\input or \\include of the
+    scope. If a handler returns True the children of the command are skipped
+    for all analyses.
+    """
+
+    _FOREIGN_COMMANDS = set(("include", "input"))
+
+    def __init__(self):
+        self._handlers = {}    # { command name -> [ (WalkerScope, handler) ] }
+        self._scopes = {}      # { id(root node) -> WalkerScope }
+        self._global_scopes = []
+
+    def add(self, handlers, root=None):
+        """
+        Register the handlers of an analysis
+
+        @param handlers: a dict { command name -> handler }
+        @param root: only call the handlers for the commands below this DOCUMENT
+                node, e.g. an expanded child document, None for the whole model
+        @return: the WalkerScope of the handlers
+        """
+        scope = WalkerScope(root)
+
+        if root is None:
+            self._global_scopes.append(scope)
+        else:
+            self._scopes[id(root)] = scope
+
+        for name, handler in handlers.iteritems():
+            self._handlers.setdefault(name, []).append((scope, handler))
+
+        return scope
+
+    def walk(self, document_node):
+        """
+        Walk a document model and call the registered handlers
+
+        @param document_node: the root node of the model
+        """
+        for scope in self._global_scopes:
+            scope.entered = True
+            scope._level = 0
+
+        for scope in self._scopes.itervalues():
+            scope.entered = False
+            scope._level = None
+
+        try:
+            scope = self._scopes[id(document_node)]
+            scope.entered = True
+            scope._level = 0
+        except KeyError:
+            pass
+
+        self._walk(document_node, 0, ())
+
+        for scope in self._global_scopes:
+            scope._level = None
+
+    def _walk(self, parent_node, level, foreign_levels):
+        """
+        Recursively walk a node
+
+        @param level: the nesting level of the children
+        @param foreign_levels: the ascending levels of the ancestors that
+                are preceded by an \\input or \\include (or are one)
+        """
+        handlers = self._handlers
+        scopes = self._scopes
+
+        # like foreign_levels, but for the children of the walked nodes
+        child_foreign_levels = foreign_levels
+
+        for node in parent_node:
+            recurse = True
+
+            if node.type == Node.COMMAND:
+                try:
+                    entries = handlers[node.value]
+                except KeyError:
+                    entries = ()
+
+                if len(entries):
+                    command = VisitedCommand(node)
+                    for scope, handler in entries:
+                        if scope._level is None:
+                            continue
+                        command.foreign = len(foreign_levels) > 0 and foreign_levels[-1] >= scope._level
+                        if handler(command):
+                            recurse = False
+
+                if node.value in self._FOREIGN_COMMANDS:
+                    # the expanded document and everything below the
+                    # following siblings is foreign, not the siblings themselves
+                    if child_foreign_levels is foreign_levels:
+                        child_foreign_levels = foreign_levels + (level,)
+
+            if recurse:
+                if node.type == Node.DOCUMENT and id(node) in scopes:
+                    scope = scopes[id(node)]
+                    scope.entered = True
+                    scope._level = level + 1
+                    self._walk(node, level + 1, child_foreign_levels)
+                    scope._level = None
+                else:
+                    self._walk(node, level + 1, child_foreign_levels)
+
+# ex:ts=4:et:
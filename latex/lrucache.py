@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+lrucache
+
+A bounded map used by the document caches
+"""
+
+from logging import getLogger
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A map that holds at most a number of entries with a total weight. When
+    one of these budgets is exceeded, the least recently used entries are
+    removed.
+
+    The weight of an entry is an approximate size in bytes, e.g. the size of
+    the file a document model has been parsed from.
+
+    The counters hits, misses and evictions may be read at any time (see
+    statistics).
+    """
+
+    _log = getLogger("LRUCache")
+
+    def __init__(self, name, max_entries=None, max_weight=None):
+        """
+        @param name: a name used for logging
+        @param max_entries: the maximum number of entries or None for no limit
+        @param max_weight: the maximum total weight or None for no limit
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+
+        self._entries = OrderedDict()    # { key -> (value, weight) }, least recently used first
+        self._weight = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Return the value for a key and mark it as recently used
+
+        @return: the value or None if there is no entry for the key
+        """
+        try:
+            value, weight = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._entries[key] = (value, weight)
+        self.hits += 1
+        return value
+
+    def peek(self, key):
+        """
+        Return the value for a key without counting it as a hit or miss and
+        without marking it as used
+
+        @return: the value or None if there is no entry for the key
+        """
+        try:
+            return self._entries[key][0]
+        except KeyError:
+            return None
+
+    def put(self, key, value, weight=0):
+        """
+        Add or replace an entry and remove the least recently used entries if
+        the budgets are exceeded. The new entry itself is never removed.
+
+        @param key: a hashable key
+        @param value: the value
+        @param weight: the approximate size of the value in bytes
+        """
+        self.remove(key)
+
+        self._entries[key] = (value, weight)
+        self._weight += weight
+
+        self._evict()
+
+    def remove(self, key):
+        """
+        Remove an entry if present
+        """
+        try:
+            value, weight = self._entries.pop(key)
+            self._weight -= weight
+        except KeyError:
+            pass
+
+    def clear(self):
+        self._entries.clear()
+        self._weight = 0
+
+    def _evict(self):
+        while len(self._entries) > 1 and self._over_budget:
+            key, (value, weight) = self._entries.popitem(last=False)
+            self._weight -= weight
+            self.evictions += 1
+
+            self._log.debug("%s: evicted %s" % (self.name, key))
+
+    @property
+    def _over_budget(self):
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        if self.max_weight is not None and self._weight > self.max_weight:
+            return True
+        return False
+
+    @property
+    def weight(self):
+        """
+        Return the total weight of all entries
+        """
+        return self._weight
+
+    @property
+    def statistics(self):
+        """
+        Return the counters as a dict
+        """
+        return {"entries" : len(self._entries),
+                "weight" : self._weight,
+                "hits" : self.hits,
+                "misses" : self.misses,
+                "evictions" : self.evictions}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __str__(self):
+        return "LRUCache{%s: %s}" % (self.name, self.statistics)
+
+# ex:ts=4:et:
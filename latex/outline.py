@@ -25,6 +25,7 @@ Classes used for creating an outline view of LaTeX and BibTeX files
 """
 
 from logging import getLogger
+from bisect import bisect_right
 from gi.repository import Gtk, GdkPixbuf
 
 from panelview import PanelView
@@ -214,103 +215,111 @@ class BaseOutlineView(PanelView):
         """
 
 
-class Item(object):
-    def __init__(self, key, value):
-        self.key = key
-        self.value = value
-
-    def __cmp__(self, item):
-        return self.key.__cmp__(item.key)
-
-
-class OffsetLookupTree(object):
-    def __init__(self):
-        self.items = []
-
-    def insert(self, key, value):
-        """
-        Insert a value
-        """
-        self.items.append(Item(key, value))
-
-    def prepare(self):
-        """
-        Prepare the structure for being searched
-        """
-        self.items.sort()
-
-    def find(self, key):
-        """
-        Find a value by its key
-        """
-        return self._find(key, 0, len(self.items) - 1)
-
-    def _find(self, key, lo, hi):
-        if hi - lo == 0:
-            raise KeyError
-
-        i = (hi - lo)/2
-        item = self.items[i]
-        if item.key == key:
-            return item.value
-        elif item.key > key:
-            return self._find(key, lo, i - 1)
-        elif item.key < key:
-            return self._find(key, i + 1, hi)
-
-
 class OutlineOffsetMap(object):
     """
-    This stores a mapping from the start offsets of outline elements
-    to paths in the outline tree.
+    This stores a mapping from the offsets of outline elements to paths in
+    the outline tree.
 
     We need this for the 'connect-outline-to-editor' feature.
 
     We may not use a simple dictionary for that because we need some
     kind of neighborhood lookup as we never get the exact offsets.
-    """
 
-    # TODO: find a faster structure for this - this is a tree with a special
-    # find method
+    The elements are put in the order of the outline tree (parents before
+    their children). On the first lookup after changes they are sorted by
+    offset once, so that a lookup is a binary search followed by a walk up
+    to the innermost element containing the offset.
+    """
 
     def __init__(self):
-        self._map = {}
+        self.clear()
 
     def clear(self):
-        self._map = {}
+        self._entries = []    # [ (start, end, path) ] in outline order
+        self._starts = None
+        self._ends = None
+        self._paths = None
+        self._parents = None
+
+    def put(self, offset, path, end=None):
+        """
+        Add an outline element
+
+        @param offset: the start offset of the element
+        @param path: the Gtk.TreePath of the element
+        @param end: the end offset of the element or None if the element
+                reaches up to the next element that is not one of its descendants
+                (like a section)
+        """
+        self._entries.append((offset, end, path))
+        self._starts = None
+
+    def truncate(self, length):
+        """
+        Remove the elements put after the first ones
+
+        @param length: the number of elements to keep
+        """
+        del self._entries[length:]
+        self._starts = None
 
-    def put(self, offset, path):
-        self._map[offset] = path
+    def _prepare(self):
+        """
+        Sort the elements by offset and find the enclosing element of each one
+        """
+        # sorting is stable, so parents stay in front of children at the same offset
+        order = sorted(range(len(self._entries)), key=lambda i: self._entries[i][0])
+
+        # the enclosing element is the nearest preceding one in outline order
+        # that is less deep
+        parents = [-1] * len(self._entries)
+        stack = []    # [ (depth, index) ]
+        for i, (start, end, path) in enumerate(self._entries):
+            depth = path.get_depth()
+            while len(stack) and stack[-1][0] >= depth:
+                stack.pop()
+            if len(stack):
+                parents[i] = stack[-1][1]
+            stack.append((depth, i))
+
+        position = [0] * len(order)
+        for k, i in enumerate(order):
+            position[i] = k
+
+        self._starts = [self._entries[i][0] for i in order]
+        self._ends = [self._entries[i][1] for i in order]
+        self._paths = [self._entries[i][2] for i in order]
+        self._parents = [position[parents[i]] if parents[i] >= 0 else -1 for i in order]
 
     def lookup(self, offset):
         """
-        Returns the outline element containing a certain offset
+        Returns the innermost outline element containing a certain offset
+
+        @raise KeyError: if no element contains the offset
         """
+        if self._starts is None:
+            self._prepare()
 
-        # sort offsets
-        offsets = self._map.keys()
-        offsets.sort()
+        # the last element starting at or before the offset
+        i = bisect_right(self._starts, offset) - 1
 
-        # find nearest offset
-        nearestOffset = None
-        for o in offsets:
-            if o > offset:
-                break
-            nearestOffset = o
+        # walk up while the element ends before the offset
+        while i >= 0 and self._ends[i] is not None and self._ends[i] < offset:
+            i = self._parents[i]
 
-        if not nearestOffset:
-            raise KeyError
+        if i < 0:
+            raise KeyError(offset)
 
-        return self._map[nearestOffset]
+        return self._paths[i]
+
+    def __len__(self):
+        return len(self._entries)
 
     def __str__(self):
         s = "<OutlineOffsetMap>"
 
-        ofs = self._map.keys()
-        ofs.sort()
-
-        for o in ofs:
-            s += "\n\t%s : %s" % (o, self._map[o])
+        for start, end, path in sorted(self._entries, key=lambda entry: entry[0]):
+            s += "\n\t%s-%s : %s" % (start, end, path)
         s += "\n</OutlineOffsetMap>"
         return s
 
@@ -357,12 +357,6 @@ class PreferencesDialog(GladeInterface):
             check_hide_box = self.find_widget("checkHideBox")
             check_hide_box.set_active(self._preferences.get("hide-box-warnings"))
 
-
-            #
-            # proxies for SpinButtons
-            #
-            self._proxies = [PreferencesSpinButtonProxy(self.find_widget("spinMaxBibSize"), "maximum-bibtex-size")]
-
             #
             # signals
             #
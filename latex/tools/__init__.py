@@ -130,7 +130,7 @@ class ToolAction(Action):
     def run_tool(self, document, other, context, doc):
         tool_view = context.find_view(context.active_editor, "ToolView")
 
-        self._runner.run(context.active_editor.file, self._tool, tool_view)
+        self._runner.run(context.active_editor.file, self._tool, tool_view, context.active_editor.build_inputs)
         LOG.debug("run tool on: %s" % context.active_editor.file)
 
         # destroy the save listener, or else we get a compile on any save
@@ -139,25 +139,54 @@ class ToolAction(Action):
 
 
 from os import chdir
+from glob import glob
+from hashlib import sha1
 from util import Process
 from string import Template
+from buildcache import BuildCache
+from ..gldefs import _
 
 
 class ToolRunner(Process):
     """
     This runs a Tool in a subprocess
+
+    Passes of LaTeX (Jobs with a post-processor for LaTeX) are scheduled by
+    the state of the auxiliary files: a pass is skipped if the last one with
+    the same command has converged, i.e. it has left the auxiliary files
+    unchanged and LaTeX hasn't asked for a rerun, and they haven't changed
+    since. If the last pass of a Tool with several passes has not converged,
+    it is repeated up to MAX_PASSES times.
     """
 
-    def run(self, file, tool, issue_handler):
+    MAX_PASSES = 5
+
+    # the files LaTeX reads in the next pass, besides the .aux files of the included documents
+    _AUXILIARY_EXTENSIONS = [".aux", ".toc", ".lof", ".lot", ".bbl"]
+
+    def run(self, file, tool, issue_handler, inputs=None):
         """
         @param file: a File object
         @param tool: a Tool object
         @param issue_handler: an object implementing IStructuredIssueHandler
+        @param inputs: a list of the File objects the Tool depends on, if
+                given the Jobs that are up to date are skipped
         """
         self._file = file
-        self._stdout_text = ""
-        self._stderr_text = ""
-        self._job_iter = iter(tool.jobs)
+        self._tool = tool
+        self._inputs = inputs
+        self._stdout_chunks = []
+        self._stderr_chunks = []
+        self._job_index = -1
+
+        # Jobs are only skipped until one has to run, the following ones
+        # depend on its results. All Jobs that run are recorded.
+        self._may_skip = inputs is not None
+        self._fingerprint = None
+
+        self._repeat = False    # True if the current pass of LaTeX has to be repeated
+        self._passes = {}       # { command -> number of passes run }
+        self._converged = {}    # { command -> state of the auxiliary files after a converged pass }
 
         # add alert to the statusbar
         self._statusbar = Gedit.App.get_default().get_active_window().get_statusbar()
@@ -182,18 +211,68 @@ class ToolRunner(Process):
 
     def __proceed(self):
         try:
-            self._job = self._job_iter.next()
+            if self._repeat:
+                # another pass of the current Job, shown below it, it keeps
+                # the fingerprint and the snapshot taken before the first pass
+                self._repeat = False
+                self._partition = self._issue_handler.add_partition("%s <i>(%s)</i>" % (self._job.command_template, _("additional pass")),
+                                                                    "running", self._issue_partitions[self._job])
+            else:
+                self._job_index += 1
+                if self._job_index >= len(self._tool.jobs):
+                    raise StopIteration
+                self._job = self._tool.jobs[self._job_index]
+                self._partition = self._issue_partitions[self._job]
+                self._fingerprint = None
 
             command_template = Template(self._job.command_template)
             command = command_template.safe_substitute({"filename" : self._file.path,
                                                         "shortname" : self._file.shortname,
                                                         "directory" : self._file.dirname,
                                                         "plugin_path" : Resources().get_system_dir()})
-
-            self._issue_handler.set_partition_state(self._issue_partitions[self._job], "running")
+            self._command = command
+
+            self._job_issues = []
+            self._auxiliary_state = None
+
+            if self._inputs is not None and self._fingerprint is None:
+                build_cache = BuildCache()
+                build_key = BuildCache.key(self._file, self._tool, self._job_index)
+                fingerprint = build_cache.fingerprint(command, self._inputs)
+
+                if self._may_skip:
+                    issues = build_cache.lookup(build_key, fingerprint)
+                    if issues is not None:
+                        LOG.debug("Job is up to date: %s" % command)
+                        self.__append_issues(issues)
+                        self._issue_handler.set_partition_state(self._partition, "up-to-date")
+                        self.__proceed()
+                        return
+                    self._may_skip = False
+
+                self._build_key = build_key
+                self._fingerprint = fingerprint
+                self._snapshot = build_cache.snapshot(self._file.dirname)
+
+            if self._job.post_processor.latex_pass:
+                state = self.__get_auxiliary_state()
+                if self._converged.get(command) == state:
+                    LOG.debug("Pass not needed: %s" % command)
+                    self._issue_handler.set_partition_state(self._partition, "converged")
+                    self.__proceed()
+                    return
+                self._auxiliary_state = state
+
+            self._issue_handler.set_partition_state(self._partition, "running")
+
+            # create post-processor instance, it is fed with the output while the job runs
+            self._post_processor = self._job.post_processor()
 
             self.execute(command)
         except StopIteration:
+            # remove alert, if all Jobs have been skipped it is still there
+            self._statusbar.remove(1,self._msg_id)
+
             # Tool finished successfully
             self._issue_handler.set_partition_state(self._root_issue_partition, "succeeded")
             # disable abort
@@ -203,17 +282,70 @@ class ToolRunner(Process):
 
             self._on_tool_succeeded()
 
+    def __get_auxiliary_state(self):
+        """
+        Return the digests of the auxiliary files of the processed file
+
+        @return: a dict { path -> digest } of the existing files
+        """
+        paths = set(glob("%s/*.aux" % self._file.dirname))
+        paths.update(["%s%s" % (self._file.shortname, extension) for extension in self._AUXILIARY_EXTENSIONS])
+
+        state = {}
+        for path in paths:
+            try:
+                f = open(path, "rb")
+                try:
+                    state[path] = sha1(f.read()).hexdigest()
+                finally:
+                    f.close()
+            except IOError:
+                pass
+        return state
+
+    def __check_convergence(self, post_processor):
+        """
+        Decide on the next pass after a pass of LaTeX has succeeded
+        """
+        command = self._command
+        self._passes[command] = self._passes.get(command, 0) + 1
+
+        if self.__get_auxiliary_state() == self._auxiliary_state and not post_processor.rerun_requested:
+            LOG.debug("Pass %d has converged: %s" % (self._passes[command], command))
+            self._converged[command] = self._auxiliary_state
+            return
+
+        self._converged.pop(command, None)
+
+        # repeat the last of several passes of the Tool
+        templates = [job.command_template for job in self._tool.jobs]
+        if (templates.count(self._job.command_template) > 1
+                and not self._job.command_template in templates[self._job_index + 1:]
+                and self._passes[command] < self.MAX_PASSES):
+            LOG.debug("Pass %d has not converged: %s" % (self._passes[command], command))
+            self._repeat = True
+
     def _on_stdout(self, text):
         """
         """
         LOG.debug("tool stdout: " + text)
-        self._stdout_text += text
+        self._stdout_chunks.append(text)
+        self.__append_issues(self._post_processor.feed(self._file, text, ""))
 
     def _on_stderr(self, text):
         """
         """
         LOG.debug("tool stderr: " + text)
-        self._stderr_text += text
+        self._stderr_chunks.append(text)
+        self.__append_issues(self._post_processor.feed(self._file, "", text))
+
+    def __append_issues(self, issues):
+        """
+        Show the issues the post-processor has found in the output so far
+        """
+        if len(issues):
+            self._job_issues += issues
+            self._issue_handler.append_issues(self._partition, issues)
 
     def _on_abort(self):
         """
@@ -222,8 +354,8 @@ class ToolRunner(Process):
         self._issue_handler.set_abort_enabled(False, None)
         # mark Tool and all Jobs as aborted
         self._issue_handler.set_partition_state(self._root_issue_partition, "aborted")
-        self._issue_handler.set_partition_state(self._issue_partitions[self._job], "aborted")
-        for job in self._job_iter:
+        self._issue_handler.set_partition_state(self._partition, "aborted")
+        for job in self._tool.jobs[self._job_index + 1:]:
             self._issue_handler.set_partition_state(self._issue_partitions[job], "aborted")
 
     def _on_exit(self, condition):
@@ -233,23 +365,36 @@ class ToolRunner(Process):
 
         assert self._job
 
-        # create post-processor instance
-        post_processor = self._job.post_processor()
+        post_processor = self._post_processor
 
         # run post-processor
-        post_processor.process(self._file, self._stdout_text, self._stderr_text, condition)
+        stdout_text = "".join(self._stdout_chunks)
+        stderr_text = "".join(self._stderr_chunks)
+        self._stdout_chunks = []
+        self._stderr_chunks = []
+        post_processor.process(self._file, stdout_text, stderr_text, condition)
 
         # show issues
-        self._issue_handler.append_issues(self._issue_partitions[self._job], post_processor.issues)
+        self.__append_issues(post_processor.issues)
 
         # remove alert
         self._statusbar.remove(1,self._msg_id)
 
         if post_processor.successful:
-            self._issue_handler.set_partition_state(self._issue_partitions[self._job], "succeeded")
+            if self._fingerprint is not None:
+                BuildCache().record(self._build_key, self._fingerprint, self._file.dirname,
+                                    self._snapshot, self._job_issues)
+
+            if self._auxiliary_state is not None:
+                self.__check_convergence(post_processor)
+
+            self._issue_handler.set_partition_state(self._partition, "succeeded")
             self.__proceed()
         else:
-            self._issue_handler.set_partition_state(self._issue_partitions[self._job], "failed")
+            if self._fingerprint is not None:
+                BuildCache().remove(self._build_key)
+
+            self._issue_handler.set_partition_state(self._partition, "failed")
             if self._job.must_succeed:
                 # whole Tool failed
                 self._issue_handler.set_partition_state(self._root_issue_partition, "failed")
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+tools.buildcache
+
+Remembers the results of Jobs, so that they can be skipped if nothing they
+depend on has changed
+"""
+
+import os
+import time
+import marshal
+from hashlib import sha1
+from logging import getLogger
+
+from ..singleton import Singleton
+from ..resources import Resources
+from ..issues import Issue
+from ..file import File
+
+
+def _encode(s):
+    if isinstance(s, unicode):
+        return s.encode("utf-8")
+    return s
+
+
+class BuildCache(Singleton):
+    """
+    A Job is identified by the processed file, the Tool and its position in
+    the Tool. When it has succeeded, this records
+
+     - a fingerprint of its command line and the contents of its inputs
+     - the files it has created or changed in the directory of the processed
+       file, with their modification times and sizes
+     - the issues found by its post-processor
+
+    The Job is up to date as long as the fingerprint is the same and none of
+    the recorded files has changed. Jobs that don't write any file (like
+    opening a viewer) are never up to date.
+    """
+
+    # If you change the layout of the stored records, then INCREMENT THE VERSION
+    FORMAT_VERSION = 1
+
+    MAX_RECORDS = 100
+
+    _CHUNK_SIZE = 65536
+
+    _log = getLogger("BuildCache")
+
+    def __init_once__(self):
+        self._filename = Resources().get_user_file("build.cache")
+        self._records = None    # { key -> (time, fingerprint, { path -> (mtime, size) }, list of issue tuples) }
+        self._digests = {}      # { path -> (mtime, size, digest) }
+
+    @staticmethod
+    def key(file, tool, index):
+        """
+        Return the key of a Job
+
+        @param file: the File processed by the Tool
+        @param tool: the Tool object
+        @param index: the position of the Job in the Tool
+        """
+        return "%s\0%s\0%d" % (_encode(file.uri), _encode(tool.label), index)
+
+    def fingerprint(self, command, inputs):
+        """
+        @param command: the command line of the Job
+        @param inputs: a list of File objects the Job depends on
+        @return: a hex digest
+        """
+        h = sha1(_encode(command))
+        for path in sorted(set([_encode(file.path) for file in inputs])):
+            h.update("\0%s\0%s" % (path, self._digest(path)))
+        return h.hexdigest()
+
+    def lookup(self, key, fingerprint):
+        """
+        Return the issues of a Job if it is up to date
+
+        @return: a list of Issues or None if the Job has to run
+        """
+        try:
+            timestamp, recorded_fingerprint, outputs, issues = self._load()[key]
+        except KeyError:
+            return None
+
+        if recorded_fingerprint != fingerprint or not len(outputs):
+            return None
+
+        for path, state in outputs.iteritems():
+            if self._stat(path) != state:
+                self._log.debug("%s has changed" % path)
+                return None
+
+        return [Issue(message, start, end, File(uri), severity, position_type)
+                for message, start, end, uri, severity, position_type in issues]
+
+    def snapshot(self, directory):
+        """
+        Return the state of the files in a directory, to be passed to record()
+        after the Job has run
+
+        @return: a dict { path -> (mtime, size) }
+        """
+        directory = _encode(directory)
+        files = {}
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return files
+        for name in names:
+            path = os.path.join(directory, name)
+            state = self._stat(path)
+            if state is not None:
+                files[path] = state
+        return files
+
+    def record(self, key, fingerprint, directory, snapshot, issues):
+        """
+        Record a Job that has succeeded
+
+        @param fingerprint: the fingerprint of the Job taken before it ran
+        @param directory: the directory the snapshot has been taken of
+        @param snapshot: the state of the directory before the Job ran
+        @param issues: the Issues found by the post-processor
+        """
+        outputs = {}
+        for path, state in self.snapshot(directory).iteritems():
+            if snapshot.get(path) != state:
+                outputs[path] = state
+
+        issue_tuples = [(issue.message, issue.start, issue.end, issue.file.uri, issue.severity, issue.position_type)
+                        for issue in issues]
+
+        records = self._load()
+        records[key] = (time.time(), fingerprint, outputs, issue_tuples)
+
+        if len(records) > self.MAX_RECORDS:
+            oldest = sorted(records.iterkeys(), key=lambda k: records[k][0])
+            for k in oldest[:len(records) - self.MAX_RECORDS]:
+                del records[k]
+
+        self._save()
+
+    def remove(self, key):
+        """
+        Forget a Job, e.g. because it has failed
+        """
+        records = self._load()
+        if key in records:
+            del records[key]
+            self._save()
+
+    def _stat(self, path):
+        try:
+            s = os.stat(path)
+        except OSError:
+            return None
+        return (s.st_mtime, s.st_size)
+
+    def _digest(self, path):
+        """
+        Return the digest of the content of a file, it is only read again if
+        its modification time or size has changed
+        """
+        state = self._stat(path)
+        if state is None:
+            return "missing"
+
+        try:
+            mtime, size, digest = self._digests[path]
+            if (mtime, size) == state:
+                return digest
+        except KeyError:
+            pass
+
+        h = sha1()
+        try:
+            f = open(path, "rb")
+            try:
+                chunk = f.read(self._CHUNK_SIZE)
+                while len(chunk):
+                    h.update(chunk)
+                    chunk = f.read(self._CHUNK_SIZE)
+            finally:
+                f.close()
+        except IOError:
+            return "unreadable"
+
+        digest = h.hexdigest()
+        self._digests[path] = (state[0], state[1], digest)
+        return digest
+
+    def _load(self):
+        if self._records is None:
+            self._records = {}
+            try:
+                f = open(self._filename, "rb")
+                try:
+                    version, records = marshal.load(f)
+                finally:
+                    f.close()
+                if version == self.FORMAT_VERSION:
+                    self._records = records
+            except (IOError, EOFError, ValueError, TypeError):
+                pass
+        return self._records
+
+    def _save(self):
+        # write to a temporary file first, so that a crash doesn't leave half a cache
+        temp_filename = "%s.%s.tmp" % (self._filename, os.getpid())
+        try:
+            f = open(temp_filename, "wb")
+            try:
+                marshal.dump((self.FORMAT_VERSION, self._records), f)
+            finally:
+                f.close()
+            os.rename(temp_filename, self._filename)
+        except (IOError, OSError):
+            self._log.warning("Failed to write %s" % self._filename, exc_info=True)
+            try:
+                os.remove(temp_filename)
+            except OSError:
+                pass
+
+# ex:ts=4:et:
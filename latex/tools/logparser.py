@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+tools.logparser
+
+Extracts errors and warnings from the output of LaTeX
+"""
+
+import os
+import re
+import mmap
+from logging import getLogger
+
+from ..issues import Issue
+
+
+class LogMessage(object):
+    """
+    An error or warning found in the output of LaTeX
+    """
+
+    __slots__ = ("severity", "filename", "start", "end", "text", "box")
+
+    def __init__(self, severity, filename, start, end, text, box=False):
+        """
+        @param severity: one of Issue.SEVERITY_*
+        @param filename: the name of the file as printed by LaTeX, None if it
+                is not known
+        @param start: the first line (counting from 1) or None
+        @param end: the last line or None
+        @param text: the message as printed by LaTeX
+        @param box: True for an overfull or underfull box
+        """
+        self.severity = severity
+        self.filename = filename
+        self.start = start
+        self.end = end
+        self.text = text
+        self.box = box
+
+    @property
+    def key(self):
+        return (self.severity, self.filename, self.start, self.text)
+
+    def __str__(self):
+        return "LogMessage{%s, %s, %s, '%s'}" % (self.severity, self.filename, self.start, self.text)
+
+
+class LaTeXLogParser(object):
+    """
+    This extracts the errors and warnings from the log of LaTeX or its terminal
+    output in one linear pass.
+
+    The file a message belongs to is taken from the stack of input files, which
+    LaTeX prints as '(filename' when it opens a file and ')' when it closes it.
+    Errors may be in the default format ('! message' followed by the context
+    and 'l.NNN') or in the file:line:error format.
+
+    The output may be passed in chunks of any size with feed(), a log file is
+    read from a memory map with parse_file().
+    """
+
+    _log = getLogger("LaTeXLogParser")
+
+    # LaTeX breaks lines after this number of characters (max_print_line)
+    _LINE_WIDTH = 79
+
+    # when feeding, wait at most for this number of bytes to complete a message
+    _LOOKAHEAD = 4096
+
+    # the messages starting at the beginning of a line
+    _LINE_TOKENS = r"""
+          !\ (?P<error>[^\n]*)
+        | (?P<fle_file>\.{0,2}/[^\s:()]*\.[a-zA-Z0-9]+):(?P<fle_line>[0-9]+):\ (?P<fle_text>[^\n]*)
+        | (?P<warning>(?:(?:LaTeX|Package|Class)(?:\ (?P<package>[^\s]+))?\ Warning|pdfTeX\ warning)[^\n]*)
+        | (?P<box>(?:Over|Under)full\ \\(?P<box_type>[hv])box[^\n]*)
+        | l\.(?P<context_line>[0-9]+)
+        | (?P<banner>This\ is\ [a-zA-Z-]*TeX,\ Version)
+        """
+
+    # all tokens start with one of '(', ')' and a line break, so that the
+    # regular expression engine can skip everything else quickly
+    _TOKEN_PATTERN = re.compile(r"\((?P<pair>[^\s()]*\)) | \((?P<open>[^\s()]*) | (?P<close>\)) | \n(?:%s)" % _LINE_TOKENS, re.VERBOSE)
+    _FIRST_LINE_PATTERN = re.compile(_LINE_TOKENS, re.VERBOSE)
+
+    # the end of the context of an error
+    _CONTEXT_END_PATTERN = re.compile(r"^(?:$|!\ |l\.(?P<line>[0-9]+))", re.MULTILINE)
+
+    _INPUT_LINE_PATTERN = re.compile(r"on input line ([0-9]+)")
+    _BOX_LINES_PATTERN = re.compile(r"at lines? ([0-9]+)(?:--([0-9]+))?")
+    _FILENAME_PATTERN = re.compile(r"\.[a-zA-Z0-9]+$")
+    _NAME_CONTINUATION_PATTERN = re.compile(r"[^\s()]*")
+
+    def __init__(self):
+        self._buffer = ""    # the output not parsed yet, from the start of a line
+        self._pos = 0        # the offset in the buffer to continue at
+        self._files = []     # the stack of open files, None for other parentheses
+
+    @property
+    def filename(self):
+        """
+        Return the name of the innermost open file or None
+        """
+        for filename in reversed(self._files):
+            if filename is not None:
+                return filename
+        return None
+
+    def feed(self, chunk):
+        """
+        Parse a chunk of the output
+
+        A message is only returned when it is complete, so some of the chunk
+        may be kept until the next one arrives.
+
+        @return: a list of LogMessages
+        """
+        self._buffer += chunk
+        limit = self._buffer.rfind("\n") + 1
+        messages, pos = self._scan(self._buffer, self._pos, limit, False)
+
+        # keep the line, so that its length is known
+        start = self._line_start(self._buffer, pos)
+        self._buffer = self._buffer[start:]
+        self._pos = pos - start
+        return messages
+
+    def close(self):
+        """
+        Parse the rest of the output after the last chunk
+
+        @return: a list of LogMessages
+        """
+        messages, pos = self._scan(self._buffer, self._pos, len(self._buffer), True)
+        self._buffer = ""
+        self._pos = 0
+        return messages
+
+    def parse_file(self, filename):
+        """
+        Parse a log file
+
+        @return: a list of LogMessages
+        @raise IOError: if the file cannot be read
+        """
+        f = open(filename, "rb")
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return []
+            buffer = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            try:
+                messages, pos = self._scan(buffer, 0, size, True)
+            finally:
+                buffer.close()
+        finally:
+            f.close()
+        return messages
+
+    def _scan(self, buffer, pos, limit, final):
+        """
+        Parse the output up to a limit
+
+        @param buffer: a str or mmap
+        @param pos: the offset to start at
+        @param limit: the end of the output available, the start of a line
+        @param final: False if more output may follow after the limit
+        @return: a tuple (list of LogMessages, offset to continue at)
+        """
+        messages = []
+        search = self._TOKEN_PATTERN.search
+
+        match = None
+        if pos == 0:
+            match = self._FIRST_LINE_PATTERN.match(buffer, 0, limit)
+
+        while True:
+            if match is None:
+                if pos > 0 and buffer[pos - 1] == "\n":
+                    # include the line break a token at the start of the line needs
+                    match = search(buffer, pos - 1, limit)
+                else:
+                    match = search(buffer, pos, limit)
+                if match is None:
+                    return messages, limit
+
+            kind = match.lastgroup
+            if kind == "pair":
+                # like '(hyperref)', opens and closes nothing
+                next_pos = match.end()
+            elif kind == "open":
+                next_pos = self._on_open(buffer, match, limit, final)
+            elif kind == "close":
+                if len(self._files):
+                    self._files.pop()
+                next_pos = match.end()
+            elif kind == "error":
+                next_pos = self._on_error(buffer, match, limit, final, messages)
+            elif kind == "fle_text":
+                next_pos = self._on_file_line_error(buffer, match, limit, final, messages)
+            elif kind in ("warning", "package"):
+                next_pos = self._on_warning(buffer, match, limit, final, messages)
+            elif kind in ("box", "box_type"):
+                next_pos = self._on_box(buffer, match, limit, final, messages)
+            elif kind == "context_line":
+                # the source text following the line number may contain anything
+                next_pos = self._skip_lines(buffer, match.end(), limit, 2)
+            elif kind == "banner":
+                # a new run of LaTeX in the same output, e.g. from latexmk
+                self._files = []
+                next_pos = match.end()
+            else:
+                next_pos = match.end()
+
+            if next_pos is None:
+                # the message continues after the limit
+                return messages, match.start()
+            pos = next_pos
+            match = None
+
+    def _line_start(self, buffer, pos):
+        return buffer.rfind("\n", 0, pos) + 1
+
+    def _skip_lines(self, buffer, pos, limit, count):
+        """
+        Return the offset after a number of line ends or limit if there are less
+        """
+        for i in range(count):
+            end = buffer.find("\n", pos, limit)
+            if end == -1:
+                return limit
+            pos = end + 1
+        return pos
+
+    def _is_complete(self, pos, limit, final):
+        return final or limit - pos > self._LOOKAHEAD
+
+    def _read_wrapped_line(self, buffer, start, end, limit, final):
+        """
+        Join a line with the lines LaTeX has broken it into
+
+        @param start: the offset the text starts at
+        @param end: the end of the first line
+        @return: a tuple (text, offset after the line) or None if the line
+                continues after the limit
+        """
+        parts = [buffer[start:end]]
+        line_start = self._line_start(buffer, start)
+        while end - line_start == self._LINE_WIDTH:
+            line_start = end + 1
+            end = buffer.find("\n", line_start, limit)
+            if end == -1:
+                if final:
+                    end = limit
+                else:
+                    return None
+            parts.append(buffer[line_start:end])
+        return "".join(parts), min(end + 1, limit)
+
+    def _on_open(self, buffer, match, limit, final):
+        name = match.group("open")
+        pos = match.end()
+
+        # a file name broken at the end of the line
+        while pos < limit and buffer[pos] == "\n" and pos - self._line_start(buffer, pos) == self._LINE_WIDTH:
+            if pos + 1 == limit and not final:
+                return None
+            continuation = self._NAME_CONTINUATION_PATTERN.match(buffer, pos + 1, limit)
+            name += continuation.group()
+            pos = continuation.end()
+            if pos == limit and not final:
+                return None
+
+        if len(name) and self._FILENAME_PATTERN.search(name):
+            self._files.append(name)
+        else:
+            self._files.append(None)
+        return pos
+
+    def _skip_context(self, buffer, pos, limit, final):
+        """
+        Skip the context of an error up to and including the line the source
+        text is shown in
+
+        @return: a tuple (line number or None, offset after the context) or None
+                if it continues after the limit
+        """
+        match = self._CONTEXT_END_PATTERN.search(buffer, pos, limit)
+        if match is None or match.start() == limit:
+            if self._is_complete(pos, limit, final):
+                return None, limit
+            return None
+        line = match.group("line")
+        if line is None:
+            return None, match.start()
+        # the source text follows in two lines
+        end = buffer.find("\n", match.end(), limit)
+        if end != -1:
+            end = buffer.find("\n", end + 1, limit)
+        if end == -1:
+            if self._is_complete(pos, limit, final):
+                return int(line), limit
+            return None
+        return int(line), end + 1
+
+    def _on_error(self, buffer, match, limit, final, messages):
+        line = self._read_wrapped_line(buffer, match.start("error"), match.end(), limit, final)
+        if line is None:
+            return None
+        text, pos = line
+
+        context = self._skip_context(buffer, pos, limit, final)
+        if context is None:
+            return None
+        number, pos = context
+
+        messages.append(LogMessage(Issue.SEVERITY_ERROR, self.filename, number, None, text))
+        return pos
+
+    def _on_file_line_error(self, buffer, match, limit, final, messages):
+        line = self._read_wrapped_line(buffer, match.start("fle_text"), match.end(), limit, final)
+        if line is None:
+            return None
+        text, pos = line
+
+        context = self._skip_context(buffer, pos, limit, final)
+        if context is None:
+            return None
+        number, pos = context
+
+        messages.append(LogMessage(Issue.SEVERITY_ERROR, match.group("fle_file"),
+                                   int(match.group("fle_line")), None, text))
+        return pos
+
+    def _on_warning(self, buffer, match, limit, final, messages):
+        line = self._read_wrapped_line(buffer, match.start("warning"), match.end(), limit, final)
+        if line is None:
+            return None
+        text, pos = line
+
+        # the message of a package continues in lines starting with '(name)'
+        package = match.group("package")
+        if package is not None:
+            prefix = "(%s)" % package
+            while True:
+                if pos == limit:
+                    if self._is_complete(pos, limit, final):
+                        break
+                    return None
+                if buffer[pos:pos + len(prefix)] != prefix:
+                    break
+                end = buffer.find("\n", pos, limit)
+                if end == -1:
+                    if not self._is_complete(pos, limit, final):
+                        return None
+                    end = limit
+                text += " " + buffer[pos + len(prefix):end].strip()
+                pos = min(end + 1, limit)
+
+        number = self._INPUT_LINE_PATTERN.search(text)
+        if number is not None:
+            number = int(number.group(1))
+
+        messages.append(LogMessage(Issue.SEVERITY_WARNING, self.filename, number, None, text))
+        return pos
+
+    def _on_box(self, buffer, match, limit, final, messages):
+        text = match.group("box")
+        pos = self._skip_lines(buffer, match.end(), limit, 1)
+
+        if match.group("box_type") == "h":
+            # the content of the box follows up to an empty line
+            end = buffer.find("\n\n", pos - 1, limit)
+            if end == -1:
+                if not self._is_complete(pos, limit, final):
+                    return None
+            else:
+                pos = end + 2
+
+        start, end = None, None
+        lines = self._BOX_LINES_PATTERN.search(text)
+        if lines is not None:
+            start = int(lines.group(1))
+            if lines.group(2) is not None:
+                end = int(lines.group(2))
+
+        messages.append(LogMessage(Issue.SEVERITY_WARNING, self.filename, start, end, text, True))
+        return pos
+
+# ex:ts=4:et:
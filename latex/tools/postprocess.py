@@ -28,12 +28,31 @@ import re
 from ..issues import Issue
 from ..util import escape
 
+from logparser import LaTeXLogParser
+
 
 class PostProcessor(object):
     """
     The contract for a post-processor
     """
 
+    # True if the Job runs LaTeX once, so that the ToolRunner may skip or
+    # repeat it depending on the auxiliary files
+    latex_pass = False
+
+    def feed(self, file, stdout, stderr):
+        """
+        Pass a chunk of the output of the running Tool process, so that issues
+        can be shown before it has finished
+
+        @param file: the File processed by the Tool
+        @param stdout: a chunk of the output written to STDOUT, may be empty
+        @param stderr: a chunk of the output written to STDERR, may be empty
+        @return: a list of the Issues found in the output so far and not
+                returned before
+        """
+        return []
+
     def process(self, file, stdout, stderr, condition):
         """
         @param file: the File processed by the Tool
@@ -53,7 +72,7 @@ class PostProcessor(object):
     @property
     def issues(self):
         """
-        Return a list of Issues
+        Return a list of Issues, without the ones already returned by feed()
         """
         raise NotImplementedError
 
@@ -64,6 +83,14 @@ class PostProcessor(object):
         """
         raise NotImplementedError
 
+    @property
+    def rerun_requested(self):
+        """
+        Return whether the output asks for running the Tool process again,
+        e.g. to get cross-references right
+        """
+        return False
+
 
 class GenericPostProcessor(PostProcessor):
     """
@@ -98,18 +125,47 @@ class GenericPostProcessor(PostProcessor):
 
 class LaTeXPostProcessor(PostProcessor):
     """
-    This post-processor generates messages from a standard LaTeX log with
-    default error format (NOT using "-file-line-error")
+    This post-processor generates messages from the log of LaTeX, in the
+    default error format or the file:line:error format
+
+    The messages are taken from the terminal output while LaTeX is running and
+    completed from the log file when it has finished.
     """
 
     _log = logging.getLogger(__name__ + ".LatexPostProcessor")
 
     name = "LaTeXPostProcessor"
 
-    _PATTERN = pattern = re.compile(r"(^! (?P<text>.*?)$)|(^l\.(?P<line>[0-9]+))", re.MULTILINE)
+    latex_pass = True
+
+    # e.g. 'Label(s) may have changed. Rerun to get cross-references right.'
+    # or 'Table widths have changed. Rerun LaTeX.'
+    _RERUN_PATTERN = re.compile(r"[Rr]erun (?:to get|LaTeX)")
 
     def __init__(self):
         self._successful = False
+        self._rerun_requested = False
+        self._stdout_parser = LaTeXLogParser()
+        self._reported = set()    # the keys of the LogMessages returned by feed()
+        self._files = {}          # { filename -> File }
+
+        # FIXME: circ dep
+        from ..preferences import Preferences
+
+        self._hide_box_warnings = Preferences().get("hide-box-warnings")
+
+    def feed(self, file, stdout, stderr):
+        issues = []
+        for message in self._stdout_parser.feed(stdout):
+            self.__check_rerun(message)
+
+            # latexmk and the like run LaTeX more than once
+            if not message.key in self._reported:
+                self._reported.add(message.key)
+                issue = self._create_issue(file, message)
+                if issue is not None:
+                    issues.append(issue)
+        return issues
 
     def process(self, file, stdout, stderr, condition):
         self._file = file
@@ -123,36 +179,62 @@ class LaTeXPostProcessor(PostProcessor):
     def summary(self):
         return self._summary
 
+    @property
+    def rerun_requested(self):
+        return self._rerun_requested
+
+    def __check_rerun(self, message):
+        if message.severity == Issue.SEVERITY_WARNING and self._RERUN_PATTERN.search(message.text):
+            self._rerun_requested = True
+
+    def _create_issue(self, file, message):
+        """
+        @param file: the File processed by LaTeX
+        @param message: a LogMessage
+        @return: an Issue or None if the message is hidden
+        """
+        if message.box and self._hide_box_warnings:
+            return None
+
+        if message.filename is None:
+            issue_file = file
+        else:
+            # the names are relative to the directory LaTeX runs in
+            try:
+                issue_file = self._files[message.filename]
+            except KeyError:
+                from ..file import File        # FIXME: this produces a circ dep on toplevel
+
+                issue_file = File.create_from_relative_path(message.filename, file.dirname)
+                self._files[message.filename] = issue_file
+
+        start, end = None, None
+        if message.start is not None:
+            start = message.start - 1
+        if message.end is not None:
+            end = message.end - 1
+
+        return Issue(escape(message.text), start, end, issue_file, message.severity, Issue.POSITION_LINE)
+
     @property
     def issues(self):
         try:
-            log = open("%s.log" % self._file.shortname).read()
-
-            # check for wrong format
-            if log.find("file:line:error") > 0:
-                return [Issue("The file:line:error format is not supported. Please remove that switch.", None, None, self._file, Issue.SEVERITY_ERROR)]
-
-            # process log file and extract tuples like (message, line)
-            tuples = []
-            for match in self._PATTERN.finditer(log):
-                if match.group("text"):
-                    tuple = [match.group("text"), 0]
-                elif match.group("line"):
-                    tuple[1] = match.group("line")
-                    tuples.append(tuple)
-
-            # generate issues from tuples
-            self._issues = []
-            for tuple in tuples:
-                text = tuple[0]
-                line = int(tuple[1]) - 1
-                self._issues.append(Issue(text, line, None, self._file, Issue.SEVERITY_ERROR, Issue.POSITION_LINE))
-
-            return self._issues
-
+            messages = LaTeXLogParser().parse_file("%s.log" % self._file.shortname)
         except IOError:
             return [Issue("No LaTeX log file found", None, None, self._file, Issue.SEVERITY_ERROR)]
 
+        # generate issues from the messages not shown while running
+        self._issues = []
+        for message in messages:
+            self.__check_rerun(message)
+
+            if not message.key in self._reported:
+                issue = self._create_issue(self._file, message)
+                if issue is not None:
+                    self._issues.append(issue)
+
+        return self._issues
+
 
 class RubberPostProcessor(PostProcessor):
     """
@@ -24,21 +24,27 @@ tools.util
 
 import logging
 import os
+import errno
 import signal
 import subprocess
 import fcntl
 
-from gi.repository import GObject
+from gi.repository import GLib
 
 LOG = logging.getLogger(__name__)
 
 class Process(object):
     """
-    This runs a command in a child process and polls the output
+    This runs a command in a child process and passes its output on as it
+    arrives
+
+    The output is read when the main loop reports it, in chunks of at most
+    CHUNK_SIZE bytes.
     """
 
-    # intervall of polling stdout of the child process
-    __POLL_INTERVAL = 250
+    CHUNK_SIZE = 4096
+
+    __process = None
 
     def execute(self, command):
         LOG.debug("execute: %s" % command)
@@ -46,56 +52,88 @@ class Process(object):
         # run child process
         self.__process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
                                         stderr=subprocess.PIPE)
+        self.__aborted = False
 
         # unblock pipes
         fcntl.fcntl(self.__process.stdout, fcntl.F_SETFL, os.O_NONBLOCK)
         fcntl.fcntl(self.__process.stderr, fcntl.F_SETFL, os.O_NONBLOCK)
 
         # monitor process and pipes
-        self.__handlers = [ GObject.timeout_add(self.__POLL_INTERVAL, self.__on_stdout),
-                            GObject.timeout_add(self.__POLL_INTERVAL, self.__on_stderr),
-                            GObject.child_watch_add(self.__process.pid, self.__on_exit) ]
+        condition = GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR
+        self.__pipe_handlers = {
+            self.__process.stdout : GLib.io_add_watch(self.__process.stdout.fileno(), GLib.PRIORITY_DEFAULT,
+                                                      condition, self.__on_output,
+                                                      self.__process.stdout, self._on_stdout),
+            self.__process.stderr : GLib.io_add_watch(self.__process.stderr.fileno(), GLib.PRIORITY_DEFAULT,
+                                                      condition, self.__on_output,
+                                                      self.__process.stderr, self._on_stderr) }
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, self.__process.pid, self.__on_exit)
 
     def abort(self):
         """
         Abort the running process
         """
-        if self.__process:
-            for handler in self.__handlers:
-                GObject.source_remove(handler)
+        if self.__process and not self.__aborted:
+            self.__close_pipes()
 
             try:
                 os.kill(self.__process.pid, signal.SIGTERM)
 
+                # the child watch is kept to reap the process, but nothing is reported
+                self.__aborted = True
+
                 self._on_abort()
             except OSError, e:
                 LOG.error("Failed to abort process: %s" % e)
 
-    def __on_stdout(self):
-        try:
-            s = self.__process.stdout.read()
-            if len(s):
-                self._on_stdout(s)
-        except IOError:
-            pass
-        return True
-
-    def __on_stderr(self):
+    def __read(self, pipe):
+        """
+        Read a chunk from a pipe
+
+        @return: the chunk, an empty string if the pipe has been closed by the
+                child process or None if there is nothing to read right now
+        """
         try:
-            s = self.__process.stderr.read()
-            if len(s):
-                self._on_stderr(s)
-        except IOError:
-            pass
-        return True
+            return os.read(pipe.fileno(), self.CHUNK_SIZE)
+        except OSError, e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return None
+            LOG.error("Failed to read output: %s" % e)
+            return ""
+
+    def __on_output(self, fd, condition, pipe, callback):
+        s = self.__read(pipe)
+        if s is None:
+            return True
+        if len(s):
+            callback(s)
+            return True
+
+        # end of output, returning False removes the watch
+        del self.__pipe_handlers[pipe]
+        pipe.close()
+        return False
+
+    def __close_pipes(self):
+        for pipe, handler in self.__pipe_handlers.items():
+            GLib.source_remove(handler)
+            pipe.close()
+        self.__pipe_handlers = {}
 
     def __on_exit(self, pid, condition):
-        for handler in self.__handlers:
-            GObject.source_remove(handler)
-
-        # read remaining output
-        self.__on_stdout()
-        self.__on_stderr()
+        if self.__aborted:
+            return
+
+        # read remaining output, the child has written all of it by now
+        for pipe, callback in ((self.__process.stdout, self._on_stdout),
+                               (self.__process.stderr, self._on_stderr)):
+            if pipe in self.__pipe_handlers:
+                s = self.__read(pipe)
+                while s:
+                    callback(s)
+                    s = self.__read(pipe)
+
+        self.__close_pipes()
 
         self._on_exit(condition)
 
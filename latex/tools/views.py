@@ -131,7 +131,8 @@ class ToolView(PanelView, IStructuredIssueHandler):
         if issue:
             self._context.activate_editor(issue.file)
             if self._context.active_editor:
-                self._context.active_editor.select_lines(issue.start)
+                if issue.start is not None:
+                    self._context.active_editor.select_lines(issue.start, issue.end)
             else:
                 LOG.error("No Editor object for calling select_lines")
 
@@ -173,6 +174,15 @@ class ToolView(PanelView, IStructuredIssueHandler):
             icon = self._ICON_RUN
         elif state == "succeeded":
             icon = self._ICON_SUCCESS
+        elif state in ("up-to-date", "converged"):
+            # a Job skipped by the BuildCache or a pass of LaTeX that is not needed
+            icon = self._ICON_SUCCESS
+            if state == "up-to-date":
+                note = _("up to date")
+            else:
+                note = _("not needed")
+            label = self._store.get_value(partition_id, 1)
+            self._store.set_value(partition_id, 1, "%s <i>(%s)</i>" % (label, note))
         elif state == "failed":
             icon = self._ICON_FAIL
         elif state == "aborted":
@@ -187,7 +197,11 @@ class ToolView(PanelView, IStructuredIssueHandler):
                 icon = self._ICON_WARNING
             elif issue.severity == Issue.SEVERITY_ERROR:
                 icon = self._ICON_ERROR
-            self._store.append(partition_id, [icon, issue.message, issue.file.basename, str(issue.start), issue])
+            if issue.start is None:
+                line = ""
+            else:
+                line = str(issue.start)
+            self._store.append(partition_id, [icon, issue.message, issue.file.basename, line, issue])
 
             LOG.debug("Issue: %s" % issue)
 
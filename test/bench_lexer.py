@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+test.bench_lexer
+
+Times the Lexer and the per-character state machine it replaced on the test
+corpus, concatenated to about 400 KB
+
+    python test/bench_lexer.py [repetitions]
+"""
+
+import sys
+import time
+
+from common import CORPUS, read
+
+import reference_lexer
+from latex.latex.lexer import Lexer
+
+
+def best_of(runs, function, *args):
+    times = []
+    for i in xrange(runs):
+        t = time.time()
+        function(*args)
+        times.append(time.time() - t)
+    return min(times)
+
+
+def count_tokens(lexer_class, source):
+    return sum(1 for token in lexer_class(source))
+
+
+def main(repetitions):
+    corpus = u"".join([read(filename) for filename in CORPUS])
+    source = corpus * (400000 / len(corpus) + 1)
+
+    print "%d characters, %d tokens" % (len(source), count_tokens(Lexer, source))
+
+    reference = best_of(repetitions, count_tokens, reference_lexer.Lexer, source)
+    current = best_of(repetitions, count_tokens, Lexer, source)
+
+    print "reference lexer: %.3f s" % reference
+    print "Lexer:           %.3f s (%.1fx)" % (current, reference / current)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
+
+# ex:ts=4:et:
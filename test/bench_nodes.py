@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+test.bench_nodes
+
+Measures the memory used by the document models of the test corpus, with the
+node model of latex.parser and with the one it replaced
+
+    python test/bench_nodes.py [repetitions]
+
+Each model is measured in a process of its own, as the peak resident set
+size is all we can get.
+"""
+
+import gc
+import sys
+import resource
+import subprocess
+
+from common import CORPUS, read
+
+
+def count_nodes(node):
+    count = 1
+    for child in node:
+        count += count_nodes(child)
+    return count
+
+
+def measure(name, repetitions):
+    """
+    Keep the given number of models of the corpus in memory
+
+    @return: the number of nodes and the growth of the peak RSS in KB
+    """
+    if name == "reference":
+        import reference_parser as parser
+    else:
+        from latex.latex import parser
+    from latex.issues import CollectingIssueHandler
+
+    corpus = u"".join([read(filename) for filename in CORPUS])
+
+    gc.collect()
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    documents = [parser.LaTeXParser().parse(corpus, None, CollectingIssueHandler()) for i in xrange(repetitions)]
+
+    gc.collect()
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return sum([count_nodes(document) for document in documents]), after - before
+
+
+def main(repetitions):
+    for name in ("reference", "current"):
+        output = subprocess.check_output([sys.executable, __file__, "--measure", name, str(repetitions)])
+        nodes, kilobytes = [int(value) for value in output.split()]
+        print "%-9s %d nodes, %.0f MB, %.0f bytes per node" % (name, nodes, kilobytes / 1024.0,
+                                                               kilobytes * 1024.0 / nodes)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--measure":
+        print "%d %d" % measure(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
+
+# ex:ts=4:et:
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+"""
+test.bench_offsetmap
+
+Times the lookups of OutlineOffsetMap and of the linear scan it replaced on
+outlines with up to tens of thousands of elements
+
+    python test/bench_offsetmap.py [lookups]
+"""
+
+import sys
+import time
+import random
+
+from test_offsetmap import random_outline, reference_lookup
+
+from latex.outline import OutlineOffsetMap
+
+
+def time_lookups(lookup, offsets):
+    """
+    @return: the average time of a lookup in microseconds
+    """
+    t = time.time()
+    for offset in offsets:
+        try:
+            lookup(offset)
+        except KeyError:
+            pass
+    return (time.time() - t) * 1e6 / len(offsets)
+
+
+def main(lookups):
+    rnd = random.Random(0)
+
+    for count in (1000, 10000, 50000):
+        elements, length = random_outline(count)
+        offsets = [rnd.randint(0, length) for i in xrange(lookups)]
+
+        offset_map = OutlineOffsetMap()
+        t = time.time()
+        for start, end, path in elements:
+            offset_map.put(start, path, end)
+        offset_map.lookup(length)    # sorts the elements
+        prepare = (time.time() - t) * 1e3
+
+        current = time_lookups(offset_map.lookup, offsets)
+
+        # the linear scan is too slow for all offsets
+        starts = dict([(start, path) for start, end, path in elements])
+        reference = time_lookups(lambda offset: reference_lookup(starts, offset), offsets[:50])
+
+        print "%5d elements: filling %.1f ms, lookup %.2f us, linear scan %.0f us (%.0fx)" % \
+                (count, prepare, current, reference, reference / current)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+
+# ex:ts=4:et:
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+"""
+test.bench_walker
+
+Times the outline generation and validation of an expanded master in one walk
+(latex.walker) and in the separate passes it replaced, on a generated project
+of a master with five chapters
+
+    python test/bench_walker.py [repetitions]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+from test_walker import parse, reference_master, walked_master, reference_child, walked_child
+
+from common import setup_resources
+from latex.file import File
+from latex.issues import CollectingIssueHandler
+from latex.latex.parser import LaTeXParser
+
+
+def best_of(runs, function, *args):
+    times = []
+    for i in xrange(runs):
+        t = time.time()
+        function(*args)
+        times.append(time.time() - t)
+    return min(times)
+
+
+def section(rnd, prefix, i, count):
+    return ("\\section{Section %s %d}\\label{sec:%s%d}\n"
+            "Text \\ref{sec:%s%d} and \\eqref{eq:%s%d} \\TODO{fix %d}\n"
+            "\\begin{equation}\\label{eq:%s%d}x=1\\end{equation}\n"
+            "\\begin{tabular}{ll}a&b\\end{tabular}\n"
+            "\\subsection{Sub \\emph{%d}}\n\\[ y \\]\n") % \
+            (prefix, i, prefix, i, prefix, rnd.randint(0, count), prefix, i, i, prefix, i, i)
+
+
+def create_project(directory):
+    """
+    @return: the File objects of the master and of a chapter
+    """
+    rnd = random.Random(0)
+
+    def write(name, content):
+        f = open(os.path.join(directory, name), "w")
+        f.write(content)
+        f.close()
+
+    for c in xrange(5):
+        write("chap%d.tex" % c, "".join([section(rnd, "c%d" % c, i, 300) for i in xrange(300)]))
+
+    write("main.tex", "\\documentclass{article}\\usepackage{amsmath}\n\\begin{document}\n"
+                      + "".join([section(rnd, "m", i, 100) for i in xrange(100)])
+                      + "".join(["\\input{chap%d}\n" % c for c in xrange(5)])
+                      + "\\end{document}\n")
+
+    return File(os.path.join(directory, "main.tex")), File(os.path.join(directory, "chap2.tex"))
+
+
+def main(repetitions):
+    setup_resources()
+    directory = tempfile.mkdtemp(prefix="gedit-latex-bench-")
+    try:
+        master_file, child_file = create_project(directory)
+
+        document = parse(master_file)
+        reference = best_of(repetitions, reference_master, document)
+        current = best_of(repetitions, walked_master, document)
+        print "master: separate passes %.1f ms, one walk %.1f ms (%.1fx)" % \
+                (reference * 1e3, current * 1e3, reference / current)
+
+        local = LaTeXParser().parse(open(child_file.path).read().decode("utf-8"), child_file,
+                                    CollectingIssueHandler())
+        master = parse(master_file, overrides={child_file.uri : local})
+        reference = best_of(repetitions, reference_child, master, local)
+        current = best_of(repetitions, walked_child, master, local)
+        print "child:  separate passes %.1f ms, one walk %.1f ms (%.1fx)" % \
+                (reference * 1e3, current * 1e3, reference / current)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+
+# ex:ts=4:et:
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+test.common
+
+Makes the modules of the plugin importable by the tests and benchmarks
+
+The tests are run from the source tree with
+
+    python -m unittest discover -s test
+
+The modules are imported without latex/__init__.py, which registers the
+plugin with gedit, but they still need PyGObject. The user's settings are
+read from GSettings, so the plugin's schema has to be installed.
+"""
+
+import os
+import sys
+import imp
+import gettext
+import atexit
+import shutil
+import tempfile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(os.path.dirname(TEST_DIR), "latex")
+DATA_DIR = os.path.join(os.path.dirname(TEST_DIR), "data")
+
+# the documents of the test corpus
+CORPUS = [os.path.join(TEST_DIR, name) for name in ("article.tex", "chap2.tex", "chap3.tex")]
+
+
+def _register_package(name, path):
+    if name not in sys.modules:
+        package = imp.new_module(name)
+        package.__path__ = [path]
+        package.__package__ = name
+        sys.modules[name] = package
+
+_register_package("latex", SOURCE_DIR)
+
+# gedit installs _() for its plugins, some modules use it without importing it
+gettext.install("gedit-latex-test", unicode=True)
+
+if TEST_DIR not in sys.path:
+    sys.path.insert(0, TEST_DIR)
+
+
+_user_dir = None
+
+def setup_resources():
+    """
+    Let the plugin store its caches in a temporary directory that is removed
+    when the tests have finished
+    """
+    global _user_dir
+
+    if _user_dir is None:
+        _user_dir = tempfile.mkdtemp(prefix="gedit-latex-test-")
+        atexit.register(shutil.rmtree, _user_dir, True)
+
+        from latex.resources import Resources
+        Resources().set_dirs(_user_dir, DATA_DIR)
+
+    return _user_dir
+
+
+def read(filename):
+    """
+    @return: the content of a file as unicode
+    """
+    f = open(filename)
+    try:
+        return f.read().decode("utf-8")
+    finally:
+        f.close()
+
+# ex:ts=4:et:
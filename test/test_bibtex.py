@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+
+"""
+test.test_bibtex
+
+Checks the BibTeX parser, its Document model and the validator on random
+bibliographies
+"""
+
+import os
+import random
+import pickle
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from common import TEST_DIR, read, setup_resources
+
+from latex.file import File
+from latex.issues import CollectingIssueHandler
+from latex.bibtex.parser import BibTeXLexer, BibTeXParser
+from latex.bibtex.validator import BibTeXValidator
+from latex.bibtex.editor import ParseJob
+
+
+TYPES = [u"article", u"book", u"Misc", u"inproceedings"]
+AUTHORS = [u"Knuth", u"Lamport", u"Knuth and Lamport", u"Dijkstra"]
+YEARS = [u"1968", u"1976", u"1984"]
+
+
+def random_entry(rnd):
+    """
+    @return: the source of an Entry with a random type, key and fields
+    """
+    fields = []
+    if rnd.random() < 0.8:
+        fields.append(u"author = {%s}" % rnd.choice(AUTHORS))
+    if rnd.random() < 0.8:
+        fields.append(u"year = %s" % rnd.choice(YEARS))
+    if rnd.random() < 0.5:
+        fields.append(u"title = \"A {Title} with \\\"quotes\\\"\"")
+    if rnd.random() < 0.2:
+        fields.append(u"note = pre # \" and \"")
+    return u"@%s{key%d,\n  %s\n}\n" % (rnd.choice(TYPES), rnd.randint(0, 20), u",\n  ".join(fields))
+
+
+# sources the parser reports issues for
+MALFORMED = [u"@article{\n", u"@book{broken, title = {x}}}\n", u"@{key3, year = 1968}\n", u"@misc key4\n"]
+
+
+def random_bibliography(rnd, count):
+    parts = [u"@string{pre = \"Preface\"}\n", u"% a comment\n"]
+    for i in xrange(count):
+        if rnd.random() < 0.05:
+            parts.append(rnd.choice(MALFORMED))
+        else:
+            parts.append(random_entry(rnd))
+    return u"".join(parts)
+
+
+def describe_document(document):
+    """
+    @return: a list of tuples of everything the model tells about the entries
+            and constants
+    """
+    entries = [(entry.type, entry.key, entry.start, entry.end,
+                [(field.name, field.valueString) for field in entry.fields])
+               for entry in document.entries]
+    constants = [(constant.name, constant.start) for constant in document.constants]
+    return entries, constants
+
+
+def describe_issues(issues):
+    return [(issue.message, issue.start, issue.end, issue.severity) for issue in issues]
+
+
+def describe_indexes(document):
+    """
+    @return: the indexes of a Document, mapping to the positions of the
+            listed entries in the document
+    """
+    positions = dict([(id(entry), i) for i, entry in enumerate(document.entries)])
+
+    def positions_of(entries):
+        return [positions[id(entry)] for entry in entries]
+
+    return ([(key, positions_of(document.find_entries_by_key(key))) for key in sorted(document.keys)],
+            [(type, positions_of(document.find_entries_by_type(type))) for type in sorted(document.types)],
+            [(author, positions_of(document.find_entries_by_author(author))) for author in sorted(document.authors)],
+            [(year, positions_of(document.find_entries_by_year(year))) for year in sorted(document.years)])
+
+
+def parse_and_validate(source, file):
+    """
+    @return: a tuple of the Document, the Issues found while parsing and the
+            ones found while validating
+    """
+    parse_issue_handler = CollectingIssueHandler()
+    document = BibTeXParser().parse(source, file, parse_issue_handler)
+    validate_issue_handler = CollectingIssueHandler()
+    BibTeXValidator().validate(document, file, validate_issue_handler)
+    return document, parse_issue_handler.issues, validate_issue_handler.issues
+
+
+class ParseJobTest(unittest.TestCase):
+    """
+    The Job parsing and validating in a worker process and its pickled result
+    """
+
+    def setUp(self):
+        # the validator reads the BibTeX model from the resources
+        setup_resources()
+        self._file = File("/tmp/bibliography.bib")
+
+    def assertResult(self, source):
+        document, parse_issues, validation_issues = parse_and_validate(source, self._file)
+
+        # the result is pickled by the worker process
+        result = pickle.loads(pickle.dumps(ParseJob()._run([self._file, source]), pickle.HIGHEST_PROTOCOL))
+        job_document, job_parse_issues, job_validation_issues = result
+
+        self.assertEqual(describe_document(document), describe_document(job_document))
+        self.assertEqual(describe_issues(parse_issues), describe_issues(job_parse_issues))
+
+        # the validation issues are mapped to the entries of the document
+        issues = []
+        for entry in job_document.entries:
+            issues += job_validation_issues.pop(entry, [])
+        self.assertEqual({}, job_validation_issues)
+        self.assertEqual(describe_issues(validation_issues), describe_issues(issues))
+
+        # the indexes still refer to the entries of the document
+        for entry in job_document.entries:
+            self.assertTrue(entry in job_document.find_entries_by_key(entry.key))
+            self.assertTrue(job_document.find_entry(entry.key) in job_document.entries)
+
+    def test_article(self):
+        self.assertResult(read("%s/article.bib" % TEST_DIR))
+
+    def test_random(self):
+        rnd = random.Random(0)
+        for i in xrange(20):
+            self.assertResult(random_bibliography(rnd, 30))
+
+
+
+class DocumentIndexTest(unittest.TestCase):
+    """
+    The indexes of a Document list the same entries as a scan, in the order
+    of the file
+    """
+
+    HEADER = u"@string{pre = \"Preface\"}\n"
+
+    def setUp(self):
+        self._file = File("/tmp/bibliography.bib")
+
+    def _parse(self, source):
+        return BibTeXParser().parse(source, self._file, CollectingIssueHandler())
+
+    def assertIndexesMatchScan(self, document):
+        entries = document.entries
+
+        def scan(predicate):
+            return [i for i, entry in enumerate(entries) if predicate(entry)]
+
+        keys, types, authors, years = describe_indexes(document)
+
+        self.assertEqual(sorted(set(entry.key for entry in entries)), [key for key, positions in keys])
+        for key, positions in keys:
+            self.assertEqual(scan(lambda entry: entry.key == key), positions)
+            self.assertTrue(document.find_entry(key) is entries[positions[0]])
+        self.assertEqual(None, document.find_entry(u"missing"))
+
+        self.assertEqual(sorted(set(entry.type.lower() for entry in entries)), [type for type, positions in types])
+        for type, positions in types:
+            self.assertEqual(scan(lambda entry: entry.type.lower() == type), positions)
+
+        for author, positions in authors:
+            self.assertEqual(scan(lambda entry: author in (entry.authors or [None])), positions)
+        self.assertEqual(len(set(author for entry in entries for author in (entry.authors or [None]))), len(authors))
+
+        for year, positions in years:
+            self.assertEqual(scan(lambda entry: entry.year == year), positions)
+        self.assertEqual(len(set(entry.year for entry in entries)), len(years))
+
+    def test_parse(self):
+        rnd = random.Random(4)
+        for i in xrange(20):
+            self.assertIndexesMatchScan(self._parse(random_bibliography(rnd, 30)))
+
+    def test_type_is_case_insensitive(self):
+        document = self._parse(u"@Misc{a, year = 1968}\n@MISC{b}\n@misc{c}\n")
+        self.assertEqual([u"a", u"b", u"c"], [entry.key for entry in document.find_entries_by_type(u"mIsC")])
+
+    def test_replace_entries(self):
+        rnd = random.Random(5)
+        for i in xrange(200):
+            parts = [random_entry(rnd) for j in xrange(rnd.randint(0, 15))]
+            document = self._parse(self.HEADER + u"".join(parts))
+
+            first = rnd.randint(0, len(parts))
+            last = rnd.randint(first, len(parts))
+            new_parts = parts[:first] + [random_entry(rnd) for j in xrange(rnd.randint(0, 3))] + parts[last:]
+            count = len(new_parts) - len(parts) + last - first
+
+            # the new entries are taken from a parse of the edited source
+            expected = self._parse(self.HEADER + u"".join(new_parts))
+            delta = len(u"".join(new_parts)) - len(u"".join(parts))
+            document.replace_entries(first, last, expected.entries[first:first + count], delta)
+
+            self.assertEqual(describe_document(expected)[0], describe_document(document)[0])
+            self.assertEqual(describe_indexes(expected), describe_indexes(document))
+            self.assertIndexesMatchScan(document)
+
+
+class ReparseTest(unittest.TestCase):
+    """
+    Compares the Document updated by BibTeXParser.reparse after random edits
+    with the one of a full parse
+    """
+
+    # text random edits insert besides whole entries
+    FRAGMENTS = [u"", u"@", u"{", u"}", u",", u"\"", u"x", u"\n", u"year = 1976", u"@string{b = \"B\"}"]
+
+    def setUp(self):
+        setup_resources()
+        self._file = File("/tmp/bibliography.bib")
+
+    def _validate(self, document, entries, validation_issues):
+        """
+        Validate some entries again like BibTeXEditor does after a reparse
+
+        @param validation_issues: a dict { Entry -> list of Issues } to update
+        """
+        validator = BibTeXValidator()
+        for entry in entries:
+            issue_handler = CollectingIssueHandler()
+            validator.validate_entry(document, entry, self._file, issue_handler)
+            if len(issue_handler.issues):
+                validation_issues[entry] = issue_handler.issues
+            else:
+                validation_issues.pop(entry, None)
+
+    def test_random_edits(self):
+        rnd = random.Random(6)
+        for i in xrange(20):
+            source = random_bibliography(rnd, 20)
+            parse_issue_handler = CollectingIssueHandler()
+            document = BibTeXParser().parse(source, self._file, parse_issue_handler)
+            issues = parse_issue_handler.issues
+            validation_issues = {}
+            self._validate(document, document.entries, validation_issues)
+
+            for j in xrange(50):
+                start = rnd.randint(0, len(source))
+                old_end = min(len(source), start + rnd.randint(0, 60))
+                if rnd.random() < 0.5:
+                    text = u"".join(random_entry(rnd) for k in xrange(rnd.randint(0, 2)))
+                else:
+                    text = rnd.choice(self.FRAGMENTS)
+                source = source[:start] + text + source[old_end:]
+                new_end = start + len(text)
+
+                first, removed, added = BibTeXParser().reparse(source, document, self._file, issues,
+                                                               start, old_end, new_end)
+
+                # the entries sharing a key with a changed one may have become duplicates or not
+                for entry in removed:
+                    validation_issues.pop(entry, None)
+                for key in set(entry.key for entry in removed + added):
+                    self._validate(document, document.find_entries_by_key(key), validation_issues)
+
+                expected, expected_parse_issues, expected_validation_issues = parse_and_validate(source, self._file)
+
+                message = repr(source)
+                self.assertEqual(describe_document(expected), describe_document(document), message)
+                self.assertEqual(describe_indexes(expected), describe_indexes(document), message)
+                self.assertEqual(describe_issues(expected_parse_issues), describe_issues(issues), message)
+
+                self.assertEqual(added, document.entries[first:first + len(added)])
+
+                actual_validation_issues = []
+                for entry in document.entries:
+                    for issue in validation_issues.get(entry, []):
+                        # a validation issue spans its entry, which may have moved
+                        issue.start, issue.end = entry.start, entry.end
+                        actual_validation_issues.append(issue)
+                self.assertEqual(describe_issues(expected_validation_issues),
+                                 describe_issues(actual_validation_issues), message)
+
+    def test_duplicate_key(self):
+        validator = BibTeXValidator()
+
+        def duplicates(document):
+            issue_handler = CollectingIssueHandler()
+            for entry in document.entries:
+                validator.validate_entry(document, entry, self._file, issue_handler)
+            return [issue.start for issue in issue_handler.issues if issue.message.startswith("Duplicate key")]
+
+        source = u"@misc{a}\n@misc{b}\n@misc{c}\n"
+        issues = []
+        document = BibTeXParser().parse(source, self._file, CollectingIssueHandler())
+        self.assertEqual([], duplicates(document))
+
+        # renaming b to a makes the second entry a duplicate
+        offset = source.index(u"b}")
+        source = source[:offset] + u"a" + source[offset + 1:]
+        BibTeXParser().reparse(source, document, self._file, issues, offset, offset + 1, offset + 1)
+        self.assertEqual([u"a", u"a", u"c"], [entry.key for entry in document.entries])
+        self.assertEqual([document.entries[1].start], duplicates(document))
+
+        # removing the first entry makes the other one the first with its key
+        end = source.index(u"@", 1)
+        source = source[end:]
+        BibTeXParser().reparse(source, document, self._file, issues, 0, end, 0)
+        self.assertEqual([u"a", u"c"], [entry.key for entry in document.entries])
+        self.assertEqual(0, document.entries[0].start)
+        self.assertEqual([], duplicates(document))
+
+
+def tokenize(source, offset=0, chunk_size=None):
+    lexer = BibTeXLexer(source, offset)
+    if chunk_size is not None:
+        lexer.CHUNK_SIZE = chunk_size
+    return [(token.type, token.offset, token.value) for token in lexer]
+
+
+class LexerChunkTest(unittest.TestCase):
+    """
+    The tokens must not depend on where the chunks the source is read in end
+    """
+
+    # fragments random sources are made of, a backslash escapes the following
+    # character, even at the end of a chunk
+    FRAGMENTS = [u"@", u",", u"=", u"#", u"\"", u"{", u"}", u"(", u")", u"\\", u"\\\\", u"\\{",
+                 u"\\\"", u"word", u" ", u"\n"]
+
+    def test_random_sources(self):
+        rnd = random.Random(0)
+        for i in xrange(500):
+            source = u"".join(rnd.choice(self.FRAGMENTS) for j in xrange(rnd.randint(0, 40)))
+            expected = tokenize(source)
+
+            # the tokens cover the source without gaps
+            self.assertEqual(source, u"".join(value for type, offset, value in expected))
+            offset = 0
+            for type, token_offset, value in expected:
+                self.assertEqual(offset, token_offset)
+                offset += len(value)
+
+            chunk_size = rnd.randint(1, 9)
+            self.assertEqual(expected, tokenize(source, chunk_size=chunk_size), repr(source))
+            self.assertEqual(expected, tokenize(StringIO(source.encode("utf-8")), chunk_size=chunk_size), repr(source))
+
+    def test_offset(self):
+        source = random_bibliography(random.Random(1), 20)
+        expected = tokenize(source)
+
+        # starting at an entry gives the tokens from there on
+        for i, (type, offset, value) in enumerate(expected):
+            if value == u"@":
+                self.assertEqual(expected[i:], tokenize(source, offset, chunk_size=7))
+                self.assertEqual(expected[i:], tokenize(StringIO(source.encode("utf-8")), offset, chunk_size=7))
+
+
+class StreamParseTest(unittest.TestCase):
+    """
+    Parsing a file object in small chunks gives the same model as parsing a
+    string
+    """
+
+    def setUp(self):
+        self._file = File("/tmp/bibliography.bib")
+        self._chunk_size = BibTeXLexer.CHUNK_SIZE
+        BibTeXLexer.CHUNK_SIZE = 5
+
+    def tearDown(self):
+        BibTeXLexer.CHUNK_SIZE = self._chunk_size
+
+    def test_file_object(self):
+        source = random_bibliography(random.Random(2), 50)
+        issue_handler = CollectingIssueHandler()
+        expected = BibTeXParser().parse(source, self._file, issue_handler)
+
+        fd, filename = tempfile.mkstemp(suffix=".bib")
+        try:
+            os.write(fd, source.encode("utf-8"))
+            os.close(fd)
+
+            f = open(filename)
+            try:
+                stream_issue_handler = CollectingIssueHandler()
+                document = BibTeXParser().parse(f, self._file, stream_issue_handler)
+            finally:
+                f.close()
+        finally:
+            os.remove(filename)
+
+        self.assertEqual(describe_document(expected), describe_document(document))
+        self.assertEqual(describe_issues(issue_handler.issues), describe_issues(stream_issue_handler.issues))
+
+    def test_iter_entries(self):
+        source = random_bibliography(random.Random(3), 50)
+        parser = BibTeXParser()
+        entries = []
+        for entry in parser.iter_entries(StringIO(source.encode("utf-8")), self._file, CollectingIssueHandler()):
+            # an Entry is yielded when it is complete
+            self.assertTrue(entry.end is not None)
+            entries.append(entry)
+        self.assertEqual(parser.document.entries, entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+"""
+test.test_dircache
+
+Checks that the existence checks answered from the DirectoryListingCache
+agree with the file system and counts the system calls they save
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import common    # makes the latex package importable
+
+from latex.dircache import DirectoryListingCache
+
+
+class DirectoryListingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp(prefix="gedit-latex-test-")
+        for name in ("a.tex", "b.png", "c"):
+            open(os.path.join(self._directory, name), "w").close()
+        os.mkdir(os.path.join(self._directory, "figures"))
+        DirectoryListingCache().clear()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+        DirectoryListingCache().clear()
+
+    def _path(self, *names):
+        return os.path.join(self._directory, *names)
+
+    def _touch_directory(self, seconds):
+        # the mtime may have a coarse resolution, so make sure it changes
+        stat = os.stat(self._directory)
+        os.utime(self._directory, (stat.st_atime, stat.st_mtime + seconds))
+
+    def test_exists(self):
+        check = DirectoryListingCache().check()
+        for name in ("a.tex", "b.png", "c", "figures", "d", "a", "A.tex", "figures/x.png"):
+            self.assertEqual(os.path.exists(self._path(name)), check.exists(self._path(name)), name)
+        self.assertTrue(check.exists(u"/"))
+        self.assertFalse(check.exists(self._path("missing", "a.tex")))
+
+    def test_find(self):
+        check = DirectoryListingCache().check()
+        self.assertEqual(".png", check.find(self._path("b"), ["", ".pdf", ".png"]))
+        self.assertEqual("", check.find(self._path("c"), ["", ".png"]))
+        self.assertEqual(None, check.find(self._path("d"), ["", ".png"]))
+
+    def test_relative_path(self):
+        cwd = os.getcwd()
+        os.chdir(self._directory)
+        try:
+            check = DirectoryListingCache().check()
+            self.assertTrue(check.exists("a.tex"))
+            self.assertTrue(check.exists(u"./figures"))
+            self.assertFalse(check.exists("figures/a.tex"))
+        finally:
+            os.chdir(cwd)
+
+    def test_changed_directory(self):
+        check = DirectoryListingCache().check()
+        self.assertFalse(check.exists(self._path("new.tex")))
+
+        open(self._path("new.tex"), "w").close()
+        os.remove(self._path("a.tex"))
+        self._touch_directory(10)
+
+        # an ExistenceCheck keeps the state it has seen first
+        self.assertFalse(check.exists(self._path("new.tex")))
+
+        # a new one reads the changed directory again
+        check = DirectoryListingCache().check()
+        self.assertTrue(check.exists(self._path("new.tex")))
+        self.assertFalse(check.exists(self._path("a.tex")))
+        self.assertEqual(2, check.syscalls)
+
+    def test_system_calls(self):
+        check = DirectoryListingCache().check()
+        for i in xrange(10):
+            check.exists(self._path("a.tex"))
+            check.find(self._path("b"), ["", ".pdf", ".png"])
+
+        # one stat and one listdir
+        self.assertEqual(40, check.queries)
+        self.assertEqual(2, check.syscalls)
+        self.assertEqual(38, check.saved)
+
+        # the unchanged directory is only stat'ed
+        check = DirectoryListingCache().check()
+        self.assertTrue(check.exists(self._path("a.tex")))
+        self.assertEqual(1, check.syscalls)
+
+        # a missing directory is not listed
+        check = DirectoryListingCache().check()
+        self.assertFalse(check.exists(self._path("missing", "a.tex")))
+        self.assertEqual(1, check.syscalls)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
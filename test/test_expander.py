@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+test.test_expander
+
+Checks that expanding a master never changes the models of the
+LaTeXDocumentCache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from common import setup_resources
+
+from latex.file import File
+from latex.issues import CollectingIssueHandler
+from latex.latex.parser import LaTeXParser, Node
+from latex.latex.cache import LaTeXDocumentCache, encode_document
+from latex.latex.expander import LaTeXReferenceExpander
+
+
+def describe(node):
+    description = [(node.type, getattr(node, "start", None), getattr(node, "end", None),
+                    node.value.uri if node.type == Node.DOCUMENT else node.value)]
+    for child in node:
+        description += describe(child)
+    return description
+
+
+class ExpanderTest(unittest.TestCase):
+
+    FILES = {"main.tex" : "\\documentclass{article}\n\\begin{document}\n\\input{a}\n\\section{Main}\n\\end{document}\n",
+             "a.tex" : "\\section{A}\n\\emph{\\input{b}}\n",
+             "b.tex" : "\\section{B}\\label{b}\n",
+             "cycle.tex" : "\\section{C}\\input{main}\n"}
+
+    def setUp(self):
+        setup_resources()
+        self._directory = tempfile.mkdtemp(prefix="gedit-latex-test-")
+        for name, content in self.FILES.iteritems():
+            f = open(os.path.join(self._directory, name), "w")
+            f.write(content)
+            f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _file(self, name):
+        return File(os.path.join(self._directory, name))
+
+    def _parse(self, name):
+        file = self._file(name)
+        return LaTeXParser().parse(self.FILES[name].decode("utf-8"), file, CollectingIssueHandler())
+
+    def _cached(self, name):
+        return LaTeXDocumentCache().get_document(self._file(name), "UTF-8", CollectingIssueHandler())
+
+    def test_cached_models_are_not_changed(self):
+        master = self._cached("main.tex")
+        snapshots = dict([(name, encode_document(self._cached(name), [])) for name in ("main.tex", "a.tex", "b.tex")])
+
+        expanded = LaTeXReferenceExpander().expand(master, self._file("main.tex"), CollectingIssueHandler(),
+                                                   "UTF-8", cached=True)
+
+        self.assertFalse(expanded is master)
+        for name, snapshot in snapshots.iteritems():
+            self.assertEqual(snapshot, encode_document(self._cached(name), []), name)
+
+        # the expansion is the same as the one of a private model
+        private = self._parse("main.tex")
+        LaTeXReferenceExpander().expand(private, self._file("main.tex"), CollectingIssueHandler(), "UTF-8")
+        self.assertEqual(describe(private), describe(expanded))
+
+        # the nested child is attached to a copy of the cached one
+        self.assertTrue(self._file("b.tex").uri in [t[3] for t in describe(expanded)])
+
+    def test_override_is_expanded_in_place(self):
+        child = self._parse("a.tex")
+        expanded = LaTeXReferenceExpander().expand(self._cached("main.tex"), self._file("main.tex"),
+                                                   CollectingIssueHandler(), "UTF-8",
+                                                   overrides={self._file("a.tex").uri : child}, cached=True)
+
+        documents = []
+        inputs = []
+        def collect(node):
+            for n in node:
+                if n.type == Node.DOCUMENT:
+                    documents.append(n)
+                elif n.type == Node.COMMAND and n.value == "input" and n.file == self._file("a.tex"):
+                    inputs.append(n)
+                collect(n)
+        collect(expanded)
+
+        # the override is attached itself and its \input is expanded
+        self.assertTrue(any([document is child for document in documents]))
+        self.assertEqual(1, len(inputs))
+        self.assertEqual([Node.MANDATORY_ARGUMENT, Node.DOCUMENT], [n.type for n in inputs[0]])
+
+    def test_expanded_model_is_expanded_into_a_copy(self):
+        # like the reparsed model of an edited master (see LaTeXAnalysis)
+        master = self._parse("main.tex")
+        LaTeXReferenceExpander().expand(master, self._file("main.tex"), CollectingIssueHandler(), "UTF-8")
+        before = describe(master)
+
+        expanded = LaTeXReferenceExpander().expand(master, self._file("main.tex"), CollectingIssueHandler(),
+                                                   "UTF-8", cached=True)
+
+        self.assertFalse(expanded is master)
+        self.assertEqual(before, describe(master))
+        self.assertEqual(before, describe(expanded))
+
+    def test_cycle(self):
+        issue_handler = CollectingIssueHandler()
+        master = self._parse("main.tex")
+        LaTeXReferenceExpander().expand(master, self._file("main.tex"), issue_handler, "UTF-8",
+                                        overrides={self._file("a.tex").uri : self._parse("cycle.tex")})
+        self.assertEqual(1, len(issue_handler.issues))
+        self.assertTrue("Cyclic reference" in issue_handler.issues[0].message)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
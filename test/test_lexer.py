@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+test.test_lexer
+
+Compares the token stream of latex.lexer.Lexer with the per-character state
+machine it replaced
+"""
+
+import re
+import random
+import unittest
+
+from common import CORPUS, read
+
+import reference_lexer
+from latex.latex.lexer import Lexer, Token
+
+
+def tokenize(lexer_class, source, **kwargs):
+    return [(token.type, token.offset, token.value) for token in lexer_class(source, **kwargs)]
+
+
+def normalize(tokens):
+    """
+    Mask the known defects of the reference lexer: it reports offset 0 for
+    the tokens of a closing \\end{verbatim} and cuts the VERBATIM value at a
+    wrong position. Only the types and values of those tokens and the offset
+    of the VERBATIM token are compared.
+    """
+    normalized = []
+    i = 0
+    while i < len(tokens):
+        type, offset, value = tokens[i]
+        if type == Token.VERBATIM and i + 4 < len(tokens) and tokens[i + 1][0] == Token.COMMAND \
+                and tokens[i + 1][2] == "end" and tokens[i + 1][1] in (0, offset + len(value)):
+            normalized.append((type, offset, None))
+            normalized += [(t[0], None, t[2]) for t in tokens[i + 1:i + 5]]
+            i += 5
+        else:
+            normalized.append(tokens[i])
+            i += 1
+    return normalized
+
+
+class LexerEquivalenceTest(unittest.TestCase):
+
+    # the options the parser and the completion use
+    OPTIONS = [{}, {"skipWs": False, "skipComment": False}, {"skipComment": True}]
+
+    # fragments random documents are made of
+    FRAGMENTS = [u"\\", u"%", u"{", u"}", u"[", u"]", u"&", u"$", u"#", u"_", u" ", u"\n", u"\t",
+                 u"a", u"b", u"verb", u"url", u"begin", u"end", u"verbatim", u"lstlisting",
+                 u"\\begin{verbatim}", u"\\end{verbatim}", u"|", u"*", u"\xa0", u"\u2003", u"x",
+                 u"TODO: y", u"\\begin", u"\\url{", u"\\verb|"]
+
+    # the reference lexer misses a closing tag directly preceded by a backslash
+    _MISSED_END = re.compile(r"\\(e|en|end|end\{[a-z*]*)?\\end\{")
+
+    def assertEquivalent(self, source, **kwargs):
+        expected = normalize(tokenize(reference_lexer.Lexer, source, **kwargs))
+        actual = normalize(tokenize(Lexer, source, **kwargs))
+        self.assertEqual(expected, actual, "%r %s" % (source, kwargs))
+
+    def test_corpus(self):
+        for filename in CORPUS:
+            source = read(filename)
+            for options in self.OPTIONS:
+                self.assertEquivalent(source, **options)
+
+    def test_random(self):
+        rnd = random.Random(0)
+        for i in xrange(5000):
+            source = u"".join(rnd.choice(self.FRAGMENTS) for j in xrange(rnd.randint(0, 25)))
+            if self._MISSED_END.search(source):
+                continue
+            if rnd.random() < 0.3:
+                source = source.encode("utf-8")
+            for options in self.OPTIONS:
+                self.assertEquivalent(source, **options)
+
+
+class LexerTest(unittest.TestCase):
+
+    def test_verbatim_offsets(self):
+        source = u"a\\begin{verbatim}x{y}\\end{verbatim}b"
+        tokens = tokenize(Lexer, source)
+        verbatim = [t for t in tokens if t[0] == Token.VERBATIM][0]
+        self.assertEqual(source.index(u"x"), verbatim[1])
+        self.assertEqual(u"x{y}", verbatim[2])
+
+        end = tokens[tokens.index(verbatim) + 1]
+        self.assertEqual((Token.COMMAND, source.index(u"\\end"), u"end"), end)
+
+    def test_end_after_backslash(self):
+        tokens = tokenize(Lexer, u"\\begin{verbatim}\\\\end{verbatim}")
+        self.assertEqual([Token.COMMAND, Token.BEGIN_CURLY, Token.TEXT, Token.END_CURLY, Token.VERBATIM,
+                          Token.COMMAND, Token.BEGIN_CURLY, Token.TEXT, Token.END_CURLY],
+                         [t[0] for t in tokens])
+
+    def test_offsets_point_at_tokens(self):
+        for filename in CORPUS:
+            source = read(filename)
+            for type, offset, value in tokenize(Lexer, source, skipWs=False, skipComment=False):
+                if type == Token.COMMAND:
+                    self.assertEqual(u"\\" + value, source[offset:offset + len(value) + 1])
+                elif type in (Token.TEXT, Token.VERBATIM):
+                    self.assertEqual(value, source[offset:offset + len(value)])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+"""
+test.test_offsetmap
+
+Compares the lookup of outline.OutlineOffsetMap with a brute force search and
+with the linear scan it replaced
+"""
+
+import random
+import unittest
+
+import common    # makes the latex package importable
+
+from gi.repository import Gtk
+
+from latex.outline import OutlineOffsetMap
+
+
+def random_outline(count, seed=0):
+    """
+    Create the elements of an outline in outline order: open elements (like
+    sections) up to four levels deep and closed ones (like labels) below them
+
+    @return: a list of tuples (start, end, path) and the length of the text
+    """
+    rnd = random.Random(seed)
+    elements = []
+    indices = []
+    offset = 0
+    while len(elements) < count:
+        offset += rnd.randint(5, 200)
+        if rnd.random() < 0.3 or len(indices) == 0:
+            depth = rnd.randint(1, min(len(indices) + 1, 4))
+            indices = indices[:depth - 1] + [len(elements)]
+            elements.append((offset, None, Gtk.TreePath.new_from_indices(indices)))
+        else:
+            end = offset + rnd.randint(1, 30)
+            elements.append((offset, end, Gtk.TreePath.new_from_indices(indices + [len(elements)])))
+            offset = end
+    return elements, offset
+
+
+def extents(elements):
+    """
+    @return: a list of tuples (start, end, path) where the end of an open
+            element is the offset before the next element that is not one of
+            its descendants, or None
+    """
+    result = []
+    for i, (start, end, path) in enumerate(elements):
+        if end is None:
+            depth = path.get_depth()
+            for s, e, p in elements[i + 1:]:
+                if p.get_depth() <= depth or p.get_indices()[:depth] != path.get_indices():
+                    end = s - 1
+                    break
+        result.append((start, end, path))
+    return result
+
+
+def brute_force_lookup(extents, offset):
+    """
+    @param extents: the result of extents()
+    @return: the path of the innermost element containing the offset or None
+    """
+    found = None
+    for start, end, path in extents:
+        if start <= offset and (end is None or offset <= end):
+            if found is None or start >= found[0]:
+                found = (start, path)
+    if found is None:
+        return None
+    return found[1]
+
+
+def reference_lookup(offsets, offset):
+    """
+    The lookup OutlineOffsetMap used before, on a map { start -> path }
+    """
+    # sort offsets
+    sorted_offsets = offsets.keys()
+    sorted_offsets.sort()
+
+    # find nearest offset
+    nearestOffset = None
+    for o in sorted_offsets:
+        if o > offset:
+            break
+        nearestOffset = o
+
+    if not nearestOffset:
+        raise KeyError
+
+    return offsets[nearestOffset]
+
+
+def lookup(offset_map, offset):
+    try:
+        return offset_map.lookup(offset)
+    except KeyError:
+        return None
+
+
+class OutlineOffsetMapTest(unittest.TestCase):
+
+    def _create_map(self, elements, with_ends=True):
+        offset_map = OutlineOffsetMap()
+        for start, end, path in elements:
+            if with_ends:
+                offset_map.put(start, path, end)
+            else:
+                offset_map.put(start, path)
+        return offset_map
+
+    def test_brute_force(self):
+        for seed in xrange(5):
+            elements, length = random_outline(300, seed)
+            offset_map = self._create_map(elements)
+            element_extents = extents(elements)
+            for offset in xrange(0, length + 50, 3):
+                self.assertEqual(brute_force_lookup(element_extents, offset), lookup(offset_map, offset), offset)
+
+    def test_without_ends(self):
+        # elements without an end offset are found like before
+        elements, length = random_outline(300)
+        offset_map = self._create_map(elements, with_ends=False)
+        offsets = dict([(start, path) for start, end, path in elements])
+        for offset in xrange(1, length + 50, 3):
+            try:
+                expected = reference_lookup(offsets, offset)
+            except KeyError:
+                expected = None
+            self.assertEqual(expected, lookup(offset_map, offset), offset)
+
+    def test_put_after_lookup(self):
+        offset_map = OutlineOffsetMap()
+        offset_map.put(10, Gtk.TreePath.new_from_indices([0]))
+        self.assertEqual(None, lookup(offset_map, 5))
+
+        offset_map.put(2, Gtk.TreePath.new_from_indices([1]), 6)
+        self.assertEqual([1], offset_map.lookup(5).get_indices())
+        self.assertEqual(2, len(offset_map))
+
+        offset_map.clear()
+        self.assertEqual(None, lookup(offset_map, 12))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
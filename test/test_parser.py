@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+"""
+test.test_parser
+
+Compares the document model of latex.parser with the one it replaced and
+checks the memory related properties of the nodes
+"""
+
+import random
+import unittest
+from weakref import ref
+
+from common import CORPUS, read
+
+import reference_parser
+from latex.file import File
+from latex.editor import EditedRange
+from latex.issues import CollectingIssueHandler
+from latex.latex import parser
+from latex.latex.parser import LaTeXParser, Node, LocalizedNode, Document
+
+
+def parse(parser_class, source, file=None):
+    issue_handler = CollectingIssueHandler()
+    document = parser_class().parse(source, file, issue_handler)
+    return document, [(issue.message, issue.start, issue.end, issue.severity) for issue in issue_handler.issues]
+
+
+def outcome(module, source, file):
+    """
+    @return: the result of parse() or None if the parser gave up
+    """
+    try:
+        return parse(module.LaTeXParser, source, file)
+    except module.FatalParseException:
+        return None
+
+
+def is_master(document):
+    """
+    @return: Document.is_master or None if it fails on a malformed \\begin
+    """
+    try:
+        return document.is_master
+    except IndexError:
+        return None
+
+
+def describe(node, parent=None):
+    """
+    @return: a list of tuples of everything the API tells about a tree, in
+            document order
+    """
+    description = [(node.type, node.value, getattr(node, "start", None), getattr(node, "end", None),
+                    getattr(node, "lastEnd", None), node.innerText, node.innerMarkup, str(node),
+                    len(node.filter(Node.TEXT)), node.parent is parent)]
+    for child in node:
+        description += describe(child, node)
+    return description
+
+
+class NodeModelEquivalenceTest(unittest.TestCase):
+
+    # fragments random documents are made of (the reference lexer has defects
+    # with verbatim environments, see test_lexer)
+    FRAGMENTS = [u"\\section", u"\\label", u"\\begin", u"\\end", u"\\emph", u"\\\\", u"\\ ", u"{", u"}",
+                 u"[", u"]", u"%", u"\n", u" ", u"$", u"&", u"word", u"figure", u"document"]
+
+    def assertEquivalent(self, source):
+        file = File("/tmp/document.tex")
+        expected = outcome(reference_parser, source, file)
+        actual = outcome(parser, source, file)
+        if expected is None or actual is None:
+            self.assertEqual(expected, actual, "%r: FatalParseException" % source)
+        else:
+            self.assertEqual(describe(expected[0]), describe(actual[0]), repr(source))
+            self.assertEqual(expected[1], actual[1], repr(source))
+
+    def test_corpus(self):
+        for filename in CORPUS:
+            self.assertEquivalent(read(filename))
+
+    def test_random(self):
+        rnd = random.Random(0)
+        for i in xrange(2000):
+            self.assertEquivalent(u"".join(rnd.choice(self.FRAGMENTS) for j in xrange(rnd.randint(0, 40))))
+
+
+class ReparseTest(unittest.TestCase):
+    """
+    Compares the model updated by LaTeXParser.reparse after random edits with
+    the one of a full parse
+    """
+
+    FRAGMENTS = NodeModelEquivalenceTest.FRAGMENTS + [u"\\input{x}", u"\\begin{document}", u"\\end{document}",
+                                                      u"\\begin{verbatim}", u"\\end{verbatim}", u"\\verb|x|"]
+
+    def _random_source(self, rnd, count):
+        return u"".join(rnd.choice(self.FRAGMENTS) for j in xrange(count))
+
+    def test_random_edits(self):
+        rnd = random.Random(0)
+        file = File("/tmp/document.tex")
+        for i in xrange(1000):
+            source = self._random_source(rnd, rnd.randint(0, 40))
+            issue_handler = CollectingIssueHandler()
+            try:
+                document = LaTeXParser().parse(source, file, issue_handler)
+            except parser.FatalParseException:
+                continue
+            # the flag is cached by the Document
+            is_master(document)
+
+            # the edits made while typing are collected in an EditedRange
+            edited = EditedRange()
+            for j in xrange(rnd.randint(1, 3)):
+                start = rnd.randint(0, len(source))
+                old_end = rnd.randint(start, min(len(source), start + 10))
+                inserted = self._random_source(rnd, rnd.randint(0, 3))
+                source = source[:start] + inserted + source[old_end:]
+                edited.add(start, old_end, start + len(inserted))
+
+            expected = outcome(parser, source, file)
+            if expected is None:
+                continue
+
+            issues = issue_handler.issues
+            try:
+                LaTeXParser().reparse(source, document, file, issues, edited.start, edited.old_end, edited.new_end)
+            except parser.FatalParseException:
+                self.fail("%r: FatalParseException" % source)
+
+            self.assertEqual(describe(expected[0]), describe(document), repr(source))
+            self.assertEqual(sorted(expected[1]),
+                             sorted([(issue.message, issue.start, issue.end, issue.severity) for issue in issues]),
+                             repr(source))
+            self.assertEqual(is_master(expected[0]), is_master(document), repr(source))
+
+
+class NodeModelTest(unittest.TestCase):
+
+    def test_slots(self):
+        document, issues = parse(LaTeXParser, read(CORPUS[0]))
+        for node in [document, document[0], document[0][0]]:
+            self.assertFalse(hasattr(node, "__dict__"), type(node))
+
+    def test_tree_is_freed_with_its_root(self):
+        document, issues = parse(LaTeXParser, read(CORPUS[0]))
+        leaf = document
+        while len(leaf):
+            leaf = leaf[-1]
+        leaf_ref = ref(leaf)
+        del leaf
+
+        # no garbage collection, the tree has no cycles
+        del document
+        self.assertEqual(None, leaf_ref())
+
+    def test_parent(self):
+        document = Document(None)
+        command = LocalizedNode(Node.COMMAND, 0, 4, "foo")
+        document.append(command)
+        self.assertTrue(command.parent is document)
+
+        command.parent = None
+        self.assertEqual(None, command.parent)
+
+    def test_destroy_keeps_expanded_documents(self):
+        child = Document(None)
+        child.append(LocalizedNode(Node.TEXT, 0, 1, "x"))
+
+        command = LocalizedNode(Node.COMMAND, 0, 6, "input")
+        command.append(child)
+        command.destroy()
+
+        self.assertEqual(0, len(command))
+        self.assertEqual(1, len(child))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
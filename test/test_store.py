@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+"""
+test.test_store
+
+Checks the records of the LaTeXDocumentStore and the size of its directory
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from common import CORPUS, read
+
+from latex.file import File
+from latex.issues import CollectingIssueHandler
+from latex.latex.parser import LaTeXParser
+from latex.latex.cache import LaTeXDocumentStore, encode_document
+
+
+class LaTeXDocumentStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp(prefix="gedit-latex-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def _save(self, store, filename):
+        content = read(filename).encode("utf-8")
+        file = File(filename)
+        issue_handler = CollectingIssueHandler()
+        document = LaTeXParser().parse(content.decode("utf-8"), file, issue_handler)
+        store.save(file, "UTF-8", len(content), 1, content, document, issue_handler.issues)
+        return file, len(content), encode_document(document, issue_handler.issues)
+
+    def _directory_size(self):
+        return sum([os.path.getsize(os.path.join(self._directory, name)) for name in os.listdir(self._directory)])
+
+    def test_load(self):
+        store = LaTeXDocumentStore(self._directory)
+        file, size, encoded = self._save(store, CORPUS[0])
+
+        document, issues = LaTeXDocumentStore(self._directory).load(file, "UTF-8", size, 1)
+        self.assertEqual(encoded, encode_document(document, issues))
+
+        self.assertEqual(None, store.load(file, "ISO-8859-1", size, 1))
+        self.assertEqual(None, store.load(file, "UTF-8", size, 2))
+
+    def test_size(self):
+        store = LaTeXDocumentStore(self._directory)
+        for filename in CORPUS:
+            self._save(store, filename)
+        self._save(store, CORPUS[0])
+        self.assertEqual(self._directory_size(), store._size)
+        self.assertEqual(self._directory_size(), LaTeXDocumentStore(self._directory)._size)
+
+        # the least recently used records are removed
+        store.MAX_SIZE = self._directory_size() - 1
+        self._save(store, CORPUS[1])
+        self.assertTrue(self._directory_size() <= store.MAX_SIZE)
+        self.assertEqual(self._directory_size(), store._size)
+
+    def test_stale_temporary_files(self):
+        # written by this process and by one that is gone
+        names = ["0.bin.%s.1.tmp" % os.getpid(), "0.bin.999999999.1.tmp", "0.bin.x.tmp"]
+        for name in names:
+            open(os.path.join(self._directory, name), "w").close()
+
+        LaTeXDocumentStore(self._directory)
+        self.assertEqual(names[:1], os.listdir(self._directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
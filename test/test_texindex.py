@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+
+"""
+test.test_texindex
+
+Checks that the TeXFileIndex forgets the files removed after the ls-R
+database has been written and reads a changed database again
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import common    # makes the latex package importable
+
+from latex.latex.texindex import TeXFileIndex
+
+
+class TeXFileIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._root = tempfile.mkdtemp()
+        self._texmf = os.path.join(self._root, "texmf")
+        os.makedirs(os.path.join(self._texmf, "tex", "latex", "gedittest"))
+        os.makedirs(os.path.join(self._texmf, "bibtex", "bst", "gedittest"))
+        for name in ["tex/latex/gedittest/gedittestone.sty",
+                     "tex/latex/gedittest/gedittesttwo.sty",
+                     "bibtex/bst/gedittest/gedittest.bst"]:
+            self._touch(name)
+        self._write_database()
+
+    def tearDown(self):
+        shutil.rmtree(self._root)
+
+    def _touch(self, name):
+        open(os.path.join(self._texmf, name), "w").close()
+
+    def _write_database(self, mtime=None):
+        """
+        Write an ls-R database listing the files like mktexlsr does
+        """
+        database = os.path.join(self._texmf, "ls-R")
+        f = open(database, "w")
+        try:
+            f.write("% ls-R -- filename database for kpathsea; do not change this line.\n")
+            for directory, dirnames, filenames in sorted(os.walk(self._texmf)):
+                f.write("./%s:\n" % os.path.relpath(directory, self._texmf))
+                for name in sorted(dirnames + filenames):
+                    if name != "ls-R":
+                        f.write("%s\n" % name)
+                f.write("\n")
+        finally:
+            f.close()
+        if mtime is not None:
+            os.utime(database, (mtime, mtime))
+
+    def _index(self):
+        return TeXFileIndex([self._texmf], os.path.join(self._root, "index"))
+
+    def test_listed_files_exist(self):
+        index = self._index()
+        self.assertTrue(index.available)
+        self.assertTrue(index.exists("gedittestone.sty"))
+        self.assertTrue(index.exists("gedittest.bst"))
+        self.assertFalse(index.exists("gedittestthree.sty"))
+
+    def test_removed_file_is_not_found(self):
+        index = self._index()
+        self.assertTrue(index.exists("gedittesttwo.sty"))
+
+        # ls-R still lists the file
+        os.remove(os.path.join(self._texmf, "tex", "latex", "gedittest", "gedittesttwo.sty"))
+
+        self.assertFalse(index.exists("gedittesttwo.sty"))
+        names = [os.path.basename(path) for path in index.find("/tex/", ".sty")]
+        self.assertEqual(["gedittestone.sty"], names)
+
+    def test_changed_database_is_read_again(self):
+        index = self._index()
+        index.CHECK_INTERVAL = 0
+        self.assertFalse(index.exists("gedittestthree.sty"))
+
+        self._touch("tex/latex/gedittest/gedittestthree.sty")
+        self._write_database(mtime=os.stat(os.path.join(self._texmf, "ls-R")).st_mtime + 10)
+
+        self.assertTrue(index.exists("gedittestthree.sty"))
+        names = sorted(os.path.basename(path) for path in index.find("/tex/", ".sty"))
+        self.assertEqual(["gedittestone.sty", "gedittestthree.sty", "gedittesttwo.sty"], names)
+
+    def test_stored_index_is_used(self):
+        self._index().exists("gedittestone.sty")
+
+        # a second index reads the stored one
+        index = self._index()
+        self.assertTrue(index.exists("gedittestone.sty"))
+        self.assertFalse(index.exists("gedittestthree.sty"))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et:
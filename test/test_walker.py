@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# This file is part of the Gedit LaTeX Plugin
+#
+# Copyright (C) 2010 Michael Zeising
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public Licence as published by the Free Software
+# Foundation; either version 2 of the Licence, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public Licence for more
+# details.
+#
+# You should have received a copy of the GNU General Public Licence along with
+# this program; if not, write to the Free Software Foundation, Inc., 51 Franklin
+# Street, Fifth Floor, Boston, MA  02110-1301, USA
+
+
+"""
+test.test_walker
+
+Compares the outline and the issues found in one walk through a document model
+(see latex.walker) with the separate outline generator and validator it
+replaced
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from common import TEST_DIR, setup_resources, read
+
+import reference_outline
+import reference_validator
+from latex.file import File
+from latex.issues import Issue, CollectingIssueHandler
+from latex.latex.parser import LaTeXParser, FatalParseException
+from latex.latex.expander import LaTeXReferenceExpander
+from latex.latex.outline import LaTeXOutlineGenerator
+from latex.latex.validator import LaTeXValidator
+from latex.latex.walker import LaTeXWalker
+from latex.latex.model import LanguageModelFactory
+from latex.latex.analyzer import generate_and_validate
+
+
+class Preferences(object):
+    """
+    Fixed DocumentPreferences
+    """
+    def get(self, key):
+        return {"graphics-extensions": ".png,.pdf",
+                "graphics-paths": "",
+                "extra-issue-commands": "TODO,FIXME"}[key]
+
+
+def parse(file, content=None, overrides=None):
+    """
+    @return: the expanded model of a file
+    """
+    if content is None:
+        content = read(file.path)
+    issue_handler = CollectingIssueHandler()
+    document = LaTeXParser().parse(content, file, issue_handler)
+    LaTeXReferenceExpander().expand(document, file, issue_handler, "UTF-8", overrides=overrides)
+    return document
+
+
+def describe_outline(outline):
+    def describe_node(node, depth):
+        description = [(depth, node.type, node.value, node.start, node.end, node.foreign,
+                        node.file.path if node.file else None)]
+        for child in node:
+            description += describe_node(child, depth + 1)
+        return description
+
+    return (describe_node(outline.rootNode, 0),
+            [(label.value, label.start, label.foreign) for label in outline.labels],
+            [package.value for package in outline.packages],
+            [file.path for file in outline.bibliographies],
+            outline.colors,
+            [(command.value, command.numOfArgs, command.oldcmd) for command in outline.newcommands],
+            [environment.value for environment in outline.newenvironments])
+
+
+def describe_issues(issue_handler):
+    return sorted([(issue.message, issue.start, issue.end, issue.file.path if issue.file else None, issue.severity)
+                   for issue in issue_handler.issues])
+
+
+def reference_master(document):
+    issue_handler = CollectingIssueHandler()
+    outline = reference_outline.LaTeXOutlineGenerator().generate(document, issue_handler)
+    reference_validator.LaTeXValidator().validate(document, outline, issue_handler, Preferences())
+    return describe_outline(outline), describe_issues(issue_handler)
+
+
+def walked_master(document):
+    issue_handler = CollectingIssueHandler()
+    outline = generate_and_validate(document, issue_handler, Preferences())
+    return describe_outline(outline), describe_issues(issue_handler)
+
+
+def reference_child(master, local):
+    local_issue_handler = CollectingIssueHandler()
+    local_outline = reference_outline.LaTeXOutlineGenerator().generate(local, local_issue_handler)
+    issue_handler = CollectingIssueHandler()
+    outline = reference_outline.LaTeXOutlineGenerator().generate(master, issue_handler)
+    reference_validator.LaTeXValidator().validate(master, outline, issue_handler, Preferences())
+    return (describe_outline(local_outline), describe_issues(local_issue_handler),
+            describe_outline(outline), describe_issues(issue_handler))
+
+
+def walked_child(master, local):
+    # like LaTeXAnalysis.run
+    local_issue_handler = CollectingIssueHandler()
+    issue_handler = CollectingIssueHandler()
+    local_outline_generator = LaTeXOutlineGenerator()
+    outline_generator = LaTeXOutlineGenerator()
+    validator = LaTeXValidator()
+
+    walker = LaTeXWalker()
+    local_outline_generator.attach(walker, local_issue_handler, local)
+    outline_generator.attach(walker, issue_handler)
+    validator.attach(walker, issue_handler, Preferences())
+    walker.walk(master)
+
+    outline = outline_generator.finish()
+    validator.finish(outline)
+    local_outline = local_outline_generator.finish()
+    return (describe_outline(local_outline), describe_issues(local_issue_handler),
+            describe_outline(outline), describe_issues(issue_handler))
+
+
+class WalkerEquivalenceTest(unittest.TestCase):
+
+    # fragments random masters are made of (the reference validator fails on
+    # a \] closing nothing, so there is none)
+    FRAGMENTS = ["\\section{S}", "\\subsection{T}", "\\label{a}", "\\label{b}", "\\ref{a}", "\\ref{c}",
+                 "\\input{x}", "\\include{y}", "{", "}", "\\begin{figure}", "\\end{figure}",
+                 "\\begin{tabular}{ll}", "\\end{tabular}", "\\TODO{z}", "\\[", "\\[ y \\]", "text ", "\n",
+                 "\\newcommand{\\foo}[1]{#1}", "\\usepackage{amsmath}", "\\emph{"]
+
+    FILES = {"x.tex" : "\\section{X}\\label{x}\\ref{a}\n",
+             "y.tex" : "\\subsection{Y}{\\label{y}}\\input{x}\n"}
+
+    def setUp(self):
+        setup_resources()
+        self._directory = tempfile.mkdtemp(prefix="gedit-latex-test-")
+        for name, content in self.FILES.iteritems():
+            f = open(os.path.join(self._directory, name), "w")
+            f.write(content)
+            f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def test_corpus(self):
+        master_file = File(os.path.join(TEST_DIR, "article.tex"))
+        document = parse(master_file)
+        self.assertEqual(reference_master(document), walked_master(document))
+
+    def test_corpus_child(self):
+        master_file = File(os.path.join(TEST_DIR, "article.tex"))
+        child_file = File(os.path.join(TEST_DIR, "chap2.tex"))
+        local = LaTeXParser().parse(read(child_file.path), child_file, CollectingIssueHandler())
+        master = parse(master_file, overrides={child_file.uri : local})
+        self.assertEqual(reference_child(master, local), walked_child(master, local))
+
+    def test_random(self):
+        rnd = random.Random(0)
+        master_file = File(os.path.join(self._directory, "main.tex"))
+        for i in xrange(300):
+            source = u"".join(rnd.choice(self.FRAGMENTS) for j in xrange(rnd.randint(0, 30)))
+            try:
+                document = parse(master_file, source)
+            except FatalParseException:
+                continue
+            self.assertEqual(reference_master(document), walked_master(document), repr(source))
+
+    def test_foreign(self):
+        # only what lies below an \input and below its following siblings is
+        # foreign, not the siblings themselves
+        source = u"\\section{A}\\input{x}\\section{B}\\label{b}{\\input{y}\\label{c}}\\label{d}\\subsection{C}\\label{e}"
+        document = parse(File(os.path.join(self._directory, "main.tex")), source)
+
+        outline, issues = walked_master(document)
+        self.assertEqual((outline, issues), reference_master(document))
+
+        labels = outline[1]
+        self.assertEqual([("b", False), ("c", True), ("d", False), ("e", False)],
+                         [(value, foreign) for value, start, foreign in labels if value in ("b", "c", "d", "e")])
+        self.assertEqual(["X", "X", "Y"], sorted([node[2] for node in outline[0] if node[5]]))
+
+
+class ValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        setup_resources()
+
+    def _validate(self, source):
+        document = LaTeXParser().parse(source, File("/tmp/document.tex"), CollectingIssueHandler())
+        issue_handler = CollectingIssueHandler()
+        generate_and_validate(document, issue_handler, Preferences())
+        return [issue.message for issue in issue_handler.issues]
+
+    def test_registered_command(self):
+        def on_foo(command, issue_handler):
+            issue_handler.issue(Issue("foo: %s" % command.text, command.node.start, command.node.end,
+                                      command.node.file, Issue.SEVERITY_WARNING))
+
+        LaTeXValidator.register_command("foo", on_foo)
+        try:
+            self.assertEqual([u"foo: x"], self._validate(u"\\foo{x}"))
+        finally:
+            LaTeXValidator.unregister_command("foo")
+        self.assertEqual([], self._validate(u"\\foo{x}"))
+
+    def test_wrapped_ref_command(self):
+        # the outline passes the \newcommand definitions to the completion,
+        # which updates the shared LanguageModel
+        language_model = LanguageModelFactory().get_language_model()
+        outline = LaTeXOutlineGenerator().generate(
+                LaTeXParser().parse(u"\\newcommand{\\myref}[1]{\\ref{#1}}", None, CollectingIssueHandler()),
+                CollectingIssueHandler())
+        ref_commands = language_model.ref_commands
+        language_model.set_newcommands(outline.newcommands)
+        try:
+            self.assertTrue("myref" in language_model.ref_commands)
+            self.assertFalse("myref" in ref_commands)
+            self.assertEqual("ref", language_model.command_aliases["myref"])
+
+            messages = self._validate(u"\\label{a}\\myref{a}\\myref{b}")
+            self.assertEqual(1, len(messages))
+            self.assertTrue("b" in messages[0])
+        finally:
+            language_model.set_newcommands([])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# ex:ts=4:et: